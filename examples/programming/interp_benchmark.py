@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+"""
+benchmark of the Larch interpreter for repeated statements, with and
+without the parse cache and compiled arithmetic expressions.
+"""
+from time import time
+from larch import Interpreter
+
+NREPEAT = 2000
+STATEMENTS = {'assign':  'y = 1',
+              'scalar':  'y = 3.0*a*a + 2*a - 7/b',
+              'array':   'y = sin(x)*exp(-x/4.0) + a*x**2',
+              'mixed':   'y = sum(sqrt(x**2 + a) - 1)',
+              'procedure': 'y = f(a, b)',
+              }
+
+def timeit(session, text):
+    t0 = time()
+    for i in range(NREPEAT):
+        session.eval(text)
+    return 1.e6*(time()-t0)/NREPEAT
+
+def make_session(cache=True, compile_fast=True):
+    session = Interpreter()
+    session.parse_cache_size = 1024 if cache else 0
+    session.compile_fast = compile_fast
+    session.eval('a = 1.5\nb = 2.5\nx = linspace(0, 10, 101)')
+    session.eval('def f(a, b):\n    return a*b + 1\n#end def')
+    return session
+
+sessions = {'uncached': make_session(cache=False, compile_fast=False),
+            'cached': make_session(cache=True, compile_fast=False),
+            'compiled': make_session(cache=True, compile_fast=True)}
+
+print(f"time per statement (microseconds), {NREPEAT} repeats")
+print(f"{'statement':>10s} " + ' '.join([f'{k:>10s}' for k in sessions]))
+for name, text in STATEMENTS.items():
+    times = [timeit(session, text) for session in sessions.values()]
+    print(f"{name:>10s} " + ' '.join([f'{t:10.1f}' for t in times]))
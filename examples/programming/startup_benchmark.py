@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+benchmark of Larch startup times, each measured in a new Python process,
+with core modules loaded when first used (lazy) and loaded at startup.
+"""
+import os
+import sys
+import subprocess
+
+NREPEAT = 3
+DATAFILE = os.path.abspath(os.path.join('..', 'xafsdata', 'cu_rt01.xmu'))
+
+SETUP = """
+from time import time
+t0 = time()
+import larch
+"""
+
+INTERP = """
+from larch import builtins
+builtins.use_lazy_modules = {lazy}
+session = larch.Interpreter()
+"""
+
+TASKS = {'import larch': '',
+         'Interpreter()': INTERP,
+         'pre_edge + autobk': INTERP + f"""
+session.eval("dat = read_ascii('{DATAFILE}', labels='energy mu i0')")
+session.eval("pre_edge(dat)")
+session.eval("autobk(dat, rbkg=1.0, kweight=2)")
+"""}
+
+def run_task(text, lazy=True):
+    code = SETUP + text.format(lazy=lazy) + "\nprint(time()-t0)"
+    out = subprocess.run([sys.executable, '-c', code], check=True,
+                         capture_output=True, text=True).stdout
+    return float(out.strip().split('\n')[-1])
+
+print(f"startup times (seconds), best of {NREPEAT} runs")
+print(f"{'task':>20s} {'lazy':>8s} {'eager':>8s}")
+for name, text in TASKS.items():
+    times = [min(run_task(text, lazy=lazy) for i in range(NREPEAT))
+             for lazy in (True, False)]
+    print(f"{name:>20s} " + ' '.join([f'{t:8.3f}' for t in times]))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+benchmark of symbol lookup in a tight Larch loop, with and without the
+SymbolTable lookup cache.
+"""
+from time import time
+from larch import Interpreter
+from larch.symboltable import SymbolTable
+
+LOOPS = {'user variables': """
+total = 0
+for i in range(20000):
+    total = total + i*scale
+#endfor
+""",
+         'builtins': """
+total = 0
+for i in range(20000):
+    total = total + sqrt(abs(i)) + pi
+#endfor
+""",
+         'dotted names': """
+for i in range(20000):
+    fcn = _xafs.autobk
+    val = _sys.config.home_dir
+#endfor
+"""}
+
+def timeit(text, use_cache=True):
+    SymbolTable.use_lookup_cache = use_cache
+    session = Interpreter()
+    session.eval('scale = 1.5')
+    t0 = time()
+    session.eval(text)
+    return time()-t0
+
+def time_lookup(name, use_cache=True, nrepeat=100000):
+    SymbolTable.use_lookup_cache = use_cache
+    symtable = Interpreter().symtable
+    t0 = time()
+    for i in range(nrepeat):
+        symtable.get_symbol(name)
+    return 1.e6*(time()-t0)/nrepeat
+
+print(f"{'loop':>16s} {'no cache':>10s} {'cache':>10s}   (seconds)")
+for name, text in LOOPS.items():
+    t_nocache = timeit(text, use_cache=False)
+    t_cache = timeit(text, use_cache=True)
+    print(f"{name:>16s} {t_nocache:10.3f} {t_cache:10.3f}")
+
+print(f"{'get_symbol':>16s} {'no cache':>10s} {'cache':>10s}   (microseconds)")
+for name in ('sqrt', '_xafs.autobk', '_sys.config.home_dir'):
+    t_nocache = time_lookup(name, use_cache=False)
+    t_cache = time_lookup(name, use_cache=True)
+    print(f"{name:>16s} {t_nocache:10.3f} {t_cache:10.3f}")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+benchmark of structure factor calculations for CIF structures:
+CifStructure.calculate_f2() for all HKLs at once versus a loop over
+HKLs and sites, and find_hkls() with and without cached reflections.
+"""
+from time import time
+import numpy as np
+from pymatgen.io.cif import CifParser
+from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+
+from larch.xrd import CifStructure, generate_hkl, d_from_hkl
+from larch.xrd.amcsd import f0, TAU
+
+CIFFILES = ('struct2xas/ZnO_mp-2133.cif', 'struct2xas/ZnO_mp-997630.cif',
+            'structure2feff/tBu3CpRu2H4.cif')
+HKLS = generate_hkl(hmax=8, kmax=8, lmax=8, positive_only=False)
+
+def read_structure(fname, ams_id):
+    cif = CifStructure(ams_id=ams_id)
+    cif.pmg_cstruct = CifParser(fname).get_structures()[0]
+    cif.pmg_pstruct = SpacegroupAnalyzer(cif.pmg_cstruct).get_conventional_standard_structure()
+    return cif
+
+def f2_loop(cif, hkls):
+    "F*F' for one HKL and one site at a time, without resonant corrections"
+    sites = cif.get_sites()
+    unitcell = cif.get_unitcell()
+    sq = TAU/d_from_hkl(hkls, **unitcell)/(2*TAU)
+    f0vals = {elem: f0(elem, sq) for elem in sites}
+    f2 = np.zeros(len(hkls))
+    for i, hkl in enumerate(hkls):
+        fsum = 0.
+        for elem, fval in f0vals.items():
+            for occu, fcoord in sites[elem]:
+                fsum += fval[i]*occu*np.exp(1j*TAU*(np.array(fcoord)*hkl).sum())
+        f2[i] = (fsum*fsum.conjugate()).real
+    return f2
+
+print(f"{len(HKLS)} HKLs")
+print(f"{'structure':>32s} {'nsites':>6s} {'loop (s)':>9s} {'array (s)':>9s} "
+      f"{'find_hkls (s)':>13s} {'cached (s)':>10s} {'max rel diff':>12s}")
+for ams_id, fname in enumerate(CIFFILES):
+    cif = read_structure(fname, ams_id)
+    t0 = time()
+    ref = f2_loop(cif, HKLS)
+    t_loop = time() - t0
+    t0 = time()
+    f2 = cif.calculate_f2(HKLS)
+    t_array = time() - t0
+    t0 = time()
+    cif.find_hkls()
+    t_find = time() - t0
+    t0 = time()
+    cif.find_hkls()
+    t_cached = time() - t0
+    diff = (abs(f2 - ref)/ref.max()).max()
+    print(f"{fname:>32s} {len(cif.pmg_pstruct.sites):6d} {t_loop:9.3f} {t_array:9.4f} "
+          f"{t_find:13.3f} {t_cached:10.5f} {diff:12.2e}")
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+"""
+benchmark of calculating the true input count rate (icr) from the output
+count rate for a map of (npix, ndet) values: solve_icr() for all values
+at once versus calc_icr() for one value at a time.
+"""
+from time import time
+import numpy as np
+from larch.xrf.deadtime import calc_icr, solve_icr
+
+NDET = 4
+TAUS = np.array([80, 85, 90, 95])*1.e-9
+
+rng = np.random.default_rng(0)
+print(f"{'npix':>8s} {'calc_icr (s)':>13s} {'solve_icr (s)':>14s} {'speedup':>8s} {'max rel diff':>13s}")
+for npix in (1000, 10000, 100000, 1000000):
+    icr_true = rng.uniform(1.e3, 0.9/TAUS, size=(npix, NDET))
+    ocr = icr_true*np.exp(-icr_true*TAUS)
+
+    t0 = time()
+    icr = solve_icr(ocr, TAUS)
+    t_array = time() - t0
+
+    # time the scalar loop on at most 25000 pixels, and scale up
+    nscalar = min(npix, 25000)
+    t0 = time()
+    icr_scalar = np.array([[calc_icr(ocr[i, j], TAUS[j]) for j in range(NDET)]
+                           for i in range(nscalar)])
+    t_scalar = (time() - t0) * npix/nscalar
+    diff = abs(icr_scalar/icr[:nscalar] - 1).max()
+    print(f"{npix:8d} {t_scalar:13.3f} {t_array:14.4f} {t_scalar/t_array:8.0f} {diff:13.2e}")
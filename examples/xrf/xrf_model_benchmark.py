@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+benchmark of XRF_Model.calc_spectrum, as used at each fit iteration,
+versus number of MCA channels.
+
+For comparison, this also times the pileup as a direct convolution
+and the escape interpolated separately for each component.
+"""
+from time import time
+import numpy as np
+from larch.math import interp
+from larch.xrf import xrf_model
+
+ELEMENTS = ('Si', 'S', 'Cl', 'Ar', 'K', 'Ca', 'Ti', 'V', 'Cr', 'Mn',
+            'Fe', 'Co', 'Ni', 'Cu', 'Zn', 'As', 'Se', 'Br', 'Rb', 'Sr')
+NREPEAT = 20
+
+def make_model():
+    model = xrf_model(xray_energy=20.0, count_time=1, energy_min=1.5, energy_max=19.0)
+    model.set_detector(thickness=0.4, material='Si', noise=0.06)
+    model.add_scatter_peak(name='elastic', center=20.0, amplitude=1e5)
+    model.add_scatter_peak(name='compton', center=19.2, amplitude=1e5, sigmax=1.5)
+    for elem in ELEMENTS:
+        model.add_element(elem)
+    model.add_escape(scale=0.2)
+    model.add_pileup(scale=0.1)
+    return model
+
+def timeit(func, *args):
+    t0 = time()
+    for i in range(NREPEAT):
+        func(*args)
+    return 1.e3*(time()-t0)/NREPEAT
+
+print("per-iteration cost (ms) for %d elements" % len(ELEMENTS))
+print(f"{'nchan':>6s} {'model':>9s} {'amp only':>9s} {'pileup':>9s} {'pileup0':>9s} {'escape':>9s} {'escape0':>9s}")
+for nchan in (1024, 2048, 4096, 8192, 16384):
+    energy = np.linspace(0, 20.0, nchan)
+    model = make_model()
+    model.calc_spectrum(energy)
+    model.fit_in_progress = True
+
+    # change peak shape at each call: profiles are recalculated
+    def new_shape():
+        model.params['peak_tail'].value *= 1.0001
+        model.calc_spectrum(energy)
+    t_model = timeit(new_shape)
+
+    # change only amplitudes: cached profiles are reused
+    def new_amps():
+        model.params['amp_fe'].value *= 1.0001
+        model.calc_spectrum(energy)
+    t_amps = timeit(new_amps)
+
+    total = model.current_model
+    comps = np.array([c for name, c in model.comps.items()
+                      if name not in ('pileup', 'background')])
+    t_pileup = timeit(model.calc_pileup, total)
+    t_pileup0 = timeit(lambda t: np.convolve(t, t, 'full')[:len(t)], total)
+    t_escape = timeit(model.calc_escape, energy, comps)
+    def escape0(comps):
+        for c in comps:
+            model.escape_amp * interp(energy-model.escape_energy, c, energy)
+    t_escape0 = timeit(escape0, comps)
+    print(f"{nchan:6d} {t_model:9.3f} {t_amps:9.3f} {t_pileup:9.3f} {t_pileup0:9.3f} {t_escape:9.3f} {t_escape0:9.3f}")
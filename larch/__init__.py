@@ -6,6 +6,7 @@
 import os
 import sys
 import logging
+import importlib
 import warnings
 warnings.simplefilter('ignore')
 
@@ -21,10 +22,6 @@ if (sys.version_info.major < 3 or sys.version_info.minor < 8):
 
 import numpy
 
-import scipy, scipy.optimize, scipy.special, scipy.stats
-import matplotlib
-import lmfit
-
 # note: for HDF5 File / Filter Plugins to be useful, the
 # hdf5plugin module needs to be imported before h5py
 try:
@@ -39,7 +36,6 @@ except ImportError:
 from .version import __date__, __version__, __release_version__
 from .symboltable import Group, isgroup
 from .larchlib import Make_CallArgs, parse_group_args, isNamedClass, Journal, Entry
-from .fitting import Parameter, isParameter, param_value, ParameterGroup
 
 # from . import builtins
 from .inputText import InputText
@@ -47,3 +43,13 @@ from .interpreter import Interpreter
 from . import larchlib
 from . import utils
 from . import site_config
+
+# names imported from submodules on first use, to keep 'import larch' fast
+_lazy_imports = {'Parameter': 'fitting', 'isParameter': 'fitting',
+                 'param_value': 'fitting', 'ParameterGroup': 'fitting'}
+
+def __getattr__(name):
+    if name in _lazy_imports:
+        mod = importlib.import_module(f'.{_lazy_imports[name]}', __name__)
+        return getattr(mod, name)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
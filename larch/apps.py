@@ -16,9 +16,9 @@ from .site_config import (icondir, uname, install_extras,
 
 from .shell import Shell
 from .xmlrpc_server import larch_server_cli, LarchServer
-from .xafs.feffrunner import feff6l_cli, feff8l_cli
 
 from .version import __date__, make_banner, check_larchversion
+from .utils import show_import_times
 
 HAS_WXPYTHON = False
 try:
@@ -31,11 +31,6 @@ if HAS_WXPYTHON:
     # note: this will be needed for some macOS builds until wxPython 4.2.1 is released.
     if uname == 'darwin':
         wx.PyApp.IsDisplayAvailable = lambda _: True
-    from .wxmap import MapViewer, DTViewer
-    from .wxxas import XASViewer, LARIX_TITLE
-    from .wxlib.xrfdisplay import XRFApp
-    from .wxlib.larchframe import LarchApp
-    from .wxxrd import XRD1DApp, XRD2DViewer
 
 
 def use_mpl_wxagg():
@@ -99,6 +94,7 @@ def run_gse_mapviewer():
     set_locale()
     use_mpl_wxagg()
     install_extras(extras_wxgraph)
+    from .wxmap import MapViewer
     kwargs = make_cli(description="Larch's XRM Map Viewer and Analysis Program",
                       filedesc='XRM Map File (.h5)')
     MapViewer(check_version=True, **kwargs).MainLoop()
@@ -109,6 +105,7 @@ def run_gse_dtcorrect():
     use_mpl_wxagg()
     install_extras(extras_wxgraph)
     install_extras(extras_epics)
+    from .wxmap import DTViewer
     DTViewer().MainLoop()
 
 def run_larix():
@@ -116,6 +113,7 @@ def run_larix():
     set_locale()
     use_mpl_wxagg()
     install_extras(extras_wxgraph)
+    from .wxxas import XASViewer, LARIX_TITLE
     kwargs = make_cli(description=LARIX_TITLE)
     XASViewer(check_version=True, **kwargs).MainLoop()
 
@@ -126,6 +124,7 @@ def run_larch_xrf():
     set_locale()
     use_mpl_wxagg()
     install_extras(extras_wxgraph)
+    from .wxlib.xrfdisplay import XRFApp
     kwargs = make_cli(description="Larch's XRF Viewer and Analysis Program",
                     filedesc='MCA File (.mca)')
     XRFApp(**kwargs).MainLoop()
@@ -143,6 +142,7 @@ def run_larch_xrd1d():
     """XRD Display for 1D patternss"""
     set_locale()
     use_mpl_wxagg()
+    from .wxxrd import XRD1DApp
     XRD1DApp().MainLoop()
 
 def run_xrd2d_viewer():
@@ -150,15 +150,18 @@ def run_xrd2d_viewer():
     set_locale()
     use_mpl_wxagg()
     install_extras(extras_wxgraph)
+    from .wxxrd import XRD2DViewer
     XRD2DViewer().MainLoop()
 
 
 def run_feff6l():
     "run feff6l"
+    from .xafs.feffrunner import feff6l_cli
     feff6l_cli()
 
 def run_feff8l():
     "run feff8l"
+    from .xafs.feffrunner import feff8l_cli
     feff8l_cli()
 
 def run_larch_server():
@@ -200,6 +203,13 @@ def run_larch():
     parser.add_argument("-p", "--port", dest="port", default='4966',
                         help="port number for remote server")
 
+    parser.add_argument("-t", "--threads", dest="nthreads", type=int, default=0,
+                        help="number of threads for remote server, default = 0 (one request at a time)")
+
+    parser.add_argument('--import-time', dest='import_time', nargs='?',
+                        const='larch', default=None, metavar='MODULE',
+                        help='show times to import MODULE [larch] and the modules it imports')
+
     parser.add_argument('scripts', nargs='*',
                         help='larch or python scripts to run on startup')
 
@@ -211,6 +221,10 @@ def run_larch():
             print(vinfo.message)
         return
 
+    if args.import_time is not None:
+        show_import_times(args.import_time)
+        return
+
     with_wx = HAS_WXPYTHON and (not args.nowx)
 
     # create desktop icons
@@ -231,7 +245,8 @@ def run_larch():
         vinfo = check_larchversion()
         if vinfo.update_available:
             print(vinfo.message)
-        server = LarchServer(host='localhost', port=int(args.port))
+        server = LarchServer(host='localhost', port=int(args.port),
+                             nthreads=args.nthreads)
         server.run()
 
     # run wx Larch GUI
@@ -239,6 +254,7 @@ def run_larch():
         set_locale()
         use_mpl_wxagg()
         install_extras(extras_wxgraph)
+        from .wxlib.larchframe import LarchApp
         LarchApp(with_inspection=True).MainLoop()
 
     # run wx Larch CLI
@@ -3,6 +3,7 @@
 
 import sys
 import time
+import importlib.util
 
 from . import utils
 from .utils.show import _larch_builtins as show_builtins
@@ -12,32 +13,31 @@ from .symboltable import Group
 from .version import show_version
 
 from . import math
-from . import io
 from . import fitting
-from . import xray
-from . import xrf
-from . import xafs
-from . import xrd
-from . import xrmmap
-from . import wxlib
 
 from .utils import physical_constants
 
-__core_modules = [math, fitting, io, xray, xrf, xafs, xrd, xrmmap, wxlib]
+# modules imported when first needed, in the order of the search path,
+# with the groups to which they add builtins.  See Interpreter.load_module()
+lazy_modules = [('larch.io', ('_io',)),
+                ('larch.xray', ('_xray',)),
+                ('larch.xrf', ('_xrf',)),
+                ('larch.xafs', ('_xafs',)),
+                ('larch.xrd', ('_xrd',)),
+                ('larch.xrmmap', ('_io',)),
+                ('larch.wxlib', ('_sys.wx', '_plotter', '_xafs')),
+                ('larch.epics', ('_epics',))]
 
-try:
-    from . import epics
-    __core_modules.append(epics)
-except ImportError:
-    pass
+if importlib.util.find_spec('wx') is not None:
+    lazy_modules.extend([('larch.wxlib.plotter', ('_plotter',)),
+                         ('larch.wxmap', ('_plotter',)),
+                         ('larch.wxxas', ()),
+                         ('larch.wxxrd', ())])
 
-if wxlib.HAS_WXPYTHON:
-    try:
-        from .wxlib import plotter
-        from . import wxmap, wxxas, wxxrd
-        __core_modules.extend([plotter, wxmap, wxxas, wxxrd])
-    except:
-        pass
+# set to False to import all modules in lazy_modules at startup
+use_lazy_modules = True
+
+__core_modules = [math, fitting]
 
 # inherit most available symbols from python's __builtins__
 from_builtin = [sym for sym in __builtins__ if not sym.startswith('__')]
@@ -335,18 +335,20 @@ init_funcs = [init_display_group]
 # group/classes to register for save-restore
 init_moddocs = {}
 
-for cmod in __core_modules:
-    if cmod is None:
-        continue
+def module_builtins(cmod):
+    """return group name, docstring, builtins, and initialization function
+    for a Larch core module"""
     cmodname  = getattr(cmod, '_larch_name', cmod.__name__)
     if cmodname.startswith('larch.'):
         cmodname = cmodname.replace('larch.', '_')
+    return (cmodname, getattr(cmod, '__DOC__', None),
+            getattr(cmod, '_larch_builtins', {}),
+            getattr(cmod, '_larch_init', None))
 
-    doc = getattr(cmod, '__DOC__', None)
+for cmod in __core_modules:
+    cmodname, doc, builtins, init_fcn = module_builtins(cmod)
     if doc is not None:
         init_moddocs[cmodname] = doc
-    builtins = getattr(cmod, '_larch_builtins', {})
-    init_fcn = getattr(cmod, '_larch_init', None)
 
     for bkey, bval in builtins.items():
         if bkey not in init_builtins:
@@ -11,12 +11,15 @@ import sys
 import types
 import ast
 import math
+import importlib
 import numpy
 from copy import deepcopy
+from collections import OrderedDict
+from functools import lru_cache
 
 from . import site_config
 from asteval import valid_symbol_name
-from .symboltable import SymbolTable, Group, isgroup
+from .symboltable import SymbolTable, Group, LazyModuleGroup, isgroup
 from .inputText import InputText, BLANK_TEXT
 from .larchlib import (LarchExceptionHolder, ReturnedNone,
                        Procedure, StdWriter)
@@ -62,6 +65,17 @@ OPERATORS = {
     ast.UAdd:   lambda a: +a,
     ast.USub:   lambda a: -a}
 
+# number of parsed statements kept by each Interpreter
+PARSE_CACHE_SIZE = 1024
+
+@lru_cache(maxsize=4096)
+def _valid_symbol_name(name):
+    "cached valid_symbol_name()"
+    return valid_symbol_name(name)
+
+class _FastNodeError(Exception):
+    "error in a compiled node, already added to the interpreter errors"
+
 PYTHON_RESERVED_WORDS = ('and', 'as', 'assert', 'break', 'class',
                          'continue', 'def', 'del', 'elif', 'else',
                          'except', 'exec', 'finally', 'for', 'from',
@@ -160,6 +174,21 @@ class Interpreter:
                 else:
                     setattr(group, fname, fcn)
 
+        # groups for modules that are imported when first needed
+        self.lazy_modules = OrderedDict()
+        for modname, groupnames in builtins.lazy_modules:
+            self.lazy_modules[modname] = False
+            for groupname in groupnames:
+                if groupname in core_groups:
+                    continue
+                core_groups.append(groupname)
+                modules = [mname for mname, gnames in builtins.lazy_modules
+                           if groupname in gnames]
+                self.symtable.set_symbol(groupname,
+                                         value=LazyModuleGroup(groupname,
+                                                               modules,
+                                                               self.load_module))
+
         self.symtable._sys.core_groups = core_groups
         self.symtable._fix_searchGroups(force=True)
 
@@ -176,11 +205,75 @@ class Interpreter:
             group = self.symtable.get_group(groupname)
             group.__doc__ = docstring
 
+        if not builtins.use_lazy_modules:
+            while self.load_module():
+                pass
+
         self.on_try = self.on_tryexcept
         self.on_tryfinally = self.on_tryexcept
         self.node_handlers = dict(((node, getattr(self, "on_%s" % node))
                                    for node in self.supported_nodes))
+        self.parse_cache = OrderedDict()
+        self.parse_cache_size = PARSE_CACHE_SIZE
+        self.compile_fast = True
+
+
+    def load_module(self, modname=None):
+        """import a module from builtins.lazy_modules and add its builtins
+        to the symbol table, doing nothing for a module already loaded.
 
+        Parameters:
+        -----------
+          modname   name of module [None: the first one not yet loaded]
+
+        Returns:
+        ---------
+          True if a module was loaded (or failed to import), else False
+        """
+        from larch import builtins
+        if modname is None:
+            for mname, loaded in self.lazy_modules.items():
+                if not loaded:
+                    modname = mname
+                    break
+        if modname is None or self.lazy_modules.get(modname, True):
+            return False
+        self.lazy_modules[modname] = True
+        try:
+            cmod = importlib.import_module(modname)
+        except ImportError:
+            return True
+
+        cmodname, doc, mbuiltins, init_fcn = builtins.module_builtins(cmod)
+        symtable = self.symtable
+
+        def get_group(groupname):
+            # without looking in modules not yet loaded, as _lookup() would
+            group = symtable
+            for name in groupname.split('.'):
+                group = getattr(group, name, None)
+            return group
+
+        for groupname, entries in mbuiltins.items():
+            group = get_group(groupname)
+            if group is None:
+                group = symtable.set_symbol(groupname,
+                                            value=Group(__name__=groupname))
+                symtable._sys.core_groups.append(groupname)
+            for fname, fcn in list(entries.items()):
+                if callable(fcn):
+                    setattr(group, fname,
+                            Closure(func=fcn, _larch=self, _name=fname))
+                else:
+                    setattr(group, fname, fcn)
+        symtable._fix_searchGroups(force=True)
+
+        if init_fcn is not None:
+            init_fcn(_larch=self)
+        group = get_group(cmodname)
+        if doc is not None and group is not None:
+            group.__doc__ = doc
+        return True
 
     def unimplemented(self, node):
         "unimplemented nodes"
@@ -216,10 +309,19 @@ class Interpreter:
     #  run:    ast -> result
     #  eval:   string statement -> result = run(parse(statement))
     def parse(self, text, fname=None, lineno=-1):
-        """parse statement/expression to Ast representation    """
+        """parse statement/expression to Ast representation
+
+        Parsed statements are kept in an LRU cache of parse_cache_size
+        entries, keyed by text.  With compile_fast=True, arithmetic
+        expressions are also compiled, see compile_node().
+        """
         self.expr  = text
+        cache = self.parse_cache
+        if text in cache:
+            cache.move_to_end(text)
+            return cache[text]
         try:
-            return ast.parse(text)
+            node = ast.parse(text)
         except:
             etype, exc, tb = sys.exc_info()
             if (isinstance(exc, SyntaxError) and
@@ -236,6 +338,90 @@ class Interpreter:
    %s"""  %  (rwords)
             self.raise_exception(None, exc=SyntaxError, msg='Syntax Error',
                                  expr=text, fname=fname, lineno=lineno)
+            return None
+        if self.compile_fast:
+            self.compile_node(node)
+        if self.parse_cache_size > 0:
+            cache[text] = node
+            while len(cache) > self.parse_cache_size:
+                cache.popitem(last=False)
+        return node
+
+    def compile_node(self, node):
+        """compile arithmetic subtrees of constants, names, unary and
+        binary operators, and function calls to Python closures, saved as
+        a 'larch_fast' attribute of each compiled node, and used by run().
+
+        Returns:
+           the closure for node, or None if node cannot be compiled.
+        """
+        fast = None
+        children = [self.compile_node(child)
+                    for child in ast.iter_child_nodes(node)]
+        if isinstance(node, ast.Constant):
+            fast = self._fast_constant(node)
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            fast = self._fast_name(node)
+        elif isinstance(node, ast.UnaryOp) and children[-1] is not None:
+            fast = self._fast_unaryop(node, children[-1])
+        elif isinstance(node, ast.BinOp) and None not in (children[0], children[-1]):
+            fast = self._fast_binop(node, children[0], children[-1])
+        elif isinstance(node, ast.Call):
+            fast = self._fast_call(node)
+        if fast is not None:
+            node.larch_fast = fast
+        return fast
+
+    def _fast_constant(self, node):
+        value = node.value
+        return lambda: value
+
+    def _fast_name(self, node):
+        name = node.id
+        def fast_name():
+            try:
+                return self.symtable.get_symbol(name)
+            except (NameError, LookupError):
+                self.raise_exception(node, msg="name '%s' is not defined" % name)
+                raise _FastNodeError
+        return fast_name
+
+    def _fast_unaryop(self, node, operand):
+        oper = OPERATORS[node.op.__class__]
+        return lambda: oper(operand())
+
+    def _fast_binop(self, node, left, right):
+        oper = OPERATORS[node.op.__class__]
+        return lambda: oper(left(), right())
+
+    def _fast_call(self, node):
+        """compiled function call: numpy functions are called directly,
+        all others with on_call()"""
+        func = getattr(node.func, 'larch_fast', None)
+        if not isinstance(node.func, ast.Name) or func is None:
+            return None
+        args = [getattr(arg, 'larch_fast', None) for arg in node.args]
+        kwargs = [(key.arg, getattr(key.value, 'larch_fast', None))
+                  for key in node.keywords]
+        if (None in args or
+            any(key is None or val is None for key, val in kwargs)):
+            return None
+        def fast_call():
+            fcn = func()
+            if not (isinstance(fcn, numpy.ufunc) or
+                    (getattr(fcn, '__module__', None) or '').startswith('numpy')):
+                return self.on_call(node)
+            vals = [arg() for arg in args]
+            kws = {key: val() for key, val in kwargs}
+            try:
+                return fcn(*vals, **kws)
+            except Exception as ex:
+                func_name = getattr(fcn, '__name__', str(fcn))
+                self.raise_exception(
+                    node, msg="Error running function call '%s' with args %s and "
+                    "kwargs %s: %s" % (func_name, vals, kws, ex))
+                raise _FastNodeError
+        return fast_call
 
     def run(self, node, expr=None, func=None,
             fname=None, lineno=None, with_raise=False):
@@ -262,6 +448,18 @@ class Interpreter:
         # if func is not None:
         self.func = func
 
+        # compiled nodes: see compile_node()
+        fast = getattr(node, 'larch_fast', None)
+        if fast is not None:
+            try:
+                return fast()
+            except _FastNodeError:
+                return None
+            except:
+                self.raise_exception(node, expr=self.expr,
+                                     fname=self.fname, lineno=self.lineno)
+                return None
+
         # get handler for this node:
         #   on_xxx with handle nodes of type 'xxx', etc
         if node.__class__.__name__.lower() not in self.node_handlers:
@@ -562,7 +760,7 @@ class Interpreter:
         if len(self.error) > 0:
             return
         if node.__class__ == ast.Name:
-            if not valid_symbol_name(node.id):
+            if not _valid_symbol_name(node.id):
                 errmsg = f"invalid symbol name (reserved word?) {node.id}"
                 self.raise_exception(node, exc=NameError, msg=errmsg)
             sym = self.symtable.set_symbol(node.id, value=val)
@@ -16,7 +16,7 @@ from .columnfile import (read_ascii, write_ascii, write_group, set_array_labels,
 from .xdi import read_xdi, XDIFile, XDIFileException
 from .mda import read_mda
 from .hdf5group import h5file, h5group, netcdf_file, netcdf_group
-from .xsp3_hdf5 import read_xsp3_hdf5
+from .xsp3_hdf5 import read_xsp3_hdf5, iter_xsp3_hdf5
 from .xrf_netcdf import read_xrf_netcdf
 from .xrd_netcdf import read_xrd_netcdf
 from .xrd_hdf5 import read_xrd_hdf5
@@ -1,10 +1,14 @@
+import os
 import json
 import time
+import zlib
+import mmap
+import struct
 import numpy as np
 import uuid, socket, platform
 from collections import namedtuple
 
-from gzip import GzipFile
+from gzip import GzipFile, compress as gzip_compress, decompress as gzip_decompress
 
 from lmfit import Parameter, Parameters
 # from lmfit.model import Model, ModelResult
@@ -19,6 +23,16 @@ SessionStore = namedtuple('SessionStore', ('config', 'command_history', 'symbols
 
 EMPTY_FEFFCACHE = {'paths': {}, 'runs': {}}
 
+# binary Larch files (Larix version 2.0 and group lists version 2.0) have:
+#   a text header line
+#   the rest of the text, gzip-compressed, with arrays encoded as references
+#   arrays at native dtype, each starting on a BINARY_ALIGN byte boundary,
+#      and optionally zlib-compressed
+#   a json index with the offset, size, dtype, and shape of each array
+#   a trailer of BINARY_TAG and the offset of the index
+BINARY_TAG = b'##LARIXB'
+BINARY_ALIGN = 64
+
 def invert_dict(d):
     "invert a dictionary {k: v} -> {v: k}"
     return {v: k for k, v in d.items()}
@@ -28,24 +42,190 @@ def get_machineid():
     return hex(uuid.getnode())[2:]
 
 def is_larch_session_file(fname):
-    return read_textfile(fname, size=64).startswith('##LARIX:')
+    fopen = GzipFile if is_gzip(fname) else open
+    with fopen(fname, 'rb') as fh:
+        return fh.read(8) == b'##LARIX:'
+
+def is_binary_larch_file(fname):
+    "is file a binary Larch session or group file"
+    try:
+        with open(fname, 'rb') as fh:
+            fh.seek(-16, 2)
+            return fh.read(8) == BINARY_TAG
+    except OSError:
+        return False
+
+def write_binary_file(fname, text, arrays, compress=False):
+    """write text and arrays to a binary Larch file
+
+    Arguments:
+        fname (str):   name of output file.
+        text (str):    text, with arrays encoded with encode4js(obj, arrays)
+        arrays (list): list of numpy arrays
+        compress (bool): whether to compress arrays with zlib [False]
+
+    Notes:
+        arrays that are not compressed can be memory-mapped when read.
+    """
+    header, body = text.split('\n', 1)
+    index = []
+    # write to a temporary file, so that arrays memory-mapped from an
+    # existing file of the same name are not changed.
+    tmpfile = f'{fname}_{os.getpid()}.tmp'
+    with open(tmpfile, 'wb') as fh:
+        fh.write(str2bytes(header + '\n'))
+        fh.write(gzip_compress(str2bytes(body), compresslevel=6))
+        text_end = fh.tell()
+        for arr in arrays:
+            fh.write(b'\0' * (-fh.tell() % BINARY_ALIGN))
+            arr = np.ascontiguousarray(arr)
+            data = arr.tobytes()
+            comp = None
+            if compress:
+                zdata = zlib.compress(data)
+                if len(zdata) < len(data):
+                    data, comp = zdata, 'zlib'
+            index.append((fh.tell(), len(data), arr.dtype.str, arr.shape, comp))
+            fh.write(data)
+        ioffset = fh.tell()
+        fh.write(str2bytes(json.dumps({'text_end': text_end, 'arrays': index})))
+        fh.write(BINARY_TAG + struct.pack('<Q', ioffset))
+    os.replace(tmpfile, fname)
+
+class BinaryArrays:
+    """arrays in a binary Larch file, read from the file when accessed
+    by index, as needed by decode4js(obj, arrays)
+
+    With use_mmap=True, the file is memory-mapped, and arrays that are not
+    compressed are copy-on-write views of the file contents, so that data
+    is read from disk only when used.
+    """
+    def __init__(self, fname, index, use_mmap=False):
+        self.fname = fname
+        self.index = index
+        self.mmap = None
+        if use_mmap:
+            with open(fname, 'rb') as fh:
+                self.mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        offset, nbytes, dtype, shape, comp = self.index[i]
+        if nbytes == 0:
+            return np.zeros(shape, dtype=dtype)
+        if self.mmap is not None:
+            if comp == 'zlib':
+                data = bytearray(zlib.decompress(self.mmap[offset:offset+nbytes]))
+                out = np.frombuffer(data, dtype=dtype)
+            else:
+                out = np.frombuffer(self.mmap, dtype=dtype, offset=offset,
+                                    count=nbytes//np.dtype(dtype).itemsize)
+            return out.reshape(shape)
+        with open(self.fname, 'rb') as fh:
+            fh.seek(offset)
+            if comp == 'zlib':
+                data = bytearray(zlib.decompress(fh.read(nbytes)))
+                out = np.frombuffer(data, dtype=dtype)
+            else:
+                out = np.fromfile(fh, dtype=dtype,
+                                  count=nbytes//np.dtype(dtype).itemsize)
+        return out.reshape(shape)
+
+class LazyGroup(Group):
+    """Group read from a Larch Session File, with members decoded from the
+    file when first accessed.  It then becomes a normal Group."""
+    def __init__(self, text, arrays=None):
+        self.__dict__['_LazyGroup__text'] = text
+        self.__dict__['_LazyGroup__arrays'] = arrays
+
+    def __load(self):
+        text = self.__dict__.pop('_LazyGroup__text')
+        arrays = self.__dict__.pop('_LazyGroup__arrays')
+        object.__setattr__(self, '__class__', Group)
+        for key, val in decode4js(json.loads(text), arrays=arrays).__dict__.items():
+            setattr(self, key, val)
+
+    def __getattr__(self, attr):
+        if '_LazyGroup__text' not in self.__dict__:
+            raise AttributeError(attr)
+        self.__load()
+        return getattr(self, attr)
+
+    def __setattr__(self, attr, value):
+        self.__load()
+        setattr(self, attr, value)
+
+    def __delattr__(self, attr):
+        self.__load()
+        delattr(self, attr)
+
+    def __dir__(self):
+        self.__load()
+        return self.__dir__()
+
+    def __repr__(self):
+        self.__load()
+        return repr(self)
+
+    def __copy__(self):
+        self.__load()
+        return self.__copy__()
+
+    def __deepcopy__(self, memo):
+        self.__load()
+        return self.__deepcopy__(memo)
+
+def read_binary_file(fname, use_mmap=False):
+    """read text and arrays from a binary Larch file
+
+    Arguments:
+        fname (str):      name of file
+        use_mmap (bool):  whether to memory-map arrays [False]
 
-def save_groups(fname, grouplist):
+    Returns:
+        tuple of text, and BinaryArrays for the arrays in the file
+    """
+    with open(fname, 'rb') as fh:
+        fh.seek(-16, 2)
+        tag, ioffset = fh.read(8), struct.unpack('<Q', fh.read(8))[0]
+        if tag != BINARY_TAG:
+            raise ValueError(f"Invalid binary Larch file: '{fname:s}'")
+        fh.seek(ioffset)
+        index = json.loads(bytes2str(fh.read()[:-16]))
+        fh.seek(0)
+        header = bytes2str(fh.readline())
+        body = fh.read(index['text_end'] - fh.tell())
+    text = header + bytes2str(gzip_decompress(body))
+    return text, BinaryArrays(fname, index['arrays'], use_mmap=use_mmap)
+
+def save_groups(fname, grouplist, binary=False, compress=False):
     """save a list of groups (and other supported datatypes) to file
 
     This is a simplified and minimal version of save_session()
 
+    Arguments:
+        fname (str):      name of output file.
+        grouplist (list): list of groups and other data to save.
+        binary (bool):    whether to save arrays in binary form [False]
+        compress (bool):  whether to compress binary arrays [False]
+
     Use 'read_groups()' to read data saved from this function
     """
-    buff = ["##LARCH GROUPLIST"]
+    arrays = [] if binary else None
+    buff = ["##LARCH GROUPLIST 2.0" if binary else "##LARCH GROUPLIST"]
     for dat in grouplist:
-        buff.append(json.dumps(encode4js(dat)))
+        buff.append(json.dumps(encode4js(dat, arrays=arrays)))
 
     buff.append("")
 
-    fh = GzipFile(fname, "w")
-    fh.write(str2bytes("\n".join(buff)))
-    fh.close()
+    if binary:
+        write_binary_file(fname, "\n".join(buff), arrays, compress=compress)
+    else:
+        fh = GzipFile(fname, "w")
+        fh.write(str2bytes("\n".join(buff)))
+        fh.close()
 
 def read_groups(fname):
     """read a list of groups (and other supported datatypes)
@@ -53,7 +233,11 @@ def read_groups(fname):
 
     Returns a list of objects
     """
-    text = read_textfile(fname)
+    arrays = None
+    if is_binary_larch_file(fname):
+        text, arrays = read_binary_file(fname)
+    else:
+        text = read_textfile(fname)
     lines = text.split('\n')
     line0 = lines.pop(0)
     if not line0.startswith('##LARCH GROUPLIST'):
@@ -62,17 +246,26 @@ def read_groups(fname):
     out = []
     for line in lines:
         if len(line) > 1:
-            out.append(decode4js(json.loads(line)))
+            out.append(decode4js(json.loads(line), arrays=arrays))
     return out
 
 
-def save_session(fname=None, _larch=None):
+def save_session(fname=None, binary=False, compress=False, _larch=None):
     """save all groups and data into a Larch Save File (.larix)
     A portable compressed json file, that can be loaded with `read_session()`
 
 
     Arguments:
         fname (str):   name of output save file.
+        binary (bool): whether to save arrays in binary form [False]
+        compress (bool): whether to compress binary arrays [False]
+
+    Notes:
+        with binary=True, a Larix version 2.0 file is written, with
+        arrays saved at their native dtype instead of as json text.
+        This is much faster to write and read, and is usually smaller.
+        Arrays that are not compressed can be read lazily.  Version 2.0
+        files cannot be read by earlier versions of Larch.
 
     See Also:
         read_session, load_session, clear_session
@@ -87,7 +280,9 @@ def save_session(fname=None, _larch=None):
         raise ValueError('_larch not defined')
     symtab = _larch.symtable
 
-    buff = ["##LARIX: 1.0      Larch Session File",
+    arrays = [] if binary else None
+    larix_version = '2.0' if binary else '1.0'
+    buff = ["##LARIX: %s      Larch Session File" % larix_version,
             "##Date Saved: %s"   % time.strftime('%Y-%m-%d %H:%M:%S'),
             "##<CONFIG>",
             "##Machine Platform: %s" % platform.system(),
@@ -132,14 +327,17 @@ def save_session(fname=None, _larch=None):
         if attr in core_groups:
             continue
         buff.append('<:%s:>' % attr)
-        buff.append(json.dumps(encode4js(getattr(symtab, attr))))
+        buff.append(json.dumps(encode4js(getattr(symtab, attr), arrays=arrays)))
 
     buff.append("##</Symbols>")
     buff.append("")
 
-    fh = GzipFile(fname, "w")
-    fh.write(str2bytes("\n".join(buff)))
-    fh.close()
+    if binary:
+        write_binary_file(fname, "\n".join(buff), arrays, compress=compress)
+    else:
+        fh = GzipFile(fname, "w")
+        fh.write(str2bytes("\n".join(buff)))
+        fh.close()
 
 def clear_session(_larch=None):
     """clear user-definded data in a session
@@ -159,12 +357,13 @@ def clear_session(_larch=None):
             delattr(_larch.symtable, attr)
 
 
-def read_session(fname):
+def read_session(fname, lazy=False):
     """read Larch Session File, returning data into new data in the
     current session
 
     Arguments:
          fname (str):  name of save file
+         lazy (bool):  whether to read Groups lazily [False]
 
     Returns:
        Tuple
@@ -174,12 +373,23 @@ def read_session(fname):
            | command_history  - a list of commands in the saved session.
            | symbols         - a dict of Larch/Python symbols, groups, etc
 
+    Notes:
+       with lazy=True, Groups are returned as LazyGroups, which are
+       decoded only when first used.  For version 2.0 files, the file
+       is also memory-mapped so that arrays are read from disk only as
+       they are used.  On Windows, the file cannot be overwritten while
+       these arrays are in use.
+
     See Also:
        load_session
 
 
     """
-    text = read_textfile(fname)
+    arrays = None
+    if is_binary_larch_file(fname):
+        text, arrays = read_binary_file(fname, use_mmap=lazy)
+    else:
+        text = read_textfile(fname)
     lines = text.split('\n')
     line0 = lines.pop(0)
     if not line0.startswith('##LARIX:'):
@@ -206,9 +416,11 @@ def read_session(fname):
         elif section == 'symbols':
             if line.startswith('<:') and line.endswith(':>'):
                 symname = line.replace('<:', '').replace(':>', '')
+            elif lazy and line.startswith('{"__class__": "Group",'):
+                symbols[symname] = LazyGroup(line, arrays=arrays)
             else:
                 try:
-                    symbols[symname] = decode4js(json.loads(line))
+                    symbols[symname] = decode4js(json.loads(line), arrays=arrays)
                 except:
                     print("decode failed:: ", symname, line[:150])
 
@@ -227,7 +439,8 @@ def read_session(fname):
     return SessionStore(config, cmd_history, symbols)
 
 
-def load_session(fname, ignore_groups=None, include_xasgroups=None, _larch=None, verbose=False):
+def load_session(fname, ignore_groups=None, include_xasgroups=None, lazy=False,
+                 _larch=None, verbose=False):
     """load all data from a Larch Session File into current larch session,
     merging into existing groups as appropriate (see Notes below)
 
@@ -236,6 +449,7 @@ def load_session(fname, ignore_groups=None, include_xasgroups=None, _larch=None,
        ignore_groups (list of strings): list of symbols to not import
        include_xasgroups (list of strings): list of symbols to import as XAS spectra,
                            even if not expicitly set in `_xasgroups`
+       lazy (bool): whether to read Groups lazily, see `read_session` [False]
        verbose (bool): whether to print warnings for overwrites [False]
     Returns:
         None
@@ -253,7 +467,7 @@ def load_session(fname, ignore_groups=None, include_xasgroups=None, _larch=None,
     if _larch is None:
         raise ValueError('load session needs a larch session')
 
-    session = read_session(fname)
+    session = read_session(fname, lazy=lazy)
 
     if ignore_groups is None:
         ignore_groups = []
@@ -1,7 +1,7 @@
 #!/usr/bin/python
 """
-support for netcdf file output files containing MCA spectra
-from Epics Mapping Mode with XIA xMXAP electronics
+support for HDF5 files containing MCA spectra
+from Epics Mapping Mode with Xspress3 electronics
 """
 import numpy as np
 import time
@@ -10,24 +10,18 @@ import sys
 import os
 
 from .. import Group
+from ..xrf.deadtime import solve_icr, correction_factor
 
 # Default tau values for xspress3
 XSPRESS3_TAU = 80.e-9
 
 def estimate_icr(ocr, tau, niter=3):
-    "estimate icr from ocr and tau"
-    maxicr = 1.0/tau
-    maxocr = 1/(tau*np.exp(1.0))
-    ocr[np.where(ocr>2*maxocr)[0]] = 2*maxocr
-    icr = 1.0*ocr
-    for c in range(niter):
-        delta = (icr - ocr*np.exp(icr*tau))/(icr*tau - 1)
-        delta[np.where(delta < 0)[0]] = 0.0
-        icr = icr + delta
-        icr[np.where(icr>5*maxicr)[0]] = 5*maxicr
-    #endfor
-    return icr
-#enddef
+    """estimate icr from ocr and tau, for arrays of any shape
+
+    ocr above the maximum correctible value gives icr = 1/tau.
+    niter is not used, as icr is calculated directly with solve_icr().
+    """
+    return solve_icr(ocr, tau, saturate=True)
 
 
 class XSP3Data(object):
@@ -40,10 +34,10 @@ class XSP3Data(object):
         self.inputCounts  = np.zeros((npix, ndet), dtype='f8')
         # self.counts       = np.zeros((npix, ndet, nchan), dtype='f4')
 
-def get_counts_carefully(h5link):
+def get_counts_carefully(h5link, start=0, stop=None):
     """
-    get counts array with some error checking for corrupted files,
-    especially those that give
+    get counts array, or the pixels start:stop of it, with some error
+    checking for corrupted files, especially those that give
        'OSError: Can't read data (inflate() failed)'
     because one data point is bad.
 
@@ -51,16 +45,18 @@ def get_counts_carefully(h5link):
     for such points and replaces offending points by the average of the
     neighboring points
     """
+    npts = h5link.shape[0]
+    if stop is None:
+        stop = npts
     # will usually succeed, of course.
     try:
-        return h5link[()]
+        return h5link[start:stop]
     except OSError:
         pass
 
     # find bad point
-    npts = h5link.shape[0]
-    ilo, ihi = 0, npts
-    imid = (ihi-ilo)//2
+    ilo, ihi = start, stop
+    imid = ilo + (ihi-ilo)//2
     while (ihi-ilo) > 1:
         try:
             _tmp = h5link[ilo:imid]
@@ -78,49 +74,56 @@ def get_counts_carefully(h5link):
 
     # its not unusual to have two bad points in a row:
     p1bad = m1bad = False
-    try:
-        _tmp = h5link[i+1]
-    except OSError:
-        p1bad = True
-    try:
-        _tmp = h5link[i-1]
-    except OSError:
-        m1bad = True
+    if i+1 < npts:
+        try:
+            _tmp = h5link[i+1]
+        except OSError:
+            p1bad = True
+    if i > 0:
+        try:
+            _tmp = h5link[i-1]
+        except OSError:
+            m1bad = True
 
     if  m1bad:
         ibad = ibad - 1
         p1bad = True
 
-    counts = np.zeros(h5link.shape, dtype=h5link.dtype)
-    counts[:ibad] = h5link[:ibad]
-    counts[ibad+2:] = h5link[ibad+2:]
+    nbad = 2 if p1bad else 1
+    counts = np.zeros((stop-start,) + h5link.shape[1:], dtype=h5link.dtype)
+    if ibad > start:
+        counts[:ibad-start] = h5link[start:ibad]
+    if ibad+nbad < stop:
+        counts[ibad+nbad-start:] = h5link[ibad+nbad:stop]
     if p1bad: # two in a row
         print("fixing 2 bad points in h5 file")
-        counts[ibad]   = h5link[ibad-1]
-        counts[ibad+1] = h5link[ibad+2]
+        fixed = [h5link[ibad-1], h5link[ibad+2]]
     else:
         print("fixing bad point in h5 file")
-        counts[ibad+1] = h5link[ibad+1]
         if ibad == 0:
-            counts[ibad] = counts[ibad+1]
+            fixed = [h5link[ibad+1]]
         elif ibad == npts - 1:
-            counts[ibad] = counts[ibad-1]
+            fixed = [h5link[ibad-1]]
         else:
-            counts[ibad] = ((counts[ibad-1]+counts[ibad+1])/2.0).astype(h5link.dtype)
+            fixed = [((h5link[ibad-1]+h5link[ibad+1])/2.0).astype(h5link.dtype)]
+    for i, val in enumerate(fixed):
+        if start <= ibad+i < stop:
+            counts[ibad+i-start] = val
     return counts
 
 
-def read_xsp3_hdf5(fname, npixels=None, verbose=False,
-                   estimate_dtc=False, **kws):
-    # Reads a HDF5 file created with the Xspress3 driver
-    npixels = None
+def open_xsp3_hdf5(fname):
+    """open a HDF5 file created with the Xspress3 driver
 
-    clockrate = 12.5e-3  # microseconds per clock tick: 80MHz clock
-    t0 = time.time()
+    Returns a Group with the open h5py File (h5file), the detector data
+    (counts), the NDAttributes (ndattr), the number of pixels (npix), of
+    pixels in the detector data (ndpix), of detectors (ndet), and of
+    channels (nchan).
+    """
     h5file = h5py.File(fname, 'r')
 
     root  = h5file['entry/instrument']
-    counts = get_counts_carefully(root['detector/data'])
+    counts = root['detector/data']
 
     # support bother newer and earlier location of NDAttributes
     ndattr = None
@@ -135,63 +138,131 @@ def read_xsp3_hdf5(fname, npixels=None, verbose=False,
         except KeyError:
             pass
     if 'CHAN1SCA0' not in ndattr:
+        h5file.close()
         raise ValueError("cannot find NDAttributes for '%s'" % fname)
 
     # note: sometimes counts has npix-1 pixels, while the time arrays
     # really have npix...  So we take npix from the time array, and
+    # pixels missing from the counts are given zero counts
     npix = ndattr['CHAN1SCA0'].shape[0]
     ndpix, ndet, nchan = counts.shape
-    if npixels is None:
-        npixels = npix
-        if npixels < ndpix:
-            ndpix = npixels
+    return Group(h5file=h5file, counts=counts, ndattr=ndattr, npix=npix,
+                 ndpix=min(ndpix, npix), ndet=ndet, nchan=nchan)
+
+
+def iter_xsp3_hdf5(fname, chunksize=256, estimate_dtc=False):
+    """iterate over blocks of pixels of a HDF5 file created with the
+    Xspress3 driver
+
+    Arguments:
+    ----------
+    fname         name of file
+    chunksize     number of pixels in each block [256]
+    estimate_dtc  whether to estimate input counts from output counts and
+                  the default Xspress3 deadtime [False]
+
+    Yields:
+    -------
+    XSP3Data for each block of pixels, with firstPixel and numPixels, and
+    with counts (numPixels, ndet, nchan) in the data type of the file.
+    realTime, liveTime, outputCounts, inputCounts and the deadtime
+    correction factor dtfactor are (numPixels, ndet) arrays.
+
+    Notes:
+    ------
+    Only the block that cannot be read is checked for bad points, as with
+    get_counts_carefully().
+
+    Example:
+    --------
+    >>for block in iter_xsp3_hdf5(fname):
+    ...>total[block.firstPixel:block.firstPixel+block.numPixels] = (
+    ...>     block.counts.sum(axis=2)*block.dtfactor).sum(axis=1)
+    """
+    clockrate = 12.5e-3  # microseconds per clock tick: 80MHz clock
+    xsp3 = open_xsp3_hdf5(fname)
+    ndattr, npix, ndet = xsp3.ndattr, xsp3.npix, xsp3.ndet
+    try:
+        realtime = np.zeros((npix, ndet), dtype='f8')
+        dtfactor = np.zeros((npix, ndet), dtype='f8')
+        for i in range(ndet):
+            chan = "CHAN%i" %(i+1)
+            clock_ticks = ndattr['%sSCA0' % chan][()]
+            reset_ticks = ndattr["%sSCA1" % chan][()]
+            all_events  = ndattr["%sSCA3" % chan][()]
+            if "%sEventWidth" in ndattr:
+                event_width = 1.0 + ndattr['%sEventWidth' % chan][()]
+            else:
+                event_width = 6.0
+
+            clock_ticks[np.where(clock_ticks<10)] = 10.0
+            realtime[:, i] = clockrate * clock_ticks
+
+            denom = clock_ticks - (all_events*event_width + reset_ticks)
+            denom[np.where(denom<2.0)] = 1.0
+            dtfactor[:, i] = clock_ticks/denom
+
+        for start in range(0, npix, chunksize):
+            stop = min(start+chunksize, npix)
+            out = XSP3Data(stop-start, ndet, xsp3.nchan)
+            out.firstPixel = start
+            out.numPixels = stop-start
+            if stop <= xsp3.ndpix:
+                counts = get_counts_carefully(xsp3.counts, start, stop)
+            else:
+                counts = np.zeros((stop-start, ndet, xsp3.nchan),
+                                  dtype=xsp3.counts.dtype)
+                if start < xsp3.ndpix:
+                    counts[:xsp3.ndpix-start] = get_counts_carefully(
+                        xsp3.counts, start, xsp3.ndpix)
+            out.counts = counts
+
+            out.realTime[:] = realtime[start:stop]
+            out.liveTime[:] = realtime[start:stop]
+            ocounts = counts[:, :, 1:-1].sum(axis=2)
+            ocounts[np.where(ocounts<0.1)] = 0.1
+            out.outputCounts[:] = ocounts
+            out.inputCounts[:] = dtfactor[start:stop] * ocounts
+
+            if estimate_dtc:
+                rtime = out.realTime*1.e-6
+                icr = estimate_icr(out.outputCounts/rtime, XSPRESS3_TAU)
+                out.inputCounts[:] = icr * rtime
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out.dtfactor = correction_factor(out.realTime, out.liveTime,
+                                                 icr=out.inputCounts,
+                                                 ocr=out.outputCounts)
+            out.dtfactor[np.where(~np.isfinite(out.dtfactor))] = 1.0
+            yield out
+    finally:
+        xsp3.h5file.close()
+
+
+def read_xsp3_hdf5(fname, npixels=None, verbose=False,
+                   estimate_dtc=False, chunksize=256, **kws):
+    # Reads a HDF5 file created with the Xspress3 driver,
+    # in blocks of chunksize pixels, see iter_xsp3_hdf5()
+    t0 = time.time()
+    xsp3 = open_xsp3_hdf5(fname)
+    npixels, ndet, nchan = xsp3.npix, xsp3.ndet, xsp3.nchan
+    dtype = xsp3.counts.dtype
+    xsp3.h5file.close()
 
     out = XSP3Data(npixels, ndet, nchan)
     out.numPixels = npixels
-    t1 = time.time()
+    out.counts = np.zeros((npixels, ndet, nchan), dtype=dtype)
+    out.dtfactor = np.ones((npixels, ndet), dtype='f8')
+    for block in iter_xsp3_hdf5(fname, chunksize=chunksize,
+                                estimate_dtc=estimate_dtc):
+        pixels = slice(block.firstPixel, block.firstPixel+block.numPixels)
+        for attr in ('counts', 'realTime', 'liveTime', 'outputCounts',
+                     'inputCounts', 'dtfactor'):
+            getattr(out, attr)[pixels] = getattr(block, attr)
 
-    if ndpix < npix:
-        out.counts = np.zeros((npix, ndet, nchan), dtype='f8')
-        out.counts[:ndpix, :, :]  = counts
-    else:
-        out.counts = counts
-
-    if estimate_dtc:
-        dtc_taus = [XSPRESS3_TAU]*ndet
-
-    for i in range(ndet):
-        chan = "CHAN%i" %(i+1)
-        clock_ticks = ndattr['%sSCA0' % chan][()]
-        reset_ticks = ndattr["%sSCA1" % chan][()]
-        all_events  = ndattr["%sSCA3" % chan][()]
-        if "%sEventWidth" in ndattr:
-            event_width = 1.0 + ndattr['%sEventWidth' % chan][()]
-        else:
-            event_width = 6.0
-
-        clock_ticks[np.where(clock_ticks<10)] = 10.0
-        rtime = clockrate * clock_ticks
-        out.realTime[:, i] = rtime
-        out.liveTime[:, i] = rtime
-        ocounts = out.counts[:, i, 1:-1].sum(axis=1)
-        ocounts[np.where(ocounts<0.1)] = 0.1
-        out.outputCounts[:, i] = ocounts
-
-        denom = clock_ticks - (all_events*event_width + reset_ticks)
-        denom[np.where(denom<2.0)] = 1.0
-        dtfactor = clock_ticks/denom
-        out.inputCounts[:, i] = dtfactor * ocounts
-
-        if estimate_dtc:
-            ocr = ocounts/(rtime*1.e-6)
-            icr = estimate_icr(ocr, dtc_taus[i], niter=3)
-            out.inputCounts[:, i] = icr * (rtime*1.e-6)
-
-    h5file.close()
-    t2 = time.time()
+    t1 = time.time()
     if verbose:
         print('   time to read file    = %5.1f ms' % ((t1-t0)*1000))
-        print('   time to extract data = %5.1f ms' % ((t2-t1)*1000))
         print('   read %i pixels ' %  npixels)
         print('   data shape:    ' ,  out.counts.shape)
     return out
@@ -15,8 +15,11 @@ from .lineshapes import (gaussian, lorentzian, voigt, pvoigt, hypermet,
 
 from .fitpeak import fit_peak
 from .convolution1D import glinbroad
-from .lincombo_fitting import lincombo_fit, lincombo_fitall, groups2matrix
-from .pca import pca_train, pca_fit, nmf_train, save_pca_model, read_pca_model
+from .lincombo_fitting import (lincombo_fit, lincombo_fitall, lincombo_fitmap,
+                               groups2matrix)
+from .nnls import nnls_batch, nnls_gram
+from .pca import (pca_train, pca_fit, pca_fitmap, nmf_train, save_pca_model,
+                  read_pca_model)
 from .learn_regress import pls_train, pls_predict, lasso_train, lasso_predict
 from .gridxyz import gridxyz
 from .spline import spline_rep, spline_eval
@@ -36,6 +39,7 @@ _larch_builtins = {'_math': dict(linregress=linregress, polyfit=polyfit,
                                  glinbroad=glinbroad, gridxyz=gridxyz,
                                  pca_train=pca_train,
                                  pca_fit=pca_fit,
+                                 pca_fitmap=pca_fitmap,
                                  save_pca_model=save_pca_model,
                                  read_pca_model=read_pca_model,
                                  nmf_train=nmf_train,
@@ -47,6 +51,7 @@ _larch_builtins = {'_math': dict(linregress=linregress, polyfit=polyfit,
                                  fit_peak=fit_peak,
                                  lincombo_fit=lincombo_fit,
                                  lincombo_fitall=lincombo_fitall,
+                                 lincombo_fitmap=lincombo_fitmap,
                                  spline_rep=spline_rep,
                                  spline_eval=spline_eval,
                                  gaussian=gaussian,
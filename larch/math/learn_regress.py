@@ -5,15 +5,11 @@ including Partial Least Squares (PLS) and L1-Regularized Linear Modeling (Lasso)
 
 These methods are built on the methods from scikit-learn
 """
+import importlib.util
 import numpy as np
 
-try:
-    from sklearn.cross_decomposition import PLSRegression
-    from sklearn.model_selection import  RepeatedKFold
-    from sklearn.linear_model import LassoLarsCV, LassoLars, Lasso
-    HAS_SKLEARN = True
-except ImportError:
-    HAS_SKLEARN = False
+# scikit-learn is imported when needed, as it is slow to import
+HAS_SKLEARN = importlib.util.find_spec('sklearn') is not None
 
 from .. import Group, isgroup
 
@@ -57,6 +53,8 @@ def pls_train(groups, varname='valence', arrayname='norm', scale=True,
     """
     if not HAS_SKLEARN:
         raise ImportError("scikit-learn not installed")
+    from sklearn.cross_decomposition import PLSRegression
+    from sklearn.model_selection import RepeatedKFold
 
     xdat, spectra = groups2matrix(groups, arrayname, xmin=xmin, xmax=xmax)
     groupnames = []
@@ -147,6 +145,9 @@ def lasso_train(groups, varname='valence', arrayname='norm', alpha=None,
     """
     if not HAS_SKLEARN:
         raise ImportError("scikit-learn not installed")
+    from sklearn.model_selection import RepeatedKFold
+    from sklearn.linear_model import LassoLarsCV, LassoLars, Lasso
+
     xdat, spectra = groups2matrix(groups, arrayname, xmin=xmin, xmax=xmax)
     groupnames = []
     ydat = []
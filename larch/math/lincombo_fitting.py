@@ -7,15 +7,20 @@ import sys
 import time
 import json
 import copy
+import multiprocessing as mp
 
-from itertools import combinations
+from itertools import combinations, islice
+from functools import partial
 from glob import glob
 
 import numpy as np
 from numpy.random import randint
+from scipy.optimize import lsq_linear
 import lmfit
+from lmfit.minimizer import MinimizerResult
 from .. import Group
 from .utils import interp, index_of, etok
+from .nnls import nnls_gram
 
 
 def get_arrays(group, arrayname, xname='energy'):
@@ -104,6 +109,201 @@ def groups2matrix(groups, yname='norm', xname='energy', xmin=-np.inf, xmax=np.in
     return xdat, np.array(ydat)
 
 
+def _bounded_sum_solve(gram, atb, lower, upper, total=1.0, maxiter=None):
+    """solve min |A w - y| with lower <= w <= upper and sum(w) = total,
+    given the normal equations gram = A^T A and atb = A^T y, using a
+    primal active-set method (Nocedal and Wright, Numerical Optimization,
+    ch. 16).
+
+    Returns the weights and a boolean array, True for weights at a bound."""
+    ncomps = len(atb)
+    if maxiter is None:
+        maxiter = 10*ncomps + 20
+    scale = np.abs(atb).max() + np.abs(gram).max()
+    tol = 1.e-10*max(scale, 1.e-300)
+
+    # feasible starting weights
+    wts = np.clip(total/ncomps, lower, upper)
+    for i in range(ncomps):
+        extra = total - wts.sum()
+        wts[i] = np.clip(wts[i] + extra, lower[i], upper[i])
+    fixed = (wts == lower) | (wts == upper)
+
+    for niter in range(maxiter):
+        # solve with the free weights, and the sum with a Lagrange multiplier
+        free = np.where(~fixed)[0]
+        wfix = np.where(fixed, wts, 0.0)
+        nfree = len(free)
+        kkt = np.ones((nfree+1, nfree+1))
+        kkt[:nfree, :nfree] = gram[np.ix_(free, free)]
+        kkt[nfree, nfree] = 0.0
+        rhs = np.append(atb[free] - gram[free] @ wfix, total - wfix.sum())
+        out = np.linalg.lstsq(kkt, rhs, rcond=None)[0]
+        wnew = wfix.copy()
+        wnew[free] = out[:nfree]
+
+        # move toward the new weights, stopping at the first bound
+        step = wnew - wts
+        with np.errstate(divide='ignore', invalid='ignore'):
+            alpha = np.where(step < 0, (lower-wts)/step,
+                             np.where(step > 0, (upper-wts)/step, np.inf))
+        alpha[fixed] = np.inf
+        iblock = np.argmin(alpha)
+        if alpha[iblock] < 1:
+            wts = wts + alpha[iblock]*step
+            wts[iblock] = lower[iblock] if step[iblock] < 0 else upper[iblock]
+            fixed[iblock] = True
+            continue
+        wts = wnew
+
+        # release the weight at a bound with the most negative multiplier
+        grad = gram @ wts - atb
+        if nfree > 0:
+            mult = out[nfree]
+        else:
+            mult = -grad.min()
+        lagrange = np.where(wts == lower, grad + mult, -(grad + mult))
+        lagrange[~fixed] = np.inf
+        irelease = np.argmin(lagrange)
+        if lagrange[irelease] > -tol:
+            break
+        fixed[irelease] = False
+    return wts, fixed
+
+def lincombo_solve(ycomps, ydat, minvals=None, maxvals=None, sum_to_one=True):
+    """solve a linear combination fit with bounds on the weights, and
+    optionally with weights that sum to 1, without iterative minimization
+
+    Arguments
+    ---------
+    ycomps      array of components, shape (npts, ncomps)
+    ydat        array of data to be fitted, shape (npts,)
+    minvals     array of min weights (or None to mean -inf)
+    maxvals     array of max weights (or None to mean +inf)
+    sum_to_one  bool, whether to force weights to sum to 1.0 [True]
+
+    Returns
+    -------
+    weights, covar   where weights has shape (ncomps,), and covar is the
+                     unscaled covariance of the weights, shape (ncomps, ncomps),
+                     or None if that cannot be found.
+
+    Notes
+    -----
+     1.  when any bound is finite, the weights that are at a bound are
+         found with bounded-variable least squares (scipy.optimize.lsq_linear),
+         or, with sum_to_one, with a primal active-set method.
+     2.  the other weights are then found exactly, with sum_to_one imposed
+         by eliminating the last of them.  Their covariance is inv(A^T A)
+         for that reduced problem, and weights at bounds have zero
+         covariance.  Any of these weights found outside its bounds is
+         fixed at the bound and the others solved again.
+    """
+    ycomps = np.asarray(ycomps, dtype='float64')
+    ydat = np.asarray(ydat, dtype='float64')
+    npts, ncomps = ycomps.shape
+    lower = np.array([-np.inf if v is None else v for v in
+                      (minvals if minvals is not None else [None]*ncomps)],
+                     dtype='float64')
+    upper = np.array([np.inf if v is None else v for v in
+                      (maxvals if maxvals is not None else [None]*ncomps)],
+                     dtype='float64')
+
+    wts = np.zeros(ncomps)
+    fixed = np.zeros(ncomps, dtype=bool)
+    if np.all(np.isinf(lower)) and np.all(np.isinf(upper)):
+        pass
+    elif sum_to_one:
+        wts, fixed = _bounded_sum_solve(ycomps.T @ ycomps, ycomps.T @ ydat,
+                                        lower, upper)
+        wts[~fixed] = 0.0
+    else:
+        ret = lsq_linear(ycomps, ydat, bounds=(lower, upper), method='bvls')
+        fixed = ret.active_mask != 0
+        wts[fixed] = ret.x[fixed]
+
+    while True:
+        covar = np.zeros((ncomps, ncomps))
+        free = np.where(~fixed)[0]
+        afree = ycomps[:, free]
+        yfree = ydat - ycomps @ wts
+        jac = np.eye(len(free))
+        if sum_to_one and len(free) > 0:
+            # w[free[-1]] = 1 - sum(other weights)
+            yfree = yfree - afree[:, -1]*(1.0 - wts.sum())
+            afree = afree[:, :-1] - afree[:, -1:]
+            jac = np.vstack((np.eye(len(free)-1), -np.ones(len(free)-1)))
+        if afree.shape[1] > 0:
+            wfree = np.linalg.lstsq(afree, yfree, rcond=None)[0]
+            try:
+                covar[np.ix_(free, free)] = jac @ np.linalg.inv(afree.T @ afree) @ jac.T
+            except np.linalg.LinAlgError:
+                covar = None
+        else:
+            wfree = np.zeros(0)
+        if sum_to_one and len(free) > 0:
+            wfree = np.append(wfree, 1.0 - wts.sum() - wfree.sum())
+
+        # weights that leave their bounds are fixed at the bound, and the
+        # others solved again
+        out = (wfree < lower[free]) | (wfree > upper[free])
+        if not out.any():
+            break
+        iout = free[out]
+        wts[iout] = np.clip(wfree[out], lower[iout], upper[iout])
+        fixed[iout] = True
+    wts[free] = wfree
+    return wts, covar
+
+def _lincombo_result(params, ycomps, ydat, minvals, maxvals, sum_to_one):
+    """solve a linear combination fit with lincombo_solve(), returning the
+    results for the Parameters as an lmfit MinimizerResult"""
+    ncomps = ycomps.shape[1]
+    var_names = [name for name, par in params.items() if par.vary]
+    init_vals = [params[name].value for name in var_names]
+    wts, covar = lincombo_solve(ycomps, ydat, minvals=minvals,
+                                maxvals=maxvals, sum_to_one=sum_to_one)
+    for i in range(ncomps):
+        if params['c%i' % i].vary:
+            params['c%i' % i].value = wts[i]
+    if covar is not None:
+        index = [int(name[1:]) for name in var_names]
+        covar = covar[np.ix_(index, index)]
+
+    result = MinimizerResult(params=params, var_names=var_names,
+                             init_vals=init_vals, method='bvls',
+                             init_values=dict(zip(var_names, init_vals)),
+                             residual=ycomps @ wts - ydat, nfev=1,
+                             success=True, aborted=False, errorbars=False,
+                             message='Linear solution found.')
+    result.nvarys = len(var_names)
+    result.ndata = len(ydat)
+    result.nfree = result.ndata - result.nvarys
+    result.chisqr = (result.residual**2).sum()
+    result.redchi = result.chisqr / max(1, result.nfree)
+    chisqr = max(result.chisqr, 1.e-250*result.ndata)
+    _neg2_log_likel = result.ndata * np.log(chisqr / result.ndata)
+    result.aic = _neg2_log_likel + 2 * result.nvarys
+    result.bic = _neg2_log_likel + np.log(result.ndata) * result.nvarys
+
+    for par in params.values():
+        par.stderr, par.correl = 0, None
+    if covar is not None:
+        result.covar = covar = covar * result.redchi
+        result.errorbars = True
+        stderr = np.sqrt(np.diag(covar))
+        for ivar, name in enumerate(var_names):
+            par = params[name]
+            par.stderr = float(stderr[ivar])
+            par.correl = {}
+            result.errorbars = result.errorbars and (par.stderr > 0.0)
+            for jvar, name2 in enumerate(var_names):
+                if jvar != ivar and stderr[ivar]*stderr[jvar] > 0:
+                    par.correl[name2] = float(covar[ivar, jvar] /
+                                              (stderr[ivar]*stderr[jvar]))
+        result.uvars = params.create_uvars(covar=covar)
+    return result
+
 def lincombo_fit(group, components, weights=None, minvals=None,
                  maxvals=None, arrayname='norm', xmin=-np.inf, xmax=np.inf,
                  sum_to_one=True, vary_e0=False, max_ncomps=None):
@@ -135,17 +335,31 @@ def lincombo_fit(group, components, weights=None, minvals=None,
      3.  arrayname is expected to be one of `norm`, `mu`, `dmude`, or `chi`.
          It can be some other name but such named arrays should exist for all
          components and groups.
+     4.  with vary_e0=False, the fit is a linear problem and is solved
+         directly with lincombo_solve(), so that starting weights are not
+         used.  With vary_e0=True, lmfit.minimize() is used.
     """
 
     # first, gather components
-    ncomps = len(components)
     allgroups = [group]
     allgroups.extend(components)
     xdat, yall = groups2matrix(allgroups, yname=arrayname,
                                xname='energy', xmin=xmin, xmax=xmax)
 
-    ydat   = yall[0, :]
-    ycomps = yall[1:, :].transpose()
+    return _lincombo_fit_arrays(xdat, yall[0, :], yall[1:, :].transpose(),
+                                [get_label(c) for c in components],
+                                weights=weights, minvals=minvals,
+                                maxvals=maxvals, arrayname=arrayname,
+                                xmin=xmin, xmax=xmax, sum_to_one=sum_to_one,
+                                vary_e0=vary_e0)
+
+def _lincombo_fit_arrays(xdat, ydat, ycomps, labels, weights=None,
+                         minvals=None, maxvals=None, arrayname='norm',
+                         xmin=-np.inf, xmax=np.inf, sum_to_one=True,
+                         vary_e0=False):
+    """linear combination fit of ydat to the columns of ycomps, labeled
+    by labels, as for lincombo_fit()"""
+    ncomps = len(labels)
 
     # second use unconstrained linear algebra to estimate weights
     ls_out = np.linalg.lstsq(ycomps, ydat, rcond=-1)
@@ -182,14 +396,19 @@ def lincombo_fit(group, components, weights=None, minvals=None,
     expr = ['c%i' % i for i in range(ncomps)]
     params.add('total', expr='+'.join(expr))
 
-    result = lmfit.minimize(lincombo_resid, params, args=(xdat, ydat, ycomps))
+    if vary_e0:
+        result = lmfit.minimize(lincombo_resid, params,
+                                args=(xdat, ydat, ycomps))
+    else:
+        result = _lincombo_result(params, ycomps, ydat, minvals, maxvals,
+                                  sum_to_one)
 
     # gather results
     weights, weights_lstsq = {}, {}
     params, fcomps = {}, {}
     params['e0_shift'] = copy.deepcopy(result.params['e0_shift'])
     for i in range(ncomps):
-        label = get_label(components[i])
+        label = labels[i]
         weights[label] = result.params['c%i' % i].value
         params[label] = copy.deepcopy(result.params['c%i' % i])
         weights_lstsq[label] = ls_vals[i]
@@ -212,10 +431,80 @@ def lincombo_fit(group, components, weights=None, minvals=None,
                  arrayname=arrayname, rfactor=rfactor,
                  xmin=xmin, xmax=xmax)
 
+def _subset_solve(gram, atb, yty, subsets, sum_to_one=True):
+    """unconstrained least-squares solutions for subsets of components,
+    all of the same size, using the normal equations for all components
+
+    Arguments
+    ---------
+    gram        A^T A for all components, shape (ncomps, ncomps)
+    atb         A^T y for all components, shape (ncomps,)
+    yty         y^T y
+    subsets     integer array of component indices, shape (nsubsets, nx)
+    sum_to_one  bool, whether to force weights to sum to 1.0 [True]
+
+    Returns
+    -------
+    weights, chisqr  with shapes (nsubsets, nx) and (nsubsets,)
+    """
+    nsub, nx = subsets.shape
+    gsub = gram[subsets[:, :, np.newaxis], subsets[:, np.newaxis, :]]
+    bsub = atb[subsets]
+    mats, rhs = gsub, bsub
+    if sum_to_one:
+        # normal equations with a Lagrange multiplier for the sum
+        mats = np.ones((nsub, nx+1, nx+1))
+        mats[:, :nx, :nx] = gsub
+        mats[:, nx, nx] = 0.0
+        rhs = np.concatenate((bsub, np.ones((nsub, 1))), axis=1)
+    try:
+        wts = np.linalg.solve(mats, rhs[:, :, np.newaxis])
+    except np.linalg.LinAlgError:
+        wts = np.linalg.pinv(mats) @ rhs[:, :, np.newaxis]
+    wts = wts[:, :nx, 0]
+    chisqr = (yty - 2*(wts*bsub).sum(axis=1) +
+              np.einsum('ni,nij,nj->n', wts, gsub, wts))
+    return wts, chisqr
+
+def _lincombo_subsets_task(subsets, gram=None, atb=None, yty=None,
+                           lower=None, upper=None, sum_to_one=True):
+    """worker for lincombo_fitall(): solve subsets, solving again with
+    bounds those with any weight outside its bounds"""
+    wts, chisqr = _subset_solve(gram, atb, yty, subsets, sum_to_one=sum_to_one)
+    inside = np.all((wts >= lower[subsets]) & (wts <= upper[subsets]), axis=1)
+    for i in np.where(~inside)[0]:
+        subset = subsets[i]
+        gsub, bsub = gram[np.ix_(subset, subset)], atb[subset]
+        if sum_to_one:
+            wt = _bounded_sum_solve(gsub, bsub, lower[subset], upper[subset])[0]
+        else:
+            wt = nnls_gram(gsub, bsub[:, np.newaxis])[0][:, 0]
+        wts[i] = wt
+        chisqr[i] = yty - 2*(wt @ bsub) + wt @ gsub @ wt
+    return subsets, wts, chisqr
+
+def _lincombo_fitall_task(subset, xdat=None, ydat=None, ycomps=None,
+                          labels=None, minvals=None, maxvals=None, **kws):
+    "worker for lincombo_fitall(): fit one subset of components"
+    subset = list(subset)
+    return _lincombo_fit_arrays(xdat, ydat, ycomps[:, subset],
+                                [labels[i] for i in subset],
+                                weights=[1.0/len(subset)]*len(subset),
+                                minvals=[minvals[i] for i in subset],
+                                maxvals=[maxvals[i] for i in subset], **kws)
+
+def _pool_map(func, tasks, nworkers=1):
+    "map func over tasks, with a process pool if nworkers > 1"
+    if nworkers > 1 and len(tasks) > 1:
+        with mp.Pool(min(nworkers, len(tasks))) as pool:
+            return pool.map(func, tasks)
+    return [func(task) for task in tasks]
+
 def lincombo_fitall(group, components, weights=None, minvals=None, maxvals=None,
                     arrayname='norm', xmin=-np.inf, xmax=np.inf,
                     max_ncomps=None, sum_to_one=True, vary_e0=False,
-                    min_weight=0.0005, max_output=16):
+                    min_weight=0.0005, max_output=16, nworkers=1,
+                    chunksize=5000):
     """perform linear combination fittings for a group with all combinations
     of 2 or more of the components given
 
@@ -234,6 +523,8 @@ def lincombo_fitall(group, components, weights=None, minvals=None, maxvals=None,
       vary_e0     bool, whether to vary e0 for data in fit [False]
       min_weight  float, minimum weight for each component to save result [0.0005]
       max_output  int, max number of outputs, sorted by reduced chi-square [16]
+      nworkers    int, number of processes to use [1]
+      chunksize   int, number of combinations solved together [5000]
     Returns
     -------
      list of groups with resulting weights and fit statistics, ordered by
@@ -244,54 +535,252 @@ def lincombo_fitall(group, components, weights=None, minvals=None, maxvals=None,
      1.  The names of Group members for the components must match those of the
          group to be fitted.
      2.  arrayname can be one of `norm` or `dmude`
+     3.  The components are interpolated onto the data once.  With
+         vary_e0=False, all minvals of 0 and maxvals that cannot be
+         reached, every combination is solved from the normal equations
+         of all components, without bounds or, for combinations with any
+         weight outside its bounds, with non-negative weights.  Only the
+         best max_output distinct combinations are then fit with
+         lincombo_fit(), giving the same results.
+     4.  Otherwise, all combinations are fit with bounds, using nworkers
+         processes.
     """
 
     ncomps = len(components)
+    labels = [get_label(c) for c in components]
 
-    # here we save the inputs weights and bounds for each component by name
-    # so they can be imposed for the individual fits
-    _save = {}
-
-    if weights in (None, [None]*ncomps):
+    if weights is None:
         weights = [None]*ncomps
-    if minvals in (None, [None]*ncomps):
+    if minvals is None:
         minvals = -np.inf * np.ones(ncomps)
-    if maxvals in (None, [None]*ncomps):
+    if maxvals is None:
         maxvals = np.inf * np.ones(ncomps)
-
-    for i in range(ncomps):
-        _save[get_label(components[i])] = (weights[i], minvals[i], maxvals[i])
+    lower = np.array([-np.inf if v is None else v for v in minvals],
+                     dtype='float64')
+    upper = np.array([np.inf if v is None else v for v in maxvals],
+                     dtype='float64')
 
     if max_ncomps is None:
         max_ncomps = ncomps
     elif max_ncomps > 0:
         max_ncomps = int(min(max_ncomps, ncomps))
-    out = []
-    nrejected = 0
-    comps_kept = []
+
+    allgroups = [group]
+    allgroups.extend(components)
+    xdat, yall = groups2matrix(allgroups, yname=arrayname,
+                               xname='energy', xmin=xmin, xmax=xmax)
+    ydat = yall[0, :]
+    ycomps = yall[1:, :].transpose()
+
+    # combinations can be solved from the normal equations when the only
+    # bounds reached are lower bounds of 0
+    max_weight = 1.0 if sum_to_one else np.inf
+    solve_normal = (not vary_e0 and np.all(lower == 0) and
+             np.all(upper >= max_weight))
+
+    # all combinations, in chunks of one size
+    tasks = []
     for nx in range(2, int(max_ncomps)+1):
-        for comps in combinations(components, nx):
-            labs = [get_label(c) for c in comps]
-            _wts = [1.0/nx for lab in labs]
-            _min = [_save[lab][1] for lab in labs]
-            _max = [_save[lab][2] for lab in labs]
-
-            ret = lincombo_fit(group, comps, weights=_wts,
-                               arrayname=arrayname, minvals=_min,
-                               maxvals=_max, xmin=xmin, xmax=xmax,
-                               sum_to_one=sum_to_one, vary_e0=vary_e0)
-
-            _sig_comps = []
-            for key, wt in ret.weights.items():
-                if wt > min_weight:
-                    _sig_comps.append(key)
-            _sig_comps.sort()
-            if _sig_comps not in comps_kept:
-                comps_kept.append(_sig_comps)
-                out.append(ret)
-            else:
-                nrejected += 1
+        subsets = combinations(range(ncomps), nx)
+        while True:
+            chunk = np.array(list(islice(subsets, chunksize)), dtype=int)
+            if len(chunk) == 0:
+                break
+            tasks.append(chunk)
+
+    def sig_comps(subset, wts):
+        return tuple(sorted(labels[i] for i, wt in zip(subset, wts)
+                            if wt > min_weight))
+
+    fit_kws = dict(xdat=xdat, ydat=ydat, ycomps=ycomps, labels=labels,
+                   minvals=minvals, maxvals=maxvals, arrayname=arrayname,
+                   xmin=xmin, xmax=xmax, sum_to_one=sum_to_one,
+                   vary_e0=vary_e0)
+    comps_kept = set()
+    if not solve_normal:
+        subsets = [tuple(s) for chunk in tasks for s in chunk]
+        out = []
+        for fit in _pool_map(partial(_lincombo_fitall_task, **fit_kws),
+                             subsets, nworkers=nworkers):
+            key = sig_comps(range(ncomps), [fit.weights.get(lab, 0)
+                                            for lab in labels])
+            if key not in comps_kept:
+                comps_kept.add(key)
+                out.append(fit)
+        return sorted(out, key=lambda x: x.redchi)[:max_output]
+
+    task_kws = dict(gram=ycomps.T @ ycomps, atb=ycomps.T @ ydat,
+                    yty=ydat @ ydat, lower=lower, upper=upper,
+                    sum_to_one=sum_to_one)
+    found = _pool_map(partial(_lincombo_subsets_task, **task_kws), tasks,
+                      nworkers=nworkers)
+
+    # sort by reduced chi-square, fitting only the best
+    npts = len(ydat)
+    best = []
+    for subsets, wts, chisqr in found:
+        nfree = npts - subsets.shape[1] + (1 if sum_to_one else 0)
+        for subset, wt, chi2 in zip(subsets, wts, chisqr):
+            key = sig_comps(subset, wt)
+            if key not in comps_kept:
+                comps_kept.add(key)
+                best.append((chi2/max(1, nfree), tuple(subset)))
+    best = sorted(best)[:max_output]
+    return [_lincombo_fitall_task(subset, **fit_kws) for redchi, subset in best]
+
+def map_chunks(func, spectra, nworkers=1, chunk_bytes=2**26, **kws):
+    """apply a function to chunks of an array of spectra, split along
+    its first axis, returning the list of results for the chunks
+
+    Arguments
+    ---------
+      func         function taking a chunk of spectra as its first argument
+      spectra      array of spectra, or HDF5 dataset, shape (n0, ..., npts)
+      nworkers     int, number of processes to use [1]
+      chunk_bytes  approximate size in bytes of spectra read at one time [2**26]
+      kws          keyword arguments passed to func
+    """
+    shape = spectra.shape
+    itemsize = np.dtype(getattr(spectra, 'dtype', 'float64')).itemsize
+    nrows = max(1, int(chunk_bytes/(itemsize*int(np.prod(shape[1:])))))
+    chunks = [(i0, min(shape[0], i0+nrows)) for i0 in range(0, shape[0], nrows)]
+    if nworkers < 2 or len(chunks) < 2:
+        return [func(np.asarray(spectra[i0:i1]), **kws) for i0, i1 in chunks]
+
+    pending, results = [], []
+    with mp.Pool(min(nworkers, len(chunks))) as pool:
+        for i0, i1 in chunks:
+            pending.append(pool.apply_async(func, (np.asarray(spectra[i0:i1]),),
+                                            kws))
+            # limit the number of chunks in memory
+            if len(pending) > 2*nworkers:
+                results.append(pending.pop(0).get())
+        results.extend([task.get() for task in pending])
+    return results
+
+def _lincombo_map_rows(data, xsel=None, ycomps=None, lower=None, upper=None,
+                       sum_to_one=True, method='lstsq', proj=None, gram=None):
+    """linear combination fit of a chunk of spectra [..., npts], returning
+    weights [..., ncomps], chi-square and R-factor [...]"""
+    data = np.asarray(data, dtype='float64')[..., xsel]
+    shape, (npts, ncomps) = data.shape[:-1], ycomps.shape
+    ydat = data.reshape(-1, npts)
+    ok = np.ones(len(ydat), dtype=bool)
+    if method == 'lstsq':
+        if sum_to_one:
+            wts = (ydat - ycomps[:, -1]) @ proj.T
+            wts = np.column_stack((wts, 1.0 - wts.sum(axis=1)))
+        else:
+            wts = ydat @ proj.T
+    elif method == 'nnls':
+        # weights above the lower bounds, solved from the normal equations
+        atb = ycomps.T @ (ydat - ycomps @ lower).T
+        total = (1.0 - lower.sum()) if sum_to_one else None
+        shifted, ok = nnls_gram(gram, atb, total=total)
+        wts = shifted.T + lower
+    else:
+        wts = np.zeros((len(ydat), ncomps))
+        ok[:] = False
+
+    # solve separately any spectra not solved within bounds
+    tol = 1.e-9
+    ok &= np.all((wts > lower-tol) & (wts < upper+tol), axis=1)
+    if sum_to_one:
+        ok &= abs(wts.sum(axis=1) - 1.0) < tol
+    for i in np.where(~ok)[0]:
+        wts[i] = lincombo_solve(ycomps, ydat[i], minvals=lower,
+                                maxvals=upper, sum_to_one=sum_to_one)[0]
+
+    chisqr = ((ydat - wts @ ycomps.T)**2).sum(axis=1)
+    rfactor = chisqr / np.maximum((ydat**2).sum(axis=1), 1.e-300)
+    return (wts.reshape(shape + (ncomps,)), chisqr.reshape(shape),
+            rfactor.reshape(shape))
 
-    # sort outputs by reduced chi-square
-    # print("lin combo : ", len(out), nrejected, max_output)
-    return sorted(out, key=lambda x: x.redchi)[:max_output]
+def lincombo_fitmap(spectra, energy, components, minvals=None, maxvals=None,
+                    arrayname='norm', xmin=-np.inf, xmax=np.inf,
+                    sum_to_one=True, nworkers=1, chunk_bytes=2**26):
+    """perform linear combination fitting for many spectra on a common
+    energy grid, such as a XANES map or a time series
+
+    Arguments
+    ---------
+      spectra     array of spectra, shape (nspectra, npts) or (ny, nx, npts).
+                  This can be an HDF5 dataset, which will be read in chunks.
+      energy      array of energies for the spectra, shape (npts,)
+      components  List of groups to use as components (see Note 1)
+      minvals     array of min weights (or None to mean -inf)
+      maxvals     array of max weights (or None to mean +inf)
+      arrayname   string of array name for components (see Note 1) ['norm']
+      xmin        x-value for start of fit range [-inf]
+      xmax        x-value for end of fit range [+inf]
+      sum_to_one  bool, whether to force weights to sum to 1.0 [True]
+      nworkers    int, number of processes to use [1]
+      chunk_bytes approximate size in bytes of spectra read at one time [2**26]
+
+    Returns
+    -------
+      group with members
+         x         energies used in the fit
+         labels    component labels
+         weights   dict of weight maps for each component label, with
+                   the shape of spectra without the energy axis
+         chisqr    map of sum of squared residuals
+         rfactor   map of R-factor, chisqr / sum(spectrum**2)
+
+    Notes
+    -----
+     1.  spectra must hold the same kind of data as the arrayname member of
+         the components (`norm`, `mu`, or `dmude`), which are interpolated
+         onto the energies of the spectra.
+     2.  The fit is factored once for all spectra.  Without bounds, a
+         pseudo-inverse gives the weights for all spectra in a chunk at
+         once.  With finite minvals for all components, the weights above
+         minvals are found for all spectra in a chunk together with
+         nnls_gram().  Any spectra not solved within bounds this way are
+         fit with lincombo_solve().
+     3.  Results are the same as for lincombo_fit() with vary_e0=False.
+    """
+    ncomps = len(components)
+    labels = [get_label(c) for c in components]
+    energy = np.asarray(energy, dtype='float64')
+    if spectra.shape[-1] != len(energy):
+        raise ValueError("lincombo_fitmap() needs spectra with shape (..., len(energy))")
+    imin = index_of(energy, xmin) if xmin is not None else None
+    imax = index_of(energy, xmax) + 1 if xmax is not None else None
+    xsel = slice(imin, imax)
+    xdat = energy[xsel]
+    ycomps = []
+    for comp in components:
+        x, y = get_arrays(comp, arrayname)
+        if x is None or y is None:
+            raise ValueError("cannot get arrays for arrayname='%s'" % arrayname)
+        ycomps.append(interp(x, y, xdat, kind='cubic'))
+    ycomps = np.array(ycomps).transpose()
+
+    if minvals is None:
+        minvals = [None]*ncomps
+    if maxvals is None:
+        maxvals = [None]*ncomps
+    lower = np.array([-np.inf if v is None else v for v in minvals],
+                     dtype='float64')
+    upper = np.array([np.inf if v is None else v for v in maxvals],
+                     dtype='float64')
+
+    solver = dict(xsel=xsel, ycomps=ycomps, lower=lower, upper=upper,
+                  sum_to_one=sum_to_one, method='bvls')
+    if np.all(np.isinf(lower)) and np.all(np.isinf(upper)):
+        solver['method'] = 'lstsq'
+        if sum_to_one:
+            solver['proj'] = np.linalg.pinv(ycomps[:, :-1] - ycomps[:, -1:])
+        else:
+            solver['proj'] = np.linalg.pinv(ycomps)
+    elif np.all(np.isfinite(lower)):
+        solver.update(method='nnls', gram=ycomps.T @ ycomps)
+
+    results = map_chunks(_lincombo_map_rows, spectra, nworkers=nworkers,
+                         chunk_bytes=chunk_bytes, **solver)
+    wts, chisqr, rfactor = [np.concatenate(r, axis=0) for r in zip(*results)]
+    return Group(x=xdat, arrayname=arrayname, labels=labels,
+                 weights={lab: wts[..., i] for i, lab in enumerate(labels)},
+                 chisqr=chisqr, rfactor=rfactor, xmin=xmin, xmax=xmax,
+                 sum_to_one=sum_to_one)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+Non-negative least-squares for many right-hand sides at once
+"""
+import numpy as np
+from scipy.optimize import nnls
+
+def nnls_gram(gram, atb, maxiter=None, blocksize=4096, total=None):
+    """non-negative least-squares solutions for many right-hand sides,
+    given the normal equations of the problems min |A x - b|, x >= 0
+
+    Arguments:
+    ----------
+      gram     A^T A, shape (ncomps, ncomps)
+      atb      A^T b for each right-hand side, shape (ncomps, nrhs)
+      maxiter  maximum number of pivoting iterations [None: 5*ncomps]
+      blocksize  number of right-hand sides solved together [4096]
+      total    if not None, the sum of x for each solution [None]
+
+    Returns:
+    ---------
+      x, converged:  solutions, shape (ncomps, nrhs), and a boolean array
+      of length nrhs, True where the solution was found in maxiter steps.
+
+    Notes:
+    ------
+      Uses block principal pivoting (Kim and Park, SIAM J. Sci. Comput.
+      33, 3261 (2011)).  Right-hand sides with the same passive set share
+      one inverse of the corresponding part of A^T A, and all right-hand
+      sides are updated together.  With total given, the equality
+      constraint is added to the normal equations with a Lagrange
+      multiplier, and pivoting starts with all values passive.
+    """
+    gram = np.asarray(gram, dtype='float64')
+    atb = np.asarray(atb, dtype='float64')
+    ncomps, nrhs = atb.shape
+    if maxiter is None:
+        maxiter = 5*ncomps
+    nsize = ncomps if total is None else ncomps+1
+
+    def solve(cols, passive):
+        """solve for x and y with one inverse for each distinct passive
+        set: the inverse of A^T A restricted to the passive set, padded
+        to full size, gives x with zeros outside the passive set."""
+        sets, inverse = np.unique(passive.T, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        mats = np.zeros((len(sets), nsize, nsize))
+        mats[:, :ncomps, :ncomps] = gram * (sets[:, :, np.newaxis] &
+                                            sets[:, np.newaxis, :])
+        mats[:, np.arange(ncomps), np.arange(ncomps)] += ~sets
+        if total is not None:
+            mats[:, ncomps, :ncomps] = mats[:, :ncomps, ncomps] = sets
+        try:
+            invs = np.linalg.inv(mats)
+        except np.linalg.LinAlgError:
+            invs = np.linalg.pinv(mats, hermitian=True)
+        for i0 in range(0, len(cols), blocksize):
+            bcols = cols[i0:i0+blocksize]
+            rhs = np.zeros((nsize, len(bcols)))
+            rhs[:ncomps] = atb[:, bcols] * passive[:, i0:i0+blocksize]
+            if total is not None:
+                rhs[ncomps] = total
+            xs = np.einsum('cij,jc->ic', invs[inverse[i0:i0+blocksize]], rhs)
+            grad = gram @ xs[:ncomps] - atb[:, bcols]
+            if total is not None:
+                grad += xs[ncomps]
+            x[:, bcols] = xs[:ncomps]
+            y[:, bcols] = grad * ~passive[:, i0:i0+blocksize]
+
+    x = np.zeros((ncomps, nrhs))
+    y = -atb.copy()
+    passive = np.zeros((ncomps, nrhs), dtype=bool)
+    if total is not None:
+        passive[:] = True
+        solve(np.arange(nrhs), passive)
+    alpha = np.full(nrhs, 3, dtype=int)
+    beta = np.full(nrhs, ncomps+1, dtype=int)
+    active = np.arange(nrhs)
+    for niter in range(maxiter):
+        infeas = ((x[:, active] < 0) & passive[:, active]) | \
+                 ((y[:, active] < 0) & ~passive[:, active])
+        ninf = infeas.sum(axis=0)
+        keep = ninf > 0
+        active, infeas, ninf = active[keep], infeas[:, keep], ninf[keep]
+        if len(active) == 0:
+            break
+        # full exchange while the number of infeasible values decreases,
+        # with a backup rule of exchanging only the last infeasible value
+        fewer = ninf < beta[active]
+        beta[active[fewer]] = ninf[fewer]
+        alpha[active[fewer]] = 3
+        tries = ~fewer & (alpha[active] >= 1)
+        alpha[active[tries]] -= 1
+        backup = ~fewer & ~tries
+        if backup.any():
+            last = ncomps - 1 - np.argmax(infeas[::-1, backup], axis=0)
+            infeas[:, backup] = False
+            infeas[last, np.where(backup)[0]] = True
+        passive[:, active] ^= infeas
+        solve(active, passive[:, active])
+    else:
+        infeas = ((x[:, active] < 0) & passive[:, active]) | \
+                 ((y[:, active] < 0) & ~passive[:, active])
+        active = active[infeas.any(axis=0)]
+
+    converged = np.ones(nrhs, dtype=bool)
+    converged[active] = False
+    return x, converged
+
+def nnls_batch(a, b, maxiter=None):
+    """non-negative least-squares, min |a x - b| with x >= 0, for
+    many right-hand sides b at once.
+
+    Arguments:
+    ----------
+      a        matrix, shape (nobs, ncomps)
+      b        right-hand sides, shape (nobs, nrhs)
+      maxiter  maximum number of pivoting iterations [None: 5*ncomps]
+
+    Returns:
+    ---------
+      x: solutions, shape (ncomps, nrhs)
+
+    Notes:
+    ------
+      Uses nnls_gram() for all right-hand sides, with scipy.optimize.nnls
+      for any right-hand side that does not converge.
+    """
+    a = np.asarray(a, dtype='float64')
+    b = np.asarray(b, dtype='float64')
+    oned = (b.ndim == 1)
+    if oned:
+        b = b[:, np.newaxis]
+    x, converged = nnls_gram(a.T @ a, a.T @ b, maxiter=maxiter)
+    for i in np.where(~converged)[0]:
+        x[:, i] = nnls(a, b[:, i])[0]
+    return x[:, 0] if oned else x
@@ -6,16 +6,15 @@ import os
 import sys
 import time
 import json
+import importlib.util
+from gzip import GzipFile
 from itertools import combinations
 
 import numpy as np
 from numpy.random import randint
 
-try:
-    from sklearn.decomposition import PCA
-    HAS_SKLEARN = True
-except ImportError:
-    HAS_SKLEARN = False
+# scikit-learn is imported when needed, as it is slow to import
+HAS_SKLEARN = importlib.util.find_spec('sklearn') is not None
 
 from lmfit import minimize, Parameters
 
@@ -23,7 +22,7 @@ from .. import Group
 from .utils import interp, index_of
 from larch.utils import str2bytes, bytes2str, read_textfile
 
-from .lincombo_fitting import get_arrays, get_label, groups2matrix
+from .lincombo_fitting import get_arrays, get_label, groups2matrix, map_chunks
 
 
 def nmf_train(groups, arrayname='norm', xmin=-np.inf, xmax=np.inf,
@@ -50,6 +49,10 @@ def nmf_train(groups, arrayname='norm', xmin=-np.inf, xmax=np.inf,
     """
     xdat, ydat = groups2matrix(groups, arrayname, xmin=xmin, xmax=xmax)
 
+    if not HAS_SKLEARN:
+        raise ImportError("scikit-learn not installed")
+    from sklearn.decomposition import NMF
+
     ydat[np.where(ydat<0)] = 0
     opts = dict(n_components=len(groups), solver=solver)
     if solver == 'mu':
@@ -85,6 +88,7 @@ def pca_train_sklearn(groups, arrayname='norm', xmin=-np.inf, xmax=np.inf):
     xdat, ydat = groups2matrix(groups, arrayname, xmin=xmin, xmax=xmax)
     if not HAS_SKLEARN:
         raise ImportError("scikit-learn not installed")
+    from sklearn.decomposition import PCA
 
     ret = PCA().fit(ydat)
     labels = [get_label(g) for g  in groups]
@@ -113,15 +117,51 @@ def pca_athena(groups, arrayname='norm', subtract_mean=True,
     evec = np.dot(data, var)[:, iorder]
     return evec, evals
 
-def pca_train(groups, arrayname='norm', xmin=-np.inf, xmax=np.inf):
+def _pca_normalize(ydat, ymean):
+    """spectra [nspectra, nfreq] with the mean spectrum removed, and each
+    centered at 0 with unit standard deviation"""
+    ynorm = ydat - ymean
+    ynorm = ynorm - ynorm.mean(axis=1)[:, np.newaxis]
+    return ynorm / ynorm.std(axis=1)[:, np.newaxis]
+
+def _pca_ind(eigval, total, narr, nfreq):
+    """IND statistic, from the eigenvalues and the sum of all eigenvalues"""
+    nr = narr - 1 - np.arange(min(narr-1, len(eigval)))
+    tails = total - np.concatenate(([0], np.cumsum(eigval)))[:len(nr)]
+    ind = np.sqrt(nfreq*np.maximum(tails, 0)/nr)/nr**2
+    return np.concatenate((ind[:1], ind))
+
+def _pca_randomized(ynorm, ncomps, niter=4, oversample=10, seed=None):
+    """top singular values and left singular vectors of ynorm, found with
+    a randomized range finder (Halko, Martinsson and Tropp, SIAM Review
+    53, 217 (2011))"""
+    rng = np.random.default_rng(seed)
+    nfreq, narr = ynorm.shape
+    nsize = min(ncomps + oversample, nfreq, narr)
+    basis = ynorm @ rng.standard_normal((narr, nsize))
+    basis = np.linalg.qr(basis)[0]
+    for i in range(niter):
+        basis = np.linalg.qr(ynorm.T @ basis)[0]
+        basis = np.linalg.qr(ynorm @ basis)[0]
+    uvec, sval, _ = np.linalg.svd(basis.T @ ynorm, full_matrices=False)
+    return (basis @ uvec)[:, :ncomps], sval[:ncomps]
+
+def pca_train(groups, arrayname='norm', xmin=-np.inf, xmax=np.inf,
+              method='svd', ncomps=None, energy=None, chunksize=1000):
     """use a list of data groups to train a Principal Component Analysis
 
     Arguments
     ---------
-      groups      list of groups to use as components
+      groups      list of groups to use as components, or array of
+                  spectra (see Note 3)
       arrayname   string of array name to be fit (see Note 2) ['norm']
       xmin        x-value for start of fit range [-inf]
       xmax        x-value for end of fit range [+inf]
+      method      one of 'svd', 'randomized', 'streaming', or 'eigh' (see
+                  Note 4) ['svd']
+      ncomps      int or None: number of components to keep [None -> all]
+      energy      array of energies, for an array of spectra [None]
+      chunksize   number of spectra read at one time for 'streaming' [1000]
 
     Returns
     -------
@@ -132,36 +172,85 @@ def pca_train(groups, arrayname='norm', xmin=-np.inf, xmax=np.inf):
      1.  The group members for the components must match each other
          in data content and array names.
      2.  arrayname can be one of `norm` or `dmude`
+     3.  groups can also be an array of spectra with shape (nspectra, npts),
+         or an HDF5 dataset, with energy giving the energies of the spectra.
+     4.  methods:
+           'svd'         singular value decomposition of the spectra.
+           'randomized'  randomized truncated SVD, for the top ncomps
+                         components [default ncomps: 10].
+           'streaming'   reads an array of spectra in chunks of rows, and
+                         accumulates the (npts, npts) covariance, so that
+                         the spectra need not fit in memory.  The model
+                         ydat will be None.
+           'eigh'        eigenvalues of the (nspectra, nspectra) covariance.
+         all give the same model, except for the signs of components.
     """
-    xdat, ydat = groups2matrix(groups, arrayname, xmin=xmin, xmax=xmax)
-    labels = [get_label(g) for g  in groups]
-    narr, nfreq = ydat.shape
-
-    ymean = ydat.mean(axis=0)
-    ynorm = ydat - ymean
-
-    # normalize data to be centered at 0 with unit standard deviation
-    ynorm = (ynorm.T - ynorm.mean(axis=1)) / ynorm.std(axis=1)
-    eigval, eigvec_ = np.linalg.eigh(np.dot(ynorm.T, ynorm) / narr)
-    eigvec = (np.dot(ynorm, -eigvec_)/narr).T
-    eigvec, eigval = eigvec[::-1, :], eigval[::-1]
-
-    variances = eigval/eigval.sum()
+    if isinstance(groups, (list, tuple)):
+        xdat, ydat = groups2matrix(groups, arrayname, xmin=xmin, xmax=xmax)
+        labels = [get_label(g) for g  in groups]
+        xsel = slice(None)
+    else:
+        energy = np.asarray(energy, dtype='float64')
+        imin = index_of(energy, xmin) if xmin is not None else None
+        imax = index_of(energy, xmax) + 1 if xmax is not None else None
+        xsel = slice(imin, imax)
+        xdat, ydat = energy[xsel], groups
+        labels = ['spectrum%d' % (i+1) for i in range(len(groups))]
+    narr, nfreq = len(ydat), len(xdat)
+    method = method.lower()
+    if method == 'randomized' and ncomps is None:
+        ncomps = 10
+
+    if method == 'streaming':
+        ymean = np.zeros(nfreq)
+        for i0 in range(0, narr, chunksize):
+            ymean += np.asarray(ydat[i0:i0+chunksize])[:, xsel].sum(axis=0)
+        ymean = ymean/narr
+        covar = np.zeros((nfreq, nfreq))
+        for i0 in range(0, narr, chunksize):
+            ynorm = _pca_normalize(np.asarray(ydat[i0:i0+chunksize])[:, xsel],
+                                   ymean)
+            covar += ynorm.T @ ynorm
+        sval2, uvec = np.linalg.eigh(covar)
+        nkeep = min(narr, nfreq)
+        uvec = uvec[:, ::-1][:, :nkeep]
+        sval = np.sqrt(np.maximum(sval2[::-1][:nkeep], 0))
+        total = np.trace(covar)/narr
+        ydat = None
+    else:
+        if not isinstance(groups, (list, tuple)):
+            ydat = np.asarray(ydat[:, xsel], dtype='float64')
+        ymean = ydat.mean(axis=0)
+        ynorm = _pca_normalize(ydat, ymean).T
+        total = (ynorm**2).sum()/narr
+        if method == 'eigh':
+            eigval, eigvec_ = np.linalg.eigh(np.dot(ynorm.T, ynorm) / narr)
+            eigvec = (np.dot(ynorm, -eigvec_)/narr).T
+            eigvec, eigval = eigvec[::-1, :], eigval[::-1]
+        elif method == 'randomized':
+            uvec, sval = _pca_randomized(ynorm, ncomps)
+        else:
+            uvec, sval = np.linalg.svd(ynorm, full_matrices=False)[:2]
+
+    if method != 'eigh':
+        # components as from eigh, with the largest value of each positive
+        eigval = sval**2/narr
+        eigvec = (uvec*sval).T/narr
+        imax = np.argmax(abs(eigvec), axis=1)
+        eigvec *= np.sign(eigvec[np.arange(len(eigvec)), imax])[:, np.newaxis]
+    if ncomps is not None:
+        eigvec, eigval = eigvec[:ncomps], eigval[:ncomps]
+
+    variances = eigval/total
 
     # calculate IND statistic
-    ind = None
-    for r in range(narr-1):
-        nr = narr - r - 1
-        indval = np.sqrt(nfreq*eigval[r:].sum()/nr)/nr**2
-        if ind is None:
-            ind = [indval]
-        ind.append(indval)
-    ind = np.array(ind)
+    ind = _pca_ind(eigval, total, narr, nfreq)
 
     nsig = int(np.argmin(ind))
     return Group(x=xdat, arrayname=arrayname, labels=labels, ydat=ydat,
                  xmin=xmin, xmax=xmax, mean=ymean, components=eigvec,
-                 eigenvalues=eigval, variances=variances, ind=ind, nsig=nsig)
+                 eigenvalues=eigval, variances=variances, ind=ind, nsig=nsig,
+                 nspectra=narr, method=method)
 
 
 def save_pca_model(pca_model, filename):
@@ -180,7 +269,7 @@ def read_pca_model(filename):
     text = read_textfile(filename)
     lines = text.split('\n')
     if not lines[0].startswith('##Larch PCA Model'):
-        raise ValueError(f"Invalid Larch PCA Model: '{fname:s}'")
+        raise ValueError(f"Invalid Larch PCA Model: '{filename:s}'")
     return decode4js(json.loads(lines[1]))
 
 
@@ -195,20 +284,25 @@ def pca_statistics(pca_model):
 
       F1R(r) = eigv[r] / (p+1-r)*(n+1-r) / sum_i=r^n-1 (eigv[i] / ((p+1-i)*(n+1-i)))
     """
-    p, n = pca_model.ydat.shape
-    eigv = pca_model.eigenvalues
-    ind, f1r = [], []
-    for r in range(n-1):
-        nr = n-r-1
-        ind.append( np.sqrt(eigv[r:].sum()/ (p*nr))/nr**2)
-        f1sum = 0
-        for i in range(r, n):
-            f1sum += eigv[i]/((p+1-i)*(n+1-i))
-        f1sum = max(1.e-10, f1sum)
-        f1r.append(eigv[r] / (max(1, (p+1-r)*(n-r+1)) * f1sum))
-
-    pca_model.ind = np.array(ind)
-    pca_model.f1r = np.array(f1r)
+    if pca_model.ydat is not None:
+        p, n = pca_model.ydat.shape
+    else:
+        p, n = pca_model.nspectra, len(pca_model.x)
+    eigv = np.zeros(max(n, len(pca_model.eigenvalues)))
+    eigv[:len(pca_model.eigenvalues)] = pca_model.eigenvalues
+    r = np.arange(n-1)
+    nr = n - r - 1
+    tails = np.cumsum(eigv[::-1])[::-1]
+    ind = np.sqrt(tails[r]/(p*nr))/nr**2
+
+    i = np.arange(n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f1terms = eigv[i]/((p+1-i)*(n+1-i))
+    f1sum = np.maximum(1.e-10, np.cumsum(f1terms[::-1])[::-1][r])
+    f1r = eigv[r] / (np.maximum(1, (p+1-r)*(n-r+1)) * f1sum)
+
+    pca_model.ind = ind
+    pca_model.f1r = f1r
 
     return pca_model.ind, pca_model.f1r
 
@@ -284,3 +378,91 @@ def pca_fit(group, pca_model, ncomps=None, rescale=True):
                              pca_model=pca_model, chi_square=chi2[0],
                              data_scale=scale, weights=weights)
     return
+
+
+def _pca_map_rows(data, xsel=None, interp_op=None, comps=None, proj=None,
+                  mean=None, rescale=True):
+    """fit a chunk of spectra [..., npts] to PCA components, returning
+    weights [..., ncomps], and scale, chi-square and R-factor [...]"""
+    data = np.asarray(data, dtype='float64')[..., xsel]
+    shape = data.shape[:-1]
+    ydat = data.reshape(-1, data.shape[-1]) @ interp_op.T
+    scale = np.ones(len(ydat))
+    if rescale:
+        # minimize |scale*y - mean - comps @ w| for scale and w together
+        ydiff = ydat - ydat @ proj.T @ comps.T
+        mdiff = mean - comps @ (proj @ mean)
+        denom = (ydiff*ydat).sum(axis=1)
+        good = denom > 1.e-12*(ydat**2).sum(axis=1)
+        scale[good] = ((ydiff @ mdiff)[good]) / denom[good]
+        scale = np.maximum(scale, 0.0)
+    ydat = ydat*scale[:, np.newaxis]
+    weights = (ydat - mean) @ proj.T
+    chisqr = ((ydat - mean - weights @ comps.T)**2).sum(axis=1)
+    rfactor = chisqr / np.maximum((ydat**2).sum(axis=1), 1.e-300)
+    return (weights.reshape(shape + (-1,)), scale.reshape(shape),
+            chisqr.reshape(shape), rfactor.reshape(shape))
+
+
+def pca_fitmap(spectra, energy, pca_model, ncomps=None, rescale=True,
+               nworkers=1, chunk_bytes=2**26):
+    """
+    fit many spectra on a common energy grid, such as a XANES map or a
+    time series, to a PCA training model from pca_train()
+
+    Arguments
+    ---------
+      spectra     array of spectra, shape (nspectra, npts) or (ny, nx, npts).
+                  This can be an HDF5 dataset, which will be read in chunks.
+      energy      array of energies for the spectra, shape (npts,)
+      pca_model   PCA model as found from pca_train()
+      ncomps      number of components to included
+      rescale     whether to allow data to be renormalized (True)
+      nworkers    int, number of processes to use [1]
+      chunk_bytes approximate size in bytes of spectra read at one time [2**26]
+
+    Returns
+    -------
+      group with members
+
+          x          x or energy value from model
+          weights    array of weights for PCA components, with the shape of
+                     spectra with the energy axis replaced by ncomps
+          data_scale map of scale factors for the spectra
+          chi_square map of sum of squared residuals
+          rfactor    map of R-factor, chi_square / sum(scaled spectrum**2)
+          pca_model  the input PCA model
+
+    Notes
+    -----
+      The interpolation of spectra onto `x` and the fit are each factored
+      once for all spectra.  With rescale, the scale factor (held >= 0) and
+      weights are found together by linear least-squares, without the
+      iterative fit of pca_fit().
+    """
+    energy = np.asarray(energy, dtype='float64')
+    if spectra.shape[-1] != len(energy):
+        raise ValueError("pca_fitmap() needs spectra with shape (..., len(energy))")
+    xmin, xmax = pca_model.xmin, pca_model.xmax
+    imin = index_of(energy, xmin) if xmin is not None else None
+    imax = index_of(energy, xmax) + 1 if xmax is not None else None
+    xsel = slice(imin, imax)
+    xdat = energy[xsel]
+
+    # cubic interpolation onto the model x values is linear in the data
+    eye = np.identity(len(xdat))
+    interp_op = np.array([interp(xdat, row, pca_model.x, kind='cubic')
+                          for row in eye]).transpose()
+
+    if ncomps is None:
+        ncomps = len(pca_model.components)
+    comps = pca_model.components[:ncomps].transpose()
+    solver = dict(xsel=xsel, interp_op=interp_op, comps=comps,
+                  proj=np.linalg.pinv(comps), mean=pca_model.mean,
+                  rescale=rescale)
+    results = map_chunks(_pca_map_rows, spectra, nworkers=nworkers,
+                         chunk_bytes=chunk_bytes, **solver)
+    weights, scale, chisqr, rfactor = [np.concatenate(r, axis=0)
+                                       for r in zip(*results)]
+    return Group(x=pca_model.x, weights=weights, data_scale=scale,
+                 chi_square=chisqr, rfactor=rfactor, pca_model=pca_model)
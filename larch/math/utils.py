@@ -442,7 +442,10 @@ def polyfit(x, y, deg=1, reverse=False):
     including its ordering of coefficients
     """
     pfit = np.polynomial.Polynomial.fit(x, y, deg=int(deg))
-    coefs = pfit.convert().coef
+    # convert() drops trailing zero coefficients, as for y = 0
+    coefs = np.zeros(int(deg)+1)
+    pcoefs = pfit.convert().coef
+    coefs[:len(pcoefs)] = pcoefs
     if reverse:
         coefs = list(reversed(coefs))
     return coefs
@@ -3,12 +3,25 @@
 SymbolTable for Larch interpreter
 '''
 import copy
+from itertools import count
 
 import numpy
 
 from . import site_config
 from .utils import fixName, isValidName
 
+# version of symbol name resolution, incremented when a group that has
+# been in a symbol search path gains or loses a member.  Groups are marked
+# as having been in a search path by SymbolTable._fix_searchGroups().
+# next() of itertools.count is atomic, so that interpreters running in
+# different threads never miss an increment.
+_lookup_counter = count()
+_lookup_version = next(_lookup_counter)
+
+def _bump_lookup_version():
+    global _lookup_version
+    _lookup_version = next(_lookup_counter)
+
 class Group():
     """
     Generic Group: a container for variables, modules, and subgroups.
@@ -25,6 +38,16 @@ class Group():
         for key, val in kws.items():
             setattr(self, key, val)
 
+    def __setattr__(self, name, value):
+        if '_Group__searched' in self.__dict__ and name not in self.__dict__:
+            _bump_lookup_version()
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        if '_Group__searched' in self.__dict__:
+            _bump_lookup_version()
+        object.__delattr__(self, name)
+
     def __len__(self):
         return len(dir(self))
 
@@ -137,6 +160,45 @@ def isgroup(grp, *args):
     return ret
 
 
+class LazyModuleGroup(Group):
+    """Group with builtins from Python modules that are imported when a
+    member of the group is first needed.  It then becomes a normal Group.
+
+    loader(modname) should import the module and add its builtins to
+    the group, and do nothing for a module already loaded.
+    """
+    def __init__(self, name, modules, loader):
+        Group.__init__(self, name=name)
+        self.__dict__['_LazyModuleGroup__modules'] = list(modules)
+        self.__dict__['_LazyModuleGroup__loader'] = loader
+
+    def __load(self):
+        modules = self.__dict__.pop('_LazyModuleGroup__modules')
+        loader = self.__dict__.pop('_LazyModuleGroup__loader')
+        object.__setattr__(self, '__class__', Group)
+        for modname in modules:
+            loader(modname)
+
+    def __getattr__(self, attr):
+        if ('_LazyModuleGroup__modules' not in self.__dict__ or
+            (attr.startswith('__') and attr.endswith('__'))):
+            raise AttributeError(attr)
+        self.__load()
+        return getattr(self, attr)
+
+    def __dir__(self):
+        self.__load()
+        return self.__dir__()
+
+    def __copy__(self):
+        self.__load()
+        return self.__copy__()
+
+    def __deepcopy__(self, memo):
+        self.__load()
+        return self.__deepcopy__(memo)
+
+
 class InvalidName:
     """ used to create a value that will NEVER be a useful symbol.
     symboltable._lookup() uses this to check for invalid names"""
@@ -169,9 +231,15 @@ class SymbolTable(Group):
                 'create_group', 'new_group', 'isgroup',
                 'get_symbol', 'set_symbol',  'del_symbol',
                 'get_parent', '_path', '__parents')
+    # cache the groups in which symbol names are found, see _lookup()
+    use_lookup_cache = True
 
     def __init__(self, larch=None):
         Group.__init__(self, name=self.top_group)
+        # state of _lookup(): search groups and version for the cache of
+        # groups holding names, and parent groups of the last symbol
+        self.__lookup = {'groups': None, 'version': None, 'cache': {},
+                         'parents': []}
         self._larch = larch
         self._sys = None
         setattr(self, self.top_group, self)
@@ -297,6 +365,10 @@ class SymbolTable(Group):
                 sgroups.append(grp)
                 snames.append(name)
 
+        for grp in sgroups:
+            if isinstance(grp, Group):
+                grp.__dict__['_Group__searched'] = True
+
         self._sys.searchGroups = cache[2] = snames[:]
         sys.searchGroupObjects = cache[3] = sgroups[:]
         return sys.searchGroupObjects
@@ -307,7 +379,7 @@ class SymbolTable(Group):
         if obj is None:
             return
         out = []
-        for s in reversed(self.__parents):
+        for s in reversed(self.__lookup['parents']):
             if s.__name__ != '_main' or '_main' not in out:
                 out.append(s.__name__)
         out.reverse()
@@ -316,37 +388,54 @@ class SymbolTable(Group):
     def _lookup(self, name=None, create=False):
         """looks up symbol in search path
         returns symbol given symbol name,
-        creating symbol if needed (and create=True)"""
-        debug = False # not ('force'in name)
-        if debug:
-            print( '====\nLOOKUP ', name)
+        creating symbol if needed (and create=True)
+
+        The group in which a name is found is cached, until the search
+        groups change or one of them gains or loses a member.
+        """
         searchGroups = self._fix_searchGroups()
-        self.__parents = []
         if self not in searchGroups:
             searchGroups.append(self)
 
-        def public_attr(grp, name):
-            return (hasattr(grp, name)  and
-                    not (grp is self and name in self._private))
+        state = self.__lookup
+        cache = state['cache']
+        if (searchGroups is not state['groups'] or
+            state['version'] != _lookup_version):
+            cache.clear()
+            state['groups'] = searchGroups
+            state['version'] = _lookup_version
 
         parts = name.split('.')
+        top = parts[0]
+        # note that a simple name is taken from the first group that has
+        # it, but the start of a dotted name is taken from the last group
+        key = (top, len(parts) > 1)
+        grp = cache.get(key, None)
+        if grp is None:
+            grp = self.__find_group(top, searchGroups, first=len(parts) == 1)
+            if grp is not None and self.use_lookup_cache:
+                cache[key] = grp
+
+        # names not found may be in modules not yet loaded
+        load_module = getattr(self._larch, 'load_module', None)
+        while grp is None and load_module is not None and load_module():
+            grp = self.__find_group(top, searchGroups, first=len(parts) == 1)
+
         if len(parts) == 1:
-            for grp in searchGroups:
-                if public_attr(grp, name):
-                    self.__parents.append(grp)
-                    return getattr(grp, name)
+            if grp is not None:
+                state['parents'] = [grp]
+                return getattr(grp, top)
 
         # more complex case: not immediately found in Local or Module Group
+        parents = state['parents'] = []
         parts.reverse()
         top = parts.pop()
         out = self.__invalid_name
         if top == self.top_group:
             out = self
-        else:
-            for grp in searchGroups:
-                if public_attr(grp, top):
-                    self.__parents.append(grp)
-                    out = getattr(grp, top)
+        elif grp is not None:
+            parents.append(grp)
+            out = getattr(grp, top)
         if out is self.__invalid_name:
             raise NameError(f"'{name}' is not defined")
 
@@ -368,6 +457,23 @@ class SymbolTable(Group):
                     f"cannot locate member '{prt}' of '{out}'")
         return out
 
+    def __find_group(self, name, searchGroups, first=True):
+        """return first (or last) group in searchGroups with a public
+        attribute name, or None if not found.  Groups of modules not yet
+        loaded are searched without loading them."""
+        out = None
+        for grp in searchGroups:
+            if isinstance(grp, LazyModuleGroup):
+                found = name in grp.__dict__
+            else:
+                found = (hasattr(grp, name) and
+                         not (grp is self and name in self._private))
+            if found:
+                out = grp
+                if first:
+                    break
+        return out
+
     def has_symbol(self, symname):
         try:
             _ = self.get_symbol(symname)
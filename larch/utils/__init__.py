@@ -13,7 +13,7 @@ import logging
 from charset_normalizer import from_bytes
 from .gformat import gformat, getfloat_attr
 from .paths import uname, bindir, nativepath, unixpath, get_homedir, get_cwd
-from .debugtime import debugtime, debugtimer
+from .debugtime import debugtime, debugtimer, import_times, show_import_times
 
 from .strutils import (fixName, isValidName, isNumber, bytes2str,
                        str2bytes, fix_filename, fix_varname,
@@ -239,5 +239,6 @@ _larch_builtins = dict(copy=copy.copy, deepcopy=copy.deepcopy, more= _more,
                        cwd=cwd, group2dict=group2dict,
                        copy_group=copy_group, copy_xafs_group=copy_xafs_group,
                        dict2group=dict2group, debugtimer=debugtimer,
+                       show_import_times=show_import_times,
                        isotime=isotime, json_dump=json_dump,
                        json_load=json_load, gformat=gformat)
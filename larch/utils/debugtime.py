@@ -2,6 +2,7 @@
 
 import time
 import sys
+import subprocess
 
 class debugtime(object):
     def __init__(self, verbose=False, _larch=None):
@@ -72,3 +73,42 @@ def debugtimer(_larch=None):
       timer.show_report()
     """
     return debugtime(_larch=_larch)
+
+def import_times(modname='larch'):
+    """times to import a module and each of the modules it imports,
+    measured with 'python -X importtime' in a new process
+
+    Returns a list of (module name, total time, self time), with times
+    in seconds, sorted by decreasing total time.
+    """
+    cmd = [sys.executable, '-X', 'importtime', '-c', f'import {modname}']
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise ImportError(f"cannot import '{modname}':\n{proc.stderr}")
+    out = []
+    for line in proc.stderr.split('\n'):
+        words = line.replace('import time:', '', 1).split('|')
+        if not line.startswith('import time:') or len(words) != 3:
+            continue
+        try:
+            selftime, total = int(words[0])*1.e-6, int(words[1])*1.e-6
+        except ValueError:  # header line
+            continue
+        out.append((words[2].strip(), total, selftime))
+    return sorted(out, key=lambda x: -x[1])
+
+def show_import_times(modname='larch', nmax=30, _larch=None):
+    """show times to import a module and the slowest of the modules
+    it imports
+
+    Arguments:
+    ----------
+      modname   name of module to import ['larch']
+      nmax      maximum number of modules to show [30]
+    """
+    writer = sys.stdout if _larch is None else _larch.writer
+    times = import_times(modname)
+    writer.write("#      Total      Self   Module\n")
+    for name, total, selftime in times[:nmax]:
+        writer.write(f"  {total:9.4f} {selftime:9.4f}   {name}\n")
+    writer.flush()
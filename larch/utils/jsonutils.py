@@ -39,6 +39,9 @@ HAS_STATE['FeffDatFile'] = FeffDatFile
 HAS_STATE['FeffPathGroup'] = FeffPathGroup
 HAS_STATE['Journal'] = Journal
 
+# numpy dtype kinds that encode4js can save as binary arrays
+BINARY_DTYPE_KINDS = 'biufcSU'
+
 LarchGroupTypes = {'Group': Group,
                    'ParameterGroup': ParameterGroup,
                    'FeffitDataSet': FeffitDataSet,
@@ -48,16 +51,25 @@ LarchGroupTypes = {'Group': Group,
                    'FeffPathGroup': FeffPathGroup,
                    }
 
-def encode4js(obj):
+def encode4js(obj, arrays=None):
     """return an object ready for json encoding.
     has special handling for many Python types
       numpy array
       complex numbers
       Larch Groups
       Larch Parameters
+
+    If arrays is a list, numpy arrays of numbers or strings are appended
+    to it and encoded only as a reference to their index in that list,
+    so that they can be saved in binary form.
     """
     if obj is None:
         return None
+    if (arrays is not None and isinstance(obj, np.ndarray)
+        and obj.dtype.kind in BINARY_DTYPE_KINDS and obj.dtype.names is None):
+        arrays.append(obj)
+        return {'__class__': 'ArrayRef', 'index': len(arrays)-1,
+                '__shape__': obj.shape, '__dtype__': obj.dtype.str}
     if isinstance(obj, np.ndarray):
         out = {'__class__': 'Array', '__shape__': obj.shape,
                '__dtype__': obj.dtype.name}
@@ -66,7 +78,7 @@ def encode4js(obj):
         if 'complex' in obj.dtype.name:
             out['value'] = [(obj.real).tolist(), (obj.imag).tolist()]
         elif obj.dtype.name == 'object':
-            out['value'] = [encode4js(i) for i in out['value']]
+            out['value'] = [encode4js(i, arrays=arrays) for i in out['value']]
         return out
     elif isinstance(obj, (bool, np.bool_)):
         return bool(obj)
@@ -102,19 +114,21 @@ def encode4js(obj):
         return {'__class__': 'Slice', 'value': (obj.start, obj.stop, obj.step)}
 
     elif isinstance(obj, list):
-        return {'__class__': 'List', 'value': [encode4js(item) for item in obj]}
+        return {'__class__': 'List',
+                'value': [encode4js(item, arrays=arrays) for item in obj]}
     elif isinstance(obj, tuple):
         if hasattr(obj, '_fields'):  # named tuple!
             return {'__class__': 'NamedTuple',
                     '__name__': obj.__class__.__name__,
                     '_fields': obj._fields,
-                    'value': [encode4js(item) for item in obj]}
+                    'value': [encode4js(item, arrays=arrays) for item in obj]}
         else:
-            return {'__class__': 'Tuple', 'value': [encode4js(item) for item in obj]}
+            return {'__class__': 'Tuple',
+                    'value': [encode4js(item, arrays=arrays) for item in obj]}
     elif isinstance(obj, dict):
         out = {'__class__': 'Dict'}
         for key, val in obj.items():
-            out[encode4js(key)] = encode4js(val)
+            out[encode4js(key, arrays=arrays)] = encode4js(val, arrays=arrays)
         return out
     elif isinstance(obj, logging.Logger):
 
@@ -131,12 +145,12 @@ def encode4js(obj):
                      'lmdif_message', 'message', 'method', 'ndata', 'nfev',
                      'nfree', 'nvarys', 'params', 'redchi', 'residual',
                      'success', 'var_names'):
-            out[attr] = encode4js(getattr(obj, attr, None))
+            out[attr] = encode4js(getattr(obj, attr, None), arrays=arrays)
         return out
     elif isinstance(obj, Parameters):
         out = {'__class__': 'Parameters'}
         o_ast = obj._asteval
-        out['unique_symbols'] = {key: encode4js(o_ast.symtable[key])
+        out['unique_symbols'] = {key: encode4js(o_ast.symtable[key], arrays=arrays)
                                  for key in o_ast.user_defined_symbols()}
         out['params'] = [(p.name, p.__getstate__()) for p in obj.values()]
         return out
@@ -157,15 +171,15 @@ def encode4js(obj):
             parnames = dir(obj)
             for par in obj.__params__.keys():
                 if par in parnames:
-                    out[par] = encode4js(getattr(obj, par))
+                    out[par] = encode4js(getattr(obj, par), arrays=arrays)
         else:
             for item in dir(obj):
-                out[item] = encode4js(getattr(obj, item))
+                out[item] = encode4js(getattr(obj, item), arrays=arrays)
         return out
     elif hasattr(obj, '__getstate__') and not callable(obj):
         return {'__class__': 'StatefulObject',
                 '__type__': obj.__class__.__name__,
-                'value': encode4js(obj.__getstate__())}
+                'value': encode4js(obj.__getstate__(), arrays=arrays)}
     elif isinstance(obj, type):
         return {'__class__': 'Type',  'value': repr(obj),
                 'module': getattr(obj, '__module__', None)}
@@ -184,15 +198,17 @@ def encode4js(obj):
             thing = getattr(obj, attr)
             if not callable(thing):
                 # print("will try to encode thing ", thing, type(thing))
-                out[attr] = encode4js(thing)
+                out[attr] = encode4js(thing, arrays=arrays)
         return out
 
     return obj
 
-def decode4js(obj):
+def decode4js(obj, arrays=None):
     """
     return decoded Python object from encoded object.
 
+    arrays is the list (or any object supporting indexing) of arrays
+    used to decode array references written by encode4js(obj, arrays).
     """
     if not isinstance(obj, dict):
         return obj
@@ -206,18 +222,20 @@ def decode4js(obj):
     elif classname in ('List', 'Tuple', 'NamedTuple'):
         out = []
         for item in obj['value']:
-            out.append(decode4js(item))
+            out.append(decode4js(item, arrays=arrays))
         if classname == 'Tuple':
             out = tuple(out)
         elif classname == 'NamedTuple':
             out = namedtuple(obj['__name__'], obj['_fields'])(*out)
+    elif classname == 'ArrayRef':
+        out = arrays[obj['index']]
     elif classname == 'Array':
         if obj['__dtype__'].startswith('complex'):
             re = np.asarray(obj['value'][0], dtype='double')
             im = np.asarray(obj['value'][1], dtype='double')
             out = re + 1j*im
         elif obj['__dtype__'].startswith('object'):
-            val = [decode4js(v) for v in obj['value']]
+            val = [decode4js(v, arrays=arrays) for v in obj['value']]
             out = np.array(val,  dtype=obj['__dtype__'])
 
         else:
@@ -226,7 +244,7 @@ def decode4js(obj):
     elif classname in ('Dict', 'dict'):
         out = {}
         for key, val in obj.items():
-            out[key] = decode4js(val)
+            out[key] = decode4js(val, arrays=arrays)
     elif classname == 'Datetime':
         obj = datetime.fromisoformat(obj['isotime'])
 
@@ -243,29 +261,29 @@ def decode4js(obj):
     elif classname == 'Parameters':
         out = Parameters()
         out.clear()
-        unique_symbols = {key: decode4js(obj['unique_symbols'][key]) for key
-                          in obj['unique_symbols']}
+        unique_symbols = {key: decode4js(obj['unique_symbols'][key], arrays=arrays)
+                          for key in obj['unique_symbols']}
 
         state = {'unique_symbols': unique_symbols, 'params': []}
         for name, parstate in obj['params']:
-            par = Parameter(decode4js(name))
-            par.__setstate__(decode4js(parstate))
+            par = Parameter(decode4js(name, arrays=arrays))
+            par.__setstate__(decode4js(parstate, arrays=arrays))
             state['params'].append(par)
         out.__setstate__(state)
     elif classname in ('Parameter', 'parameter'):
-        name = decode4js(obj['name'])
-        state = decode4js(obj['state'])
+        name = decode4js(obj['name'], arrays=arrays)
+        state = decode4js(obj['state'], arrays=arrays)
         out = Parameter(name)
         out.__setstate__(state)
 
     elif classname == 'Model':
         mod = Model(lambda x: x)
-        out = mod.loads(decode4js(obj['value']))
+        out = mod.loads(decode4js(obj['value'], arrays=arrays))
 
     elif classname == 'ModelResult':
         params = Parameters()
         res = ModelResult(Model(lambda x: x, None), params)
-        out = res.loads(decode4js(obj['value']))
+        out = res.loads(decode4js(obj['value'], arrays=arrays))
 
     elif classname == 'Logger':
         out = getLogger(obj['name'], level=obj['level'])
@@ -274,7 +292,7 @@ def decode4js(obj):
         dtype = obj.get('__type__')
         if dtype in HAS_STATE:
             out = HAS_STATE[dtype]()
-            out.__setstate__(decode4js(obj.get('value')))
+            out.__setstate__(decode4js(obj.get('value'), arrays=arrays))
         else:
             print(f"Warning: cannot re-create stateful object of type '{dtype}'")
 
@@ -286,7 +304,7 @@ def decode4js(obj):
                 val.get('__name__', None) is not None):
                 pass  # ignore class methods for subclassed Groups
             else:
-                out[key] = decode4js(val)
+                out[key] = decode4js(val, arrays=arrays)
         if classname == 'FeffDatFile':
             path = FeffDatFile()
             path._set_from_dict(**out)
@@ -7,12 +7,6 @@ import sys
 from collections import namedtuple
 from packaging.version import parse as ver_parse
 import importlib
-import urllib3
-import requests
-import numpy
-import scipy
-import matplotlib
-import lmfit
 
 try:
     from importlib.metadata import version, PackageNotFoundError
@@ -24,8 +18,6 @@ except PackageNotFoundError:
     # package is not installed
     __version__ = __release_version__
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
 # libraries whose versions might be interesting to know
 LIBS_VERSIONS = ('numpy', 'scipy', 'matplotlib', 'h5py', 'sklearn', 'skimage',
                  'sqlalchemy', 'fabio', 'pyFAI', 'PIL', 'imageio', 'silx',
@@ -138,6 +130,9 @@ LATEST_MESSAGE = """Larch version {local_version:s} is up to date."""
 
 def check_larchversion():
     "check version, return VersionStatus tuple"
+    import urllib3
+    import requests
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
     local_version = __release_version__
 
     try:
@@ -777,7 +777,7 @@ class XASFrame(wx.Frame):
             return
 
         try:
-            _session  = read_session(path)
+            _session  = read_session(path, lazy=True)
         except:
             title = "Invalid Path for Larch Session"
             message = [f"{path} is not a valid Larch Session File"]
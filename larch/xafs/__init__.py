@@ -7,6 +7,7 @@ function         description
 ------------     ------------------------------
 pre_edge         pre_edge subtraction, normalization
 autobk           XAFS background subtraction (mu(E) to chi(k))
+autobk_batch     autobk for many spectra on a common energy grid
 xftf             forward XAFS Fourier transform (k -> R)
 xftr             backward XAFS Fourier transform, Filter (R -> q)
 ftwindow         create XAFS Fourier transform window
@@ -26,11 +27,12 @@ from .xafsutils import KTOE, ETOK, set_xafsGroup, etok, ktoe, guess_energy_units
 from .xafsft import xftf, xftr, xftf_fast, xftr_fast, ftwindow, xftf_prep
 from .pre_edge import pre_edge, preedge, find_e0, energy_align, find_energy_step
 from .prepeaks import prepeaks_setup, pre_edge_baseline, prepeaks_fit
-from .feffdat import FeffDatFile, FeffPathGroup, feffpath, path2chi, ff2chi, use_feffpath
+from .feffdat import (FeffDatFile, FeffPathGroup, FeffPathSum, feffpath, path2chi,
+                      ff2chi, use_feffpath)
 from .feffit import (FeffitDataSet, TransformGroup, feffit,
                      feffit_dataset, feffit_transform, feffit_report)
 
-from .autobk import autobk
+from .autobk import autobk, autobk_batch
 from .mback import mback, mback_norm
 from .diffkk import diffkk, diffKKGroup
 from .fluo import fluo_corr
@@ -58,7 +60,8 @@ def _larch_init(_larch):
 _larch_groups = (diffKKGroup, FeffRunner, FeffDatFile, FeffPathGroup,
                  TransformGroup, FeffitDataSet)
 
-_larch_builtins = {'_xafs': dict(autobk=autobk, etok=etok, ktoe=ktoe,
+_larch_builtins = {'_xafs': dict(autobk=autobk, autobk_batch=autobk_batch,
+                                 etok=etok, ktoe=ktoe,
                                  guess_energy_units=guess_energy_units,
                                  diffkk=diffkk, xftf=xftf, xftr=xftr,
                                  xftf_prep=xftf_prep, xftf_fast=xftf_fast,
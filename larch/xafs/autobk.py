@@ -1,7 +1,11 @@
 #!/usr/bin/env python
 import sys
+import time
+import multiprocessing as mp
+from functools import partial
 import numpy as np
-from scipy.interpolate import splrep, splev, UnivariateSpline
+from scipy.interpolate import (splrep, splev, UnivariateSpline,
+                               BSpline, make_interp_spline)
 from scipy.stats import t
 from scipy.special import erf
 from lmfit import Parameter, Parameters, minimize, fit_report
@@ -18,17 +22,79 @@ from .pre_edge import find_e0, pre_edge
 
 FMT_COEF = 'coef_%2.2i'
 
+def _autobk_setup(energy, ek0, rbkg=1, nknots=None, kmin=0, kmax=None,
+                  kweight=1, dk=0.1, win='hanning', nfft=2048, kstep=0.05):
+    """set up k grids, FT window, and spline knots for autobk,
+    which depend only on the energy array and ek0, not on mu(E)
+
+    Returns a Group with:
+       iek0, iemax   indices of energy array for ek0 and k=kmax
+       kraw, kfit    k of energy array above ek0, and up to kmax
+       kout, kmax    uniform output k grid, and its maximum value
+       ftwin         FT window (including k-weighting) on kout
+       nspl, irbkg   number of spline knots, number of R points below rbkg
+       nfft          array size for FFT
+       spl_k         k values of spline knots
+       spl_index     indices of kraw for spline knots
+       knots         spline knots, as from splrep()
+    """
+    # get array indices for rkbg and ek0: irbkg, iek0
+    iek0 = index_of(energy, ek0)
+    rgrid = np.pi/(kstep*nfft)
+    if rbkg < 2*rgrid: rbkg = 2*rgrid
+
+    # save ungridded k (kraw) and grided k (kout)
+    # and ftwin (*k-weighting) for FT in residual
+    enpe = energy[iek0:] - ek0
+    kraw = np.sign(enpe)*np.sqrt(ETOK*abs(enpe))
+    if kmax is None:
+        kmax = max(kraw)
+    else:
+        kmax = max(0, min(max(kraw), kmax))
+    kout  = kstep * np.arange(int(1.01+kmax/kstep), dtype='float64')
+    iemax = min(len(energy), 2+index_of(energy, ek0+kmax*kmax/ETOK)) - 1
+
+    # pre-load FT window
+    ftwin = kout**kweight * ftwindow(kout, xmin=kmin, xmax=kmax,
+                                     window=win, dx=dk, dx2=dk)
+    # calc k-value for spline params
+    nspl = 1 + int(2*rbkg*(kmax-kmin)/np.pi)
+    irbkg = int(1 + (nspl-1)*np.pi/(2*rgrid*(kmax-kmin)))
+    if nknots is not None:
+        nspl = nknots
+    nspl = max(5, min(128, nspl))
+    spl_k = np.zeros(nspl)
+    spl_index = np.zeros(nspl, dtype=int)
+    for i in range(nspl):
+        q  = kmin + i*(kmax-kmin)/(nspl - 1)
+        ik = index_nearest(kraw, q)
+        spl_k[i] = kraw[ik]
+        spl_index[i] = ik
+    # knots from splrep() do not depend on the y values
+    knots = splrep(spl_k, np.ones(nspl), k=3)[0]
+    return Group(iek0=iek0, iemax=iemax, kraw=kraw, kfit=kraw[:iemax-iek0+1],
+                 kout=kout, kmax=kmax, ftwin=ftwin, nspl=nspl, irbkg=irbkg,
+                 nfft=nfft, spl_k=spl_k, spl_index=spl_index, knots=knots)
+
+def _spline_guess(mu, spl_index):
+    """initial guess for y-values of spline knots for 2-d mu[nspec, nk]
+    starting at ek0, averaging over neighboring points"""
+    npts = mu.shape[1]
+    i1 = np.minimum(npts-1, spl_index + 5)
+    i2 = np.maximum(0, spl_index - 5)
+    return (2*mu[:, spl_index] + mu[:, i1] + mu[:, i2]) / 4.0
+
 def spline_eval(kraw, mu, knots, coefs, order, kout):
     """eval bkg(kraw) and chi(k) for knots, coefs, order"""
     bkg = splev(kraw, [knots, coefs, order])
     chi = UnivariateSpline(kraw, (mu-bkg), s=0)(kout)
     return bkg, chi
 
-def __resid(pars, ncoefs=1, knots=None, order=3, irbkg=1, nfft=2048,
-            kraw=None, mu=None, kout=None, ftwin=1, kweight=1, chi_std=None,
-            nclamp=0, clamp_lo=1, clamp_hi=1, **kws):
-
-    # coefs = [getattr(pars, FMT_COEF % i) for i in range(ncoefs)]
+def _resid_spline(pars, ncoefs=1, knots=None, order=3, irbkg=1, nfft=2048,
+                 kraw=None, mu=None, kout=None, ftwin=1, kweight=1,
+                 chi_std=None, nclamp=0, clamp_lo=1, clamp_hi=1, **kws):
+    """autobk residual, building a new spline of (mu-bkg) for each call.
+    This is not used for fitting, but kept to check and time __resid()"""
     coefs = [pars[FMT_COEF % i].value for i in range(ncoefs)]
     bkg, chi = spline_eval(kraw, mu, knots, coefs, order, kout)
     if chi_std is not None:
@@ -42,6 +108,18 @@ def __resid(pars, ncoefs=1, knots=None, order=3, irbkg=1, nfft=2048,
                             abs(clamp_lo)*scale*chi[:nclamp],
                             abs(clamp_hi)*scale*chi[-nclamp:]))
 
+def __resid(pars, nspl=1, ft0=None, ft_basis=None, clamp0=None,
+            clamp_basis=None, **kws):
+    """autobk residual, using the precomputed linear operators from
+    _autobk_operators(): the low-R FT of chi, and the clamped chi values
+    are each a constant minus a matrix times the spline coefficients"""
+    coefs = np.array([pars[FMT_COEF % i].value for i in range(nspl)])
+    out = ft0 - ft_basis @ coefs
+    if clamp0 is None:
+        return out
+    # spline clamps:
+    scale = 1.0 + 100*(out*out).mean()
+    return np.concatenate((out, scale*(clamp0 - clamp_basis @ coefs)))
 
 @Make_CallArgs(["energy" ,"mu"])
 def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None, ek0=None,
@@ -131,52 +209,21 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None, ek0=None,
         msg('autobk() could not determine ek0 or edge_step!: trying running pre_edge first\n')
         return
 
-    # get array indices for rkbg and ek0: irbkg, iek0
-    iek0 = index_of(energy, ek0)
-    rgrid = np.pi/(kstep*nfft)
-    if rbkg < 2*rgrid: rbkg = 2*rgrid
-
-    # save ungridded k (kraw) and grided k (kout)
-    # and ftwin (*k-weighting) for FT in residual
-    enpe = energy[iek0:] - ek0
-    kraw = np.sign(enpe)*np.sqrt(ETOK*abs(enpe))
-    if kmax is None:
-        kmax = max(kraw)
-    else:
-        kmax = max(0, min(max(kraw), kmax))
-    kout  = kstep * np.arange(int(1.01+kmax/kstep), dtype='float64')
-    iemax = min(len(energy), 2+index_of(energy, ek0+kmax*kmax/ETOK)) - 1
+    setup = _autobk_setup(energy, ek0, rbkg=rbkg, nknots=nknots, kmin=kmin,
+                          kmax=kmax, kweight=kweight, dk=dk, win=win,
+                          nfft=nfft, kstep=kstep)
+    iek0, iemax = setup.iek0, setup.iemax
+    kraw, kout, kmax = setup.kraw, setup.kout, setup.kmax
+    ftwin, irbkg, nspl = setup.ftwin, setup.irbkg, setup.nspl
+    spl_k = setup.spl_k
 
     # interpolate provided chi(k) onto the kout grid
     if chi_std is not None and k_std is not None:
         chi_std = np.interp(kout, k_std, chi_std)
-    # pre-load FT window
-    ftwin = kout**kweight * ftwindow(kout, xmin=kmin, xmax=kmax,
-                                     window=win, dx=dk, dx2=dk)
-    # calc k-value and initial guess for y-values of spline params
-    nspl = 1 + int(2*rbkg*(kmax-kmin)/np.pi)
-    irbkg = int(1 + (nspl-1)*np.pi/(2*rgrid*(kmax-kmin)))
-    if nknots is not None:
-        nspl = nknots
-    nspl = max(5, min(128, nspl))
-    spl_y, spl_k  = np.ones(nspl), np.zeros(nspl)
-    for i in range(nspl):
-        q  = kmin + i*(kmax-kmin)/(nspl - 1)
-        ik = index_nearest(kraw, q)
-        i1 = min(len(kraw)-1, ik + 5)
-        i2 = max(0, ik - 5)
-        spl_k[i] = kraw[ik]
-        spl_y[i] = (2*mu[ik+iek0] + mu[i1+iek0] + mu[i2+iek0] ) / 4.0
 
+    # initial guess for y-values of spline params
+    spl_y = _spline_guess(mu[np.newaxis, iek0:], setup.spl_index)[0]
     order = 3
-    qmin, qmax  = spl_k[0], spl_k[nspl-1]
-    knots = [spl_k[0] - 1.e-4*(order-i) for i in range(order)]
-
-    for i in range(order, nspl):
-        knots.append((i-order)*(qmax - qmin)/(nspl-order+1))
-    qlast = knots[-1]
-    for i in range(order+1):
-        knots.append(qlast + 1.e-4*(i+1))
 
     # coefs = [mu[index_nearest(energy, ek0 + q**2/ETOK)] for q in knots]
     knots, coefs, order = splrep(spl_k, spl_y, k=order)
@@ -187,24 +234,35 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None, ek0=None,
     for i in range(len(coefs)):
         params.add(name = FMT_COEF % i, value=coefs[i], vary=i<len(spl_y))
 
-    initbkg, initchi = spline_eval(kraw[:iemax-iek0+1], mu[iek0:iemax+1],
-                                   knots, coefs, order, kout)
+    # bkg and chi are linear in the coefficients: precompute the
+    # operators for bkg(kraw), chi(kout) and its low-R FT, and the
+    # values of interpolated mu(kout) for coefficients of zero.
+    setup = _autobk_operators(setup)
+    kfit, mufit = setup.kfit, mu[iek0:iemax+1]
+    bkg_basis, chi_basis = setup.bkg_basis, setup.chi_basis
+    chi0 = make_interp_spline(kfit, mufit, k=3)(kout)
+    dchi0 = chi0 if chi_std is None else chi0 - chi_std
+    resid_kws = dict(nspl=nspl, ft_basis=setup.ft_basis,
+                     ft0=_lowr_ft(dchi0[np.newaxis, :], ftwin, nfft, irbkg)[0])
+    if nclamp > 0:
+        cbasis, c0 = _clamp_operators(chi_basis, dchi0, nclamp=nclamp,
+                                      clamp_lo=clamp_lo, clamp_hi=clamp_hi)
+        resid_kws.update(clamp_basis=cbasis, clamp0=c0)
+
+    initbkg = bkg_basis @ coefs[:nspl]
+    initchi = chi0 - chi_basis @ coefs[:nspl]
 
     # do fit
+    t0 = time.time()
     result = minimize(__resid, params, method='leastsq',
                       gtol=1.e-6, ftol=1.e-6, xtol=1.e-6, epsfcn=1.e-6,
-                      kws = dict(ncoefs=len(coefs), chi_std=chi_std,
-                                 knots=knots, order=order,
-                                 kraw=kraw[:iemax-iek0+1],
-                                 mu=mu[iek0:iemax+1], irbkg=irbkg, kout=kout,
-                                 ftwin=ftwin, kweight=kweight,
-                                 nfft=nfft, nclamp=nclamp,
-                                 clamp_lo=clamp_lo, clamp_hi=clamp_hi))
+                      kws=resid_kws)
+    fit_time = time.time() - t0
 
     # write final results
-    coefs = [result.params[FMT_COEF % i].value for i in range(len(coefs))]
-    bkg, chi = spline_eval(kraw[:iemax-iek0+1], mu[iek0:iemax+1],
-                           knots, coefs, order, kout)
+    coefs = np.array([result.params[FMT_COEF % i].value for i in range(len(coefs))])
+    bkg = bkg_basis @ coefs[:nspl]
+    chi = chi0 - chi_basis @ coefs[:nspl]
     obkg = mu[:]*1.0
     obkg[iek0:iek0+len(bkg)] = bkg
 
@@ -219,56 +277,29 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None, ek0=None,
     # now fill in 'autobk_details' group
     details = Group(kmin=kmin, kmax=kmax, irbkg=irbkg, nknots=len(spl_k),
                     knots_k=knots, init_knots_y=spl_y, nspl=nspl,
-                    init_chi=initchi/edge_step, report=fit_report(result))
+                    init_chi=initchi/edge_step, report=fit_report(result),
+                    rbkg=rbkg, kweight=kweight, dk=dk, win=win, nfft=nfft,
+                    kstep=kstep, nclamp=nclamp, clamp_lo=clamp_lo,
+                    clamp_hi=clamp_hi, fit_time=fit_time)
     details.init_bkg = mu[:]*1.0
     details.init_bkg[iek0:iek0+len(bkg)] = initbkg
     details.knots_y  = np.array([coefs[i] for i in range(nspl)])
     group.autobk_details = details
     for attr in ('nfev', 'redchi', 'chisqr', 'aic', 'bic', 'params'):
         setattr(details, attr, getattr(result, attr, None))
+    details.resid_time = fit_time/max(1, result.nfev)
 
-    # uncertainties in mu0 and chi: can be fairly slow.
+    # uncertainties in mu0 and chi
     covar = getattr(result, 'covar', None)
     if calc_uncertainties and covar is not None:
         nchi = len(chi)
         nmue = iemax-iek0 + 1
         redchi = result.redchi
         covar  = result.covar / redchi
-        jac_chi = np.zeros(nchi*nspl).reshape((nspl, nchi))
-        jac_bkg = np.zeros(nmue*nspl).reshape((nspl, nmue))
-
-        cvals, cerrs = [], []
-        for i in range(len(coefs)):
-             par = result.params[FMT_COEF % i]
-             cvals.append(getattr(par, 'value', 0.0))
-             cdel = getattr(par, 'stderr', 0.0)
-             if cdel is None:
-                 cdel = 0.0
-             cerrs.append(cdel/2.0)
-        cvals = np.array(cvals)
-        cerrs = np.array(cerrs)
-
-        # find derivatives by hand!
-        _k = kraw[:nmue]
-        _m = mu[iek0:iemax+1]
-        for i in range(nspl):
-            cval0 = cvals[i]
-            cvals[i] = cval0 + cerrs[i]
-            bkg1, chi1 = spline_eval(_k, _m, knots, cvals, order, kout)
-
-            cvals[i] = cval0 - cerrs[i]
-            bkg2, chi2 = spline_eval(_k, _m, knots, cvals, order, kout)
-
-            cvals[i] = cval0
-            jac_chi[i] = (chi1 - chi2) / (2*cerrs[i])
-            jac_bkg[i] = (bkg1 - bkg2) / (2*cerrs[i])
-
-        dfchi = np.zeros(nchi)
-        dfbkg = np.zeros(nmue)
-        for i in range(nspl):
-            for j in range(nspl):
-                dfchi += jac_chi[i]*jac_chi[j]*covar[i,j]
-                dfbkg += jac_bkg[i]*jac_bkg[j]*covar[i,j]
+        # chi and bkg are linear in the coefficients
+        covar = covar[:nspl, :nspl]
+        dfchi = np.einsum('ki,ij,kj->k', chi_basis, covar, chi_basis)
+        dfbkg = np.einsum('ki,ij,kj->k', bkg_basis, covar, bkg_basis)
 
         prob = 0.5*(1.0 + erf(err_sigma/np.sqrt(2.0)))
         dchi = t.ppf(prob, nchi-nspl) * np.sqrt(dfchi*redchi)
@@ -278,3 +309,336 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None, ek0=None,
             group.delta_chi = dchi
             group.delta_bkg = 0.0*mu
             group.delta_bkg[iek0:iek0+len(dbkg)] = dbkg
+
+def _autobk_operators(setup):
+    """linear operators for the autobk spline, added to setup Group:
+
+       bkg_basis  [nfit, nspl]   bkg(kfit) for unit spline coefficients
+       chi_basis  [nkout, nspl]  interpolated bkg(kout) for unit coefficients
+       ft_basis   [2*irbkg, nspl] low-R FT of ftwin*chi_basis, as realimag()
+       coef_guess [nspl, nspl]   maps knot y-values to spline coefficients
+
+    so that for spline coefficients c, bkg = bkg_basis @ c, and chi is
+    interpolated (mu-bkg) minus chi_basis @ c.
+    """
+    nspl, kfit = setup.nspl, setup.kfit
+    unit = np.eye(nspl)
+    setup.bkg_basis = BSpline(setup.knots, unit, 3)(kfit)
+    setup.chi_basis = make_interp_spline(kfit, setup.bkg_basis, k=3)(setup.kout)
+    setup.ft_basis = _lowr_ft(setup.chi_basis.T, setup.ftwin,
+                              setup.nfft, setup.irbkg).T
+    setup.coef_guess = np.linalg.inv(BSpline(setup.knots, unit, 3)(setup.spl_k))
+    return setup
+
+def _clamp_operators(chi_basis, chi0, nclamp=3, clamp_lo=0, clamp_hi=1):
+    """weighted clamp rows of chi_basis and the clamped values of chi0,
+    which can be 1-d or 2-d [nspec, nk], so that clamped chi values are
+    clamp0 - clamp_basis @ coefs"""
+    clamp_basis = np.concatenate((abs(clamp_lo)*chi_basis[:nclamp],
+                                  abs(clamp_hi)*chi_basis[-nclamp:]))
+    clamp0 = np.concatenate((abs(clamp_lo)*chi0[..., :nclamp],
+                             abs(clamp_hi)*chi0[..., -nclamp:]), axis=-1)
+    return clamp_basis, clamp0
+
+def _lowr_ft(chi, ftwin, nfft, irbkg, kstep=0.05):
+    """realimag() of xftf_fast(chi*ftwin)[:irbkg] for 2-d chi[nspec, nk]"""
+    cchi = np.zeros((chi.shape[0], nfft), dtype='complex128')
+    cchi[:, :chi.shape[1]] = chi*ftwin
+    chir = (kstep/np.sqrt(np.pi)) * np.fft.fft(cchi, axis=1)[:, :irbkg]
+    out = np.zeros((chi.shape[0], 2*irbkg))
+    out[:, 0::2] = chir.real
+    out[:, 1::2] = chir.imag
+    return out
+
+def _autobk_batch_chunk(mu, setup=None, chi_std=None, nclamp=3, clamp_lo=0,
+                        clamp_hi=1, calc_uncertainties=True, err_sigma=1,
+                        niter=20, rcond=1.e-10):
+    """solve the autobk spline for 2-d mu[nspec, nenergy] sharing one setup
+
+    The residual of autobk is linear in the spline coefficients except for
+    the scale of the clamps, which is found by fixed-point iteration, so
+    that each spectrum needs only a few small matrix products.
+    """
+    iek0, iemax, kfit, kout = setup.iek0, setup.iemax, setup.kfit, setup.kout
+    nspl, irbkg = setup.nspl, setup.irbkg
+    mufit = mu[:, iek0:iemax+1]
+    chi0 = make_interp_spline(kfit, mufit.T, k=3)(kout).T
+    dchi0 = chi0 if chi_std is None else chi0 - chi_std
+
+    # initial coefficients as for autobk(), solve for changes from those
+    coef0 = _spline_guess(mu[:, iek0:], setup.spl_index) @ setup.coef_guess.T
+    amat, mmat = setup.chi_basis, setup.ft_basis
+    r0 = _lowr_ft(dchi0, setup.ftwin, setup.nfft, irbkg) - coef0 @ mmat.T
+
+    # clamp rows: the clamped chi values are c0 - cmat @ coefs
+    nclamp = min(nclamp, len(kout))
+    if nclamp > 0:
+        cmat, c0 = _clamp_operators(amat, dchi0, nclamp=nclamp,
+                                    clamp_lo=clamp_lo, clamp_hi=clamp_hi)
+        c0 = c0 - coef0 @ cmat.T
+    else:
+        cmat = np.zeros((0, nspl))
+        c0 = np.zeros((len(mu), 0))
+
+    # simultaneously diagonalize M^T M and C^T C, so that
+    # (M^T M + s^2 C^T C)^-1 = W diag(1/(1+s^2 d)) W^T for every scale s
+    lam, vec = np.linalg.eigh(mmat.T @ mmat)
+    lam = np.maximum(lam, rcond*lam.max())
+    linv = vec / np.sqrt(lam)
+    dvals, qvec = np.linalg.eigh(linv.T @ (cmat.T @ cmat) @ linv)
+    dvals = np.maximum(dvals, 0)
+    wmat = linv @ qvec
+    b1 = (r0 @ mmat) @ wmat
+    b2 = (c0 @ cmat) @ wmat
+
+    scale = np.ones(len(mu))
+    for i in range(niter):
+        s2 = scale[:, np.newaxis]**2
+        coefs = ((b1 + s2*b2)/(1 + s2*dvals)) @ wmat.T
+        out = r0 - coefs @ mmat.T
+        new = 1.0 + 100*(out*out).mean(axis=1)
+        converged = np.allclose(new, scale, rtol=1.e-8, atol=0)
+        scale = new
+        if nclamp == 0 or converged:
+            break
+
+    # refine with Gauss-Newton steps, including the dependence
+    # of the clamp scale on the coefficients
+    if nclamp > 0:
+        for i in range(niter):
+            scale = 1.0 + 100*(out*out).mean(axis=1)
+            clampres = c0 - coefs @ cmat.T
+            dscale = (-200.0/out.shape[1]) * (out @ mmat)
+            jclamp = (-scale[:, np.newaxis, np.newaxis]*cmat +
+                      clampres[:, :, np.newaxis]*dscale[:, np.newaxis, :])
+            jtj = (mmat.T @ mmat) + np.einsum('nci,ncj->nij', jclamp, jclamp)
+            jtr = (-out @ mmat + np.einsum('nci,nc->ni', jclamp,
+                                           scale[:, np.newaxis]*clampres))
+            step = np.linalg.solve(jtj, -jtr[:, :, np.newaxis])[:, :, 0]
+            coefs = coefs + step
+            out = r0 - coefs @ mmat.T
+            if abs(step).max() < 1.e-10*max(1.e-10, abs(coefs).max()):
+                break
+        scale = 1.0 + 100*(out*out).mean(axis=1)
+
+    coefs = coefs + coef0
+    bkg = coefs @ setup.bkg_basis.T
+    chi = chi0 - coefs @ amat.T
+    result = dict(bkg=bkg, chi=chi, coefs=coefs, scale=scale)
+
+    if calc_uncertainties:
+        s2 = scale[:, np.newaxis]**2
+        clampres = c0 - (coefs-coef0) @ cmat.T
+        chisqr = (out*out).sum(axis=1) + scale**2*(clampres*clampres).sum(axis=1)
+        redchi = chisqr / max(1, out.shape[1] + cmat.shape[0] - nspl)
+        aw, bw = amat @ wmat, setup.bkg_basis @ wmat
+        dfchi = (1/(1 + s2*dvals)) @ (aw*aw).T
+        dfbkg = (1/(1 + s2*dvals)) @ (bw*bw).T
+        prob = 0.5*(1.0 + erf(err_sigma/np.sqrt(2.0)))
+        rchi = redchi[:, np.newaxis]
+        result['delta_chi'] = t.ppf(prob, len(kout)-nspl) * np.sqrt(dfchi*rchi)
+        result['delta_bkg'] = t.ppf(prob, len(kfit)-nspl) * np.sqrt(dfbkg*rchi)
+    return result
+
+def _autobk_batch_task(args, **kws):
+    "worker for autobk_batch() process pool"
+    mu, setup = args
+    return _autobk_batch_chunk(mu, setup=setup, **kws)
+
+def autobk_batch(energy, mu=None, rbkg=1, nknots=None, ek0=None,
+                 edge_step=None, kmin=0, kmax=None, kweight=1, dk=0.1,
+                 win='hanning', k_std=None, chi_std=None, nfft=2048,
+                 kstep=0.05, pre_edge_kws=None, nclamp=3, clamp_lo=0,
+                 clamp_hi=1, calc_uncertainties=True, err_sigma=1,
+                 nworkers=1, chunksize=500, _larch=None):
+    """Autobk background removal for many spectra on a common energy grid
+
+    Parameters:
+    -----------
+      energy:    1-d array of x-ray energies, in eV, or a list of groups
+                 each with energy and mu arrays on the same energy grid.
+      mu:        2-d array of mu(E), shape (nspectra, len(energy)),
+                 ignored if energy is a list of groups.
+      ek0:       edge energy, scalar or one per spectrum.  If None, it
+                 will be taken from the groups or determined by pre_edge().
+      edge_step: edge step, scalar or one per spectrum.  If None, it
+                 will be taken from the groups or determined by pre_edge().
+      nworkers:  number of processes to use [1]
+      chunksize: number of spectra solved together by one process [500]
+
+      all other arguments are as for autobk(), and apply to all spectra.
+
+    Returns:
+    --------
+      group with arrays ek0, edge_step (1-d), k (1-d), and bkg, chie,
+      chi, delta_chi, delta_bkg (2-d, one row per spectrum).  If a list
+      of groups is given, bkg, chie, k, chi, ek0, edge_step, delta_chi
+      and delta_bkg are also written to each group, as from autobk().
+
+    Notes:
+    ------
+     1. The knots, FT window, and k grids depend only on the energy
+        grid and ek0, and are computed once for each distinct ek0.
+        The fit residual of autobk() is linear in the spline
+        coefficients, so the spectra are fit together by linear least
+        squares, with the clamp scale found by fixed-point iteration.
+        Results agree closely, but not exactly, with autobk().
+     2. kmax, if not given, is set from the largest ek0, so that all
+        chi(k) arrays share the same k array.
+    """
+    groups = None
+    if isinstance(energy, (list, tuple)):
+        groups = energy
+        energy = remove_dups(np.asarray(groups[0].energy).squeeze())
+        mu = []
+        for grp in groups:
+            en = remove_dups(np.asarray(grp.energy).squeeze())
+            if len(en) != len(energy) or not np.allclose(en, energy):
+                raise ValueError('autobk_batch() needs all groups to have the same energy array')
+            mu.append(np.asarray(grp.mu).squeeze())
+        mu = np.array(mu)
+        if ek0 is None:
+            ek0 = [getattr(g, 'ek0', getattr(g, 'e0', None)) for g in groups]
+            if None in ek0:
+                ek0 = None
+        if edge_step is None:
+            edge_step = [getattr(g, 'edge_step', None) for g in groups]
+            if None in edge_step:
+                edge_step = None
+    else:
+        energy = remove_dups(np.asarray(energy).squeeze())
+        mu = np.atleast_2d(np.asarray(mu, dtype='float64'))
+    if mu.shape[1] != len(energy):
+        raise ValueError('autobk_batch() needs mu with shape (nspectra, len(energy))')
+    nspec = len(mu)
+
+    if ek0 is None or edge_step is None:
+        pre_kws = dict(nnorm=None, nvict=0, pre1=None,
+                       pre2=None, norm1=None, norm2=None)
+        if pre_edge_kws is not None:
+            pre_kws.update(pre_edge_kws)
+        e0s, steps = np.zeros(nspec), np.zeros(nspec)
+        for i in range(nspec):
+            tmp = Group()
+            pre_edge(energy, mu[i], group=tmp, _larch=_larch, **pre_kws)
+            e0s[i], steps[i] = tmp.e0, tmp.edge_step
+        if ek0 is None:
+            ek0 = e0s
+        if edge_step is None:
+            edge_step = steps
+    ek0 = np.ones(nspec)*np.asarray(ek0, dtype='float64')
+    edge_step = np.ones(nspec)*np.asarray(edge_step, dtype='float64')
+    if ek0.min() < energy.min() or ek0.max() > energy.max():
+        raise ValueError('autobk_batch() ek0 out of energy range')
+
+    if kmax is None:
+        kmax = np.sqrt(ETOK*(energy.max() - ek0.max()))
+
+    # group spectra by ek0, setting up operators once for each group
+    tasks, task_index = [], []
+    for e0val in np.unique(ek0):
+        index = np.where(ek0 == e0val)[0]
+        setup = _autobk_setup(energy, e0val, rbkg=rbkg, nknots=nknots,
+                              kmin=kmin, kmax=kmax, kweight=kweight, dk=dk,
+                              win=win, nfft=nfft, kstep=kstep)
+        _autobk_operators(setup)
+        for i in range(0, len(index), chunksize):
+            tasks.append((mu[index[i:i+chunksize]], setup))
+            task_index.append(index[i:i+chunksize])
+    kout = setup.kout
+    if chi_std is not None and k_std is not None:
+        chi_std = np.interp(kout, k_std, chi_std)
+
+    task_kws = dict(chi_std=chi_std, nclamp=nclamp, clamp_lo=clamp_lo,
+                    clamp_hi=clamp_hi, calc_uncertainties=calc_uncertainties,
+                    err_sigma=err_sigma)
+    if nworkers > 1 and len(tasks) > 1:
+        with mp.Pool(min(nworkers, len(tasks))) as pool:
+            results = pool.map(partial(_autobk_batch_task, **task_kws), tasks)
+    else:
+        results = [_autobk_batch_task(task, **task_kws) for task in tasks]
+
+    bkg = mu*1.0
+    chi = np.zeros((nspec, len(kout)))
+    delta_chi = delta_bkg = None
+    if calc_uncertainties:
+        delta_chi = np.zeros((nspec, len(kout)))
+        delta_bkg = np.zeros((nspec, len(energy)))
+    for index, (tmu, setup), res in zip(task_index, tasks, results):
+        iek0, nfit = setup.iek0, len(setup.kfit)
+        bkg[index, iek0:iek0+nfit] = res['bkg']
+        chi[index] = res['chi']
+        if calc_uncertainties:
+            delta_chi[index] = res['delta_chi']
+            delta_bkg[index, iek0:iek0+nfit] = res['delta_bkg']
+
+    step = edge_step[:, np.newaxis]
+    out = Group(energy=energy, k=kout, ek0=ek0, edge_step=edge_step,
+                bkg=bkg, chie=(mu-bkg)/step, chi=chi/step,
+                delta_chi=delta_chi, delta_bkg=delta_bkg)
+    if groups is not None:
+        for i, grp in enumerate(groups):
+            grp.bkg = bkg[i]
+            grp.chie = out.chie[i]
+            grp.k = kout*1.0
+            grp.chi = out.chi[i]
+            grp.ek0 = ek0[i]
+            grp.edge_step = edge_step[i]
+            if calc_uncertainties:
+                grp.delta_chi = delta_chi[i]
+                grp.delta_bkg = delta_bkg[i]
+    return out
+
+def autobk_residual_timing(group, nrepeat=100):
+    """time the autobk residual for a group that has been processed
+    with autobk(), comparing the residual using precomputed operators
+    with building a new spline for chi(k) at each evaluation.
+
+    Parameters:
+    -----------
+      group:     group with energy, mu, ek0, and autobk_details
+      nrepeat:   number of evaluations of each residual [100]
+
+    Returns:
+    --------
+      group with times per evaluation in seconds (spline, basis),
+      their ratio (speedup), and the largest difference of the two
+      residuals (max_diff).
+    """
+    details = group.autobk_details
+    energy = remove_dups(group.energy)
+    setup = _autobk_setup(energy, group.ek0, rbkg=details.rbkg,
+                          nknots=details.nspl, kmin=details.kmin,
+                          kmax=details.kmax, kweight=details.kweight,
+                          dk=details.dk, win=details.win,
+                          nfft=details.nfft, kstep=details.kstep)
+    setup = _autobk_operators(setup)
+    nspl, nclamp = setup.nspl, details.nclamp
+    clamp_lo, clamp_hi = details.clamp_lo, details.clamp_hi
+    mufit = group.mu[setup.iek0:setup.iemax+1]
+    chi0 = make_interp_spline(setup.kfit, mufit, k=3)(setup.kout)
+
+    basis_kws = dict(nspl=nspl, ft_basis=setup.ft_basis,
+                     ft0=_lowr_ft(chi0[np.newaxis, :], setup.ftwin,
+                                  setup.nfft, setup.irbkg)[0])
+    if nclamp > 0:
+        cbasis, c0 = _clamp_operators(setup.chi_basis, chi0, nclamp=nclamp,
+                                      clamp_lo=clamp_lo, clamp_hi=clamp_hi)
+        basis_kws.update(clamp_basis=cbasis, clamp0=c0)
+    spline_kws = dict(ncoefs=len(setup.knots), knots=setup.knots, order=3,
+                      irbkg=setup.irbkg, nfft=setup.nfft, kraw=setup.kfit,
+                      mu=mufit, kout=setup.kout, ftwin=setup.ftwin,
+                      nclamp=nclamp, clamp_lo=clamp_lo, clamp_hi=clamp_hi)
+
+    params = details.params
+    out = Group()
+    for name, func, kws in (('spline', _resid_spline, spline_kws),
+                            ('basis', __resid, basis_kws)):
+        t0 = time.time()
+        for i in range(nrepeat):
+            resid = func(params, **kws)
+        setattr(out, name, (time.time() - t0)/nrepeat)
+        setattr(out, '%s_resid' % name, resid)
+    out.speedup = out.spline / max(out.basis, 1.e-12)
+    out.max_diff = abs(out.spline_resid - out.basis_resid).max()
+    return out
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""
+On-disk cache of parsed Feff path files (feffNNNN.dat)
+
+Parsed Feff tables and spline coefficients for each feffNNNN.dat file are
+saved to a compact binary file named by a hash of the file contents, in a
+folder '.feffcache' next to the Feff path file, or in the user's larch
+folder if the Feff run folder is not writable.  As the cache file name
+depends on the file contents, a changed feffNNNN.dat file will not use
+stale data.  Stale cache files can be removed with prune_feffcache().
+
+Each cache file holds one line of JSON with the header values and array
+shapes, followed by the Feff tables and the spline coefficients as raw
+little-endian float64 data.  This is much faster to read than .npz files.
+"""
+import os
+import json
+import hashlib
+from glob import glob
+import numpy as np
+
+from larch.site_config import user_larchdir
+
+CACHE_VERSION = '1'
+CACHE_FOLDER = '.feffcache'
+CACHE_EXT = '.fcache'
+USE_FEFFCACHE = True
+
+HEADER_ATTRS = ('title', 'version', 'shell', 'absorber', 'degen', 'reff',
+                'nleg', 'rnorman', 'edge', 'gam_ch', 'exch', 'vmu',
+                'vfermi', 'vint', 'rs_int', 'potentials', 'geom')
+TABLE_ARRAYS = ('k', 'real_phc', 'mag_feff', 'pha_feff', 'red_fact',
+                'lam', 'rep', 'pha', 'amp')
+
+def feffdat_hash(filename):
+    """return hash of contents of a Feff path file, or None if unreadable"""
+    try:
+        with open(filename, 'rb') as fh:
+            text = fh.read()
+    except OSError:
+        return None
+    _hash = hashlib.sha256(f'feffcache_v{CACHE_VERSION}'.encode())
+    _hash.update(text)
+    return _hash.hexdigest()[:32]
+
+def cache_folders(filename):
+    """list of folders to look for cache files for a Feff path file"""
+    dirname = os.path.dirname(os.path.abspath(filename))
+    return [os.path.join(dirname, CACHE_FOLDER),
+            os.path.join(user_larchdir, 'feffcache')]
+
+def read_feffcache(filename, hashkey=None):
+    """read cached data for a Feff path file
+
+    Arguments:
+    ----------
+      filename (str):  name of feffNNNN.dat file
+      hashkey (str or None): hash of file contents [None - calculated]
+
+    Returns:
+    --------
+      dict of data with keys of HEADER_ATTRS, TABLE_ARRAYS, and
+      'spline_tcks', or None if there is no valid cached data.
+    """
+    if hashkey is None:
+        hashkey = feffdat_hash(filename)
+    if hashkey is None:
+        return None
+    for folder in cache_folders(filename):
+        cfile = os.path.join(folder, f'{hashkey}{CACHE_EXT}')
+        if not os.path.exists(cfile):
+            continue
+        try:
+            with open(cfile, 'rb') as fh:
+                out = json.loads(fh.readline().decode('utf-8'))
+                buff = fh.read()
+            data = np.frombuffer(buff, dtype='<f8')
+            ntab = np.prod(out['tables_shape'])
+            tables = data[:ntab].reshape(out.pop('tables_shape'))
+            tcks = data[ntab:].reshape(out.pop('tcks_shape'))
+        except Exception:
+            continue
+        for i, attr in enumerate(TABLE_ARRAYS):
+            out[attr] = tables[i]
+        order = out.pop('spline_order')
+        out['spline_tcks'] = {}
+        for i, name in enumerate(out.pop('spline_names')):
+            out['spline_tcks'][name] = (tcks[i, 0], tcks[i, 1], order)
+        out['potentials'] = [tuple(p) for p in out['potentials']]
+        out['geom'] = [tuple(g) for g in out['geom']]
+        return out
+    return None
+
+def write_feffcache(filename, data, hashkey=None):
+    """write data for a Feff path file to the cache
+
+    Arguments:
+    ----------
+      filename (str):  name of feffNNNN.dat file
+      data (dict):     dict with keys of HEADER_ATTRS, TABLE_ARRAYS, and
+                       'spline_tcks', as returned by read_feffcache()
+      hashkey (str or None): hash of file contents [None - calculated]
+
+    Returns:
+    --------
+      name of cache file written, or None if it could not be written.
+    """
+    if hashkey is None:
+        hashkey = feffdat_hash(filename)
+    if hashkey is None:
+        return None
+    header = {attr: data[attr] for attr in HEADER_ATTRS}
+    tables = np.array([data[attr] for attr in TABLE_ARRAYS], dtype='<f8')
+    header['spline_names'] = list(data['spline_tcks'].keys())
+    tcks = []
+    for name, (t, c, order) in data['spline_tcks'].items():
+        header['spline_order'] = int(order)
+        tcks.append((t, c))
+    tcks = np.array(tcks, dtype='<f8')
+    header['tables_shape'] = tables.shape
+    header['tcks_shape'] = tcks.shape
+
+    for folder in cache_folders(filename):
+        cfile = os.path.join(folder, f'{hashkey}{CACHE_EXT}')
+        tmpfile = os.path.join(folder, f'.{hashkey}_{os.getpid()}.tmp')
+        try:
+            os.makedirs(folder, exist_ok=True)
+            with open(tmpfile, 'wb') as fh:
+                fh.write(json.dumps(header).encode('utf-8') + b'\n')
+                fh.write(tables.tobytes())
+                fh.write(tcks.tobytes())
+            os.replace(tmpfile, cfile)
+            return cfile
+        except OSError:
+            if os.path.exists(tmpfile):
+                try:
+                    os.unlink(tmpfile)
+                except OSError:
+                    pass
+    return None
+
+def prune_feffcache(folder):
+    """remove cache files for a Feff run folder that do not match the
+    current contents of any feffNNNN.dat file in that folder
+
+    Returns:
+    --------
+      list of cache files removed
+    """
+    cache_dir = os.path.join(folder, CACHE_FOLDER)
+    if not os.path.isdir(cache_dir):
+        return []
+    current = set()
+    for fname in glob(os.path.join(folder, 'feff*.dat')):
+        current.add(f'{feffdat_hash(fname)}{CACHE_EXT}')
+    removed = []
+    for cfile in glob(os.path.join(cache_dir, f'*{CACHE_EXT}')):
+        if os.path.basename(cfile) not in current:
+            try:
+                os.unlink(cfile)
+                removed.append(cfile)
+            except OSError:
+                pass
+    return removed
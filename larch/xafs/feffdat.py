@@ -11,11 +11,16 @@ the path represented by the feffNNNN.dat
   group  = ff2chi(paths)
 
 creates a group that contains the chi(k) for the sum of paths.
+
+  pathsum = FeffPathSum(paths)
+  chi = pathsum.calc_chi(params, k)
+
+evaluates chi(k) for all paths at once, using stacked Feff tables.
 """
 import os
 import numpy as np
 from copy import deepcopy
-from scipy.interpolate import UnivariateSpline
+from scipy.interpolate import UnivariateSpline, make_interp_spline, BSpline
 from lmfit import Parameters, Parameter
 
 from xraydb import atomic_mass, atomic_symbol
@@ -25,20 +30,29 @@ from larch.utils.strutils import fix_varname, b32hash
 from larch.fitting import group2params, dict2params, isParameter, param_value
 from .xafsutils import ETOK, ktoe, set_xafsGroup, gfmt
 from .sigma2_models import add_sigma2funcs
+from . import feffcache
 
 SMALL_ENERGY = 1.e-6
+DERIV_STEP = 1.e-7
 
 PATH_PARS = ('degen', 's02', 'e0', 'ei', 'deltar', 'sigma2', 'third', 'fourth')
 FDAT_ARRS = ('real_phc', 'mag_feff', 'pha_feff', 'red_fact',
              'lam', 'rep', 'pha', 'amp', 'k')
+FEFF_TABLES = ('pha', 'amp', 'rep', 'lam')
 
 class FeffDatFile(Group):
-    def __init__(self, filename=None,  **kws):
+    def __init__(self, filename=None, use_cache=None, **kws):
         kwargs = dict(name='feff.dat: %s' % filename)
         kwargs.update(kws)
         Group.__init__(self,  **kwargs)
+        self.spline_tcks = None
+        if use_cache is None:
+            use_cache = feffcache.USE_FEFFCACHE
         if filename not in ('', None) and os.path.exists(filename):
-            self._read(filename)
+            if not (use_cache and self._read_cache(filename)):
+                self._read(filename)
+                if use_cache:
+                    self._write_cache(filename)
 
     def __repr__(self):
         if self.filename is not None:
@@ -119,6 +133,29 @@ class FeffDatFile(Group):
                 self.amp.tolist())
 
 
+    def _read_cache(self, filename):
+        """read Feff data from on-disk cache, returning whether successful"""
+        cached = feffcache.read_feffcache(filename)
+        if cached is None:
+            return False
+        self.filename = filename
+        self.spline_tcks = cached.pop('spline_tcks')
+        self._set_from_dict(**cached)
+        return True
+
+    def _write_cache(self, filename):
+        """calculate spline coefficients, and save to on-disk cache"""
+        if getattr(self, 'k', None) is None:
+            return
+        self.spline_tcks = {}
+        for name in FEFF_TABLES:
+            spl = UnivariateSpline(self.k, getattr(self, name), s=0)
+            self.spline_tcks[name] = spl._eval_args
+        data = {'spline_tcks': self.spline_tcks}
+        for attr in feffcache.HEADER_ATTRS + feffcache.TABLE_ARRAYS:
+            data[attr] = getattr(self, attr)
+        feffcache.write_feffcache(filename, data)
+
     def _read(self, filename):
         try:
             with open(filename, 'r') as fh:
@@ -284,7 +321,7 @@ class FeffPathGroup(Group):
                 self.third, self.fourth, self.use, _feffdat_state)
 
 
-    def __setstate__(self, state):
+    def __setstate__(self, state, spline_tcks=None):
         self.params = self.spline_coefs = self.k = self.chi = None
         self.use = True
         if len(state) == 12:  # "use" was added after paths states were being saved
@@ -298,6 +335,7 @@ class FeffPathGroup(Group):
 
         self._feffdat = FeffDatFile()
         self._feffdat.__setstate__(_feffdat_state)
+        self._feffdat.spline_tcks = spline_tcks
 
         self.create_spline_coefs()
 
@@ -328,14 +366,22 @@ class FeffPathGroup(Group):
 
     def __copy__(self):
         newpath = FeffPathGroup()
-        newpath.__setstate__(self.__getstate__())
+        newpath.__setstate__(self.__getstate__(),
+                             spline_tcks=self.__spline_tcks())
         return newpath
 
     def __deepcopy__(self, memo):
         newpath = FeffPathGroup()
-        newpath.__setstate__(self.__getstate__())
+        newpath.__setstate__(self.__getstate__(),
+                             spline_tcks=self.__spline_tcks())
         return newpath
 
+    def __spline_tcks(self):
+        """spline coefficients, to re-use in copies of path"""
+        if self.spline_coefs is None:
+            return None
+        return {name: spl._eval_args for name, spl in self.spline_coefs.items()}
+
 
     @property
     def reff(self): return self._feffdat.reff
@@ -387,13 +433,16 @@ class FeffPathGroup(Group):
             self.params[parname].is_pathparam = True
 
     def create_spline_coefs(self):
-        """pre-calculate spline coefficients for feff data"""
+        """pre-calculate spline coefficients for feff data,
+        using cached coefficients if available"""
         self.spline_coefs = {}
         fdat = self._feffdat
-        self.spline_coefs['pha'] = UnivariateSpline(fdat.k, fdat.pha, s=0)
-        self.spline_coefs['amp'] = UnivariateSpline(fdat.k, fdat.amp, s=0)
-        self.spline_coefs['rep'] = UnivariateSpline(fdat.k, fdat.rep, s=0)
-        self.spline_coefs['lam'] = UnivariateSpline(fdat.k, fdat.lam, s=0)
+        tcks = getattr(fdat, 'spline_tcks', None)
+        for name in FEFF_TABLES:
+            if tcks is not None and name in tcks:
+                self.spline_coefs[name] = UnivariateSpline._from_tck(tcks[name])
+            else:
+                self.spline_coefs[name] = UnivariateSpline(fdat.k, getattr(fdat, name), s=0)
 
     def store_feffdat(self):
         """stores data about this Feff path in the Parameters
@@ -580,6 +629,310 @@ class FeffPathGroup(Group):
 
 
 
+class FeffPathSum(object):
+    """Batched calculation of chi(k) for a list of Feff Paths
+
+    The Feff tables (pha, amp, rep, lam) of all paths are stacked into
+    2-D arrays, with one vector-valued cubic spline for each set of paths
+    sharing a k grid.  The XAFS equation is then evaluated for all paths
+    in one pass over [npaths, nk] arrays, instead of one path at a time.
+
+    Parameters:
+    ------------
+      paths:   list of FeffPath Groups or dict of {label: FeffPathGroups}
+
+    Notes:
+    -------
+      The spline tables are built when the FeffPathSum is created: make
+      a new FeffPathSum if the list of paths or their Feff data changes.
+
+      With calc_chi(..., with_derivs=True), the analytic derivatives of
+      chi(k) for each path with respect to each of its Path Parameters are
+      saved as `dchi_dpars`, with shape [len(PATH_PARS), npaths, nk].
+    """
+    def __init__(self, paths):
+        if isinstance(paths, dict):
+            paths = list(paths.values())
+        self.paths = list(paths)
+        self.params = None
+        self.pathpars = []
+        self.tables = []
+        self.pathvals = None
+        self.active = None
+        self.dchi_dpars = None
+        self.build_tables()
+
+    def build_tables(self):
+        """stack Feff tables for paths with identical k grids, and create
+        one vector-valued spline for each such set of paths"""
+        kgroups = {}
+        for ipath, path in enumerate(self.paths):
+            fdat = path._feffdat
+            key = fdat.k.tobytes()
+            if key not in kgroups:
+                kgroups[key] = (fdat.k, [])
+            kgroups[key][1].append(ipath)
+
+        self.tables = []
+        for kfeff, index in kgroups.values():
+            fdats = [self.paths[i]._feffdat for i in index]
+            # ytab has shape [nk, ntables, npaths]
+            ytab = np.array([[getattr(f, attr) for f in fdats]
+                             for attr in FEFF_TABLES]).transpose(2, 0, 1)
+            spline = make_interp_spline(kfeff, ytab, k=3)
+            self.tables.append((np.array(index), spline, spline.derivative()))
+
+    def make_kgrid(self, kmax=None, kstep=0.05):
+        """k array to use for chi(k) when none is given"""
+        if kmax is None:
+            kmax = 30.0
+        for path in self.paths:
+            kmax = min(max(path._feffdat.k), kmax)
+        if kstep is None:
+            kstep = 0.05
+        return kstep * np.arange(int(1.01 + kmax/kstep), dtype='float64')
+
+    def set_params(self, params):
+        """create Path Parameters for all paths in a Parameters namespace"""
+        self.pathpars = []
+        for path in self.paths:
+            path.create_path_params(params=params)
+            for pname in PATH_PARS:
+                parname = path.pathpar_name(pname)
+                self.pathpars.append((parname, params[parname]))
+        self.params = params
+
+    def params_current(self, params):
+        """whether the Path Parameters in params are those last created
+        by set_params(): paths with the same hashkey in other datasets
+        will replace them"""
+        if params is not self.params:
+            return False
+        for parname, par in self.pathpars:
+            if params.get(parname, None) is not par:
+                return False
+        return True
+
+    def calc_chi(self, params, k=None, kmax=None, kstep=0.05,
+                 with_derivs=False):
+        """calculate chi(k) for all paths, returning the sum of paths
+
+        Parameters:
+        ------------
+          params:  lmfit Parameters for evaluating Path Parameters
+          k:       array of k values to calculate chi.
+          kmax:    maximum k value for chi calculation, if k is None [30]
+          kstep:   step in k value for chi calculation, if k is None [0.05]
+          with_derivs: whether to also calculate derivatives of chi(k)
+                   with respect to Path Parameters [False]
+
+        Returns:
+        ---------
+          sum of chi(k) for paths
+
+        Notes:
+        -------
+          arrays k, p, chi, chi_imag are written to each path, as
+          for FeffPathGroup._calc_chi().  Path Parameters are only
+          re-created when they are not those last created.
+        """
+        if k is None:
+            k = self.make_kgrid(kmax=kmax, kstep=kstep)
+        if not self.params_current(params):
+            self.set_params(params)
+
+        npaths, nk = len(self.paths), len(k)
+        pvals = np.zeros((len(PATH_PARS), npaths), dtype='float64')
+        reff = np.ones(npaths, dtype='float64')
+        active = np.zeros(npaths, dtype=bool)
+        for ipath, path in enumerate(self.paths):
+            if not path.use:
+                continue
+            if path._feffdat.reff < 0.05:
+                print('reff is too small to calculate chi(k)')
+                continue
+            vals = path.path_paramvals()
+            pvals[:, ipath] = [vals[pname] for pname in PATH_PARS]
+            reff[ipath] = path._feffdat.reff
+            active[ipath] = True
+
+        (degen, s02, e0, ei, deltar, sigma2,
+         third, fourth) = [v[:, np.newaxis] for v in pvals]
+        reff = reff[:, np.newaxis]
+
+        # create e0-shifted energy and k, careful to look for |e0| ~= 0.
+        en = k*k - e0*ETOK
+        en[np.where(abs(en) < 1.5*SMALL_ENERGY)] = SMALL_ENERGY
+        # q is the e0-shifted wavenumber
+        q = np.sign(en)*np.sqrt(abs(en))
+
+        # lookup Feff.dat values (pha, amp, rep, lam) for all paths,
+        # evaluating splines once for each distinct value of e0
+        ftab = np.zeros((len(FEFF_TABLES), npaths, nk), dtype='float64')
+        dtab = np.zeros_like(ftab) if with_derivs else None
+        for index, spline, dspline in self.tables:
+            e0vals = e0[index, 0]
+            for e0val in np.unique(e0vals):
+                isel = np.where(e0vals == e0val)[0]
+                qsel = q[index[isel[0]]]
+                # spline(q) has shape [nk, ntables, nsel]
+                ftab[:, index[isel], :] = _eval_subspline(spline, isel, len(index),
+                                                          qsel).transpose(1, 2, 0)
+                if with_derivs:
+                    dtab[:, index[isel], :] = _eval_subspline(dspline, isel, len(index),
+                                                              qsel).transpose(1, 2, 0)
+        pha, amp, rep, lam = ftab
+
+        # p = complex wavenumber, and its square:
+        pp   = (rep + 1j/lam)**2 + 1j * ei * ETOK
+        p    = np.sqrt(pp)
+
+        # the xafs equation:
+        expfac = np.exp(-2*reff*p.imag - 2*pp*(sigma2 - pp*fourth/3) +
+                        1j*(2*q*reff + pha +
+                            2*p*(deltar - 2*sigma2/reff - 2*pp*third/3) ))
+
+        cchi = degen * s02 * amp * expfac / (q*(reff + deltar)**2)
+        cchi[:, 0] = 2*cchi[:, 1] - cchi[:, 2]
+        cchi[~active, :] = 0.0
+
+        self.pathvals = pvals
+        self.active = active
+        if with_derivs:
+            def dphase(dpp, dp):
+                "change in the XAFS exponent for changes in pp and p"
+                return (-2*reff*dp.imag + (-2*sigma2 + 4*pp*fourth/3)*dpp +
+                        2j*dp*(deltar - 2*sigma2/reff - 2*pp*third/3) -
+                        4j*p*third*dpp/3)
+
+            rnorm = expfac / (q*(reff + deltar)**2)
+            # e0 shifts q, and so all Feff tables
+            dpha, damp, drep, dlam = dtab
+            dq = -ETOK/(2*abs(q))
+            dpp_e0 = 2*(rep + 1j/lam)*(drep - 1j*dlam/lam**2) * dq
+            dcchi_e0 = (cchi*(dphase(dpp_e0, dpp_e0/(2*p)) + 1j*(2*reff + dpha)*dq) +
+                        degen*s02*rnorm*(damp - amp/q)*dq)
+            dpp_ei = 1j*ETOK * np.ones_like(pp)
+            dcchi = np.array([s02*amp*rnorm,                  # degen
+                              degen*amp*rnorm,                # s02
+                              dcchi_e0,                       # e0
+                              cchi*dphase(dpp_ei, dpp_ei/(2*p)),  # ei
+                              cchi*(2j*p - 2/(reff + deltar)),    # deltar
+                              cchi*(-2*pp - 4j*p/reff),       # sigma2
+                              cchi*(-4j*p*pp/3),              # third
+                              cchi*(2*pp*pp/3)])              # fourth
+            dcchi[:, :, 0] = 2*dcchi[:, :, 1] - dcchi[:, :, 2]
+            dcchi[:, ~active, :] = 0.0
+            self.dchi_dpars = dcchi.imag
+
+        # outputs:
+        chi = cchi.imag
+        for ipath, path in enumerate(self.paths):
+            path.k = k
+            if active[ipath]:
+                path.p = p[ipath]
+                path.chi = chi[ipath]
+                path.chi_imag = -cchi[ipath].real
+            else:
+                path.p = k
+                path.chi = 0.0 * k
+                path.chi_imag = 0.0 * k
+        return chi.sum(axis=0)
+
+    def pathpar_gradient(self, params, var_names):
+        """derivatives of Path Parameter values with respect to fit variables
+
+        Parameters:
+        ------------
+          params:     lmfit Parameters, as last used in calc_chi()
+          var_names:  list of names of variables
+
+        Returns:
+        ---------
+          array of shape [len(var_names), len(PATH_PARS), npaths]
+
+        Notes:
+        -------
+          Path Parameters are usually simple expressions of variables,
+          and are differentiated by finite differences of only those
+          expressions that depend on each variable, without re-calculating
+          chi(k).  Path Parameters with fixed values have zero derivative.
+        """
+        npaths = len(self.paths)
+        out = np.zeros((len(var_names), len(PATH_PARS), npaths), dtype='float64')
+        deps = _expr_dependencies(params)
+        # other constraints, ordered so that dependencies are evaluated first
+        constraints = [name for name, par in params.items()
+                       if name in deps and not getattr(par, 'is_pathparam', False)]
+        constraints.sort(key=lambda name: len(deps[name]))
+
+        for ivar, vname in enumerate(var_names):
+            exprpars = []
+            for ipath, path in enumerate(self.paths):
+                if not self.active[ipath]:
+                    continue
+                pexprs = []
+                for ipar, pname in enumerate(PATH_PARS):
+                    parname = path.pathpar_name(pname)
+                    if vname in deps.get(parname, ()):
+                        pexprs.append((ipar, params[parname]))
+                if len(pexprs) > 0:
+                    exprpars.append((ipath, path, pexprs))
+            if len(exprpars) == 0:
+                continue
+            vconstraints = [params[name] for name in constraints
+                            if vname in deps[name]]
+            par = params[vname]
+            value = par.value
+            step = DERIV_STEP*max(abs(value), 1.0)
+            if value + step > par.max:
+                step = -step
+            par.value = value + step
+            for cpar in vconstraints:
+                cpar._getval()
+            for ipath, path, pexprs in exprpars:
+                path.store_feffdat()
+                for ipar, ppar in pexprs:
+                    out[ivar, ipar, ipath] = (ppar._getval() -
+                                              self.pathvals[ipar, ipath])/step
+            par.value = value
+            for cpar in vconstraints:
+                cpar._getval()
+            for ipath, path, pexprs in exprpars:
+                path.store_feffdat()
+                for ipar, ppar in pexprs:
+                    ppar._getval()
+        return out
+
+
+def _expr_dependencies(params):
+    """names of all Parameters that each constrained Parameter depends on,
+    following dependencies through other constraints"""
+    deps = {}
+    def getdeps(name):
+        if name not in deps:
+            deps[name] = set()
+            out = set()
+            for dep in getattr(params[name], '_expr_deps', []):
+                if dep in params:
+                    out.add(dep)
+                    if params[dep].expr is not None:
+                        out |= getdeps(dep)
+            deps[name] = out
+        return deps[name]
+    for name, par in params.items():
+        if par.expr is not None:
+            getdeps(name)
+    return deps
+
+
+def _eval_subspline(spline, isel, nsplines, x):
+    """evaluate a subset of the splines in a vector-valued BSpline"""
+    if len(isel) < nsplines:
+        spline = BSpline.construct_fast(spline.t, spline.c[..., isel], spline.k)
+    return spline(x)
+
+
 def path2chi(path, paramgroup=None, **kws):
     """calculate chi(k) for a Feff Path,
     optionally setting path parameter values
@@ -619,8 +972,9 @@ def ff2chi(paths, group=None, paramgroup=None, k=None, kmax=None,
     ---------
        group contain arrays for k and chi
 
-    This essentially calls path2chi() for each of the paths in the
-    `paths` and writes the resulting arrays to group.k and group.chi.
+    This calculates chi(k) for all of the paths at once with a FeffPathSum,
+    writing arrays to each path as path2chi() would, and writes the
+    resulting arrays to group.k and group.chi.
 
     """
     if isinstance(paramgroup, Parameters):
@@ -644,16 +998,14 @@ def ff2chi(paths, group=None, paramgroup=None, k=None, kmax=None,
         if not isNamedClass(path, FeffPathGroup):
             print(f"{path} is not a valid Feff Path")
             return
-        path.create_path_params(params=params)
-        path._calc_chi(k=k, kstep=kstep, kmax=kmax)
-    k = pathlist[0].k[:]*1.0
-    out = np.zeros_like(k)
-    for path in pathlist:
-        out += path.chi
+    pathsum = FeffPathSum(pathlist)
+    if k is None:
+        k = pathsum.make_kgrid(kmax=kmax, kstep=kstep)
+    out = pathsum.calc_chi(params, k=k)
 
     if group is None:
         group = Group()
-    group.k = k
+    group.k = k[:]*1.0
     group.chi = out
     return group
 
@@ -23,7 +23,7 @@ from ..fitting import (correlated_values, eval_stderr, ParameterGroup,
 
 from .xafsutils import set_xafsGroup, gfmt
 from .xafsft import xftf_fast, xftr_fast, ftwindow
-from .feffdat import FeffPathGroup, ff2chi
+from .feffdat import FeffPathGroup, FeffPathSum, ff2chi
 
 class TransformGroup(Group):
     """A Group of transform parameters.
@@ -273,6 +273,7 @@ class FeffitDataSet(Group):
         else:
             self.model = model
         self.__chi = None
+        self.__pathsum = None
         self.__prepared = False
 
     def __repr__(self):
@@ -333,7 +334,8 @@ class FeffitDataSet(Group):
             path.create_path_params(params=params)
             if path.spline_coefs is None:
                 path.create_spline_coefs()
-
+        self.__pathsum = FeffPathSum(self.paths)
+        self.__pathsum.set_params(params)
         self.__prepared = True
 
 
@@ -423,16 +425,45 @@ class FeffitDataSet(Group):
         if not self.__prepared:
             self.prepare_fit(paramgroup)
 
-        ff2chi(self.paths, paramgroup=paramgroup, k=self.model.k,
-                _larch=self._larch, group=self.model)
+        if not isinstance(paramgroup, Parameters):
+            paramgroup = group2params(paramgroup)
+        self.model.chi = self.__pathsum.calc_chi(paramgroup, k=self.model.k)
+
+        diff  = (self.__chi - self.model.chi)
+        if data_only:  # for extracting transformed data separately from residual
+            diff  = self.__chi
+        return self._transform_diff(diff)
+
+    def _jacobian(self, paramgroup, var_names, **kws):
+        """return the Jacobian of the residual for this data set with
+        respect to the variables in var_names, with shape (nresid, nvars)
 
+        The derivatives of model chi(k) with respect to Path Parameters
+        are calculated analytically, and combined with derivatives of Path
+        Parameters with respect to variables by the chain rule.  As the
+        transform is linear, each column is the transform of -dchi/dvar.
+        """
+        if not isNamedClass(self.transform, TransformGroup):
+            return
+        if not self.__prepared:
+            self.prepare_fit(paramgroup)
+        if not isinstance(paramgroup, Parameters):
+            paramgroup = group2params(paramgroup)
+
+        pathsum = self.__pathsum
+        self.model.chi = pathsum.calc_chi(paramgroup, k=self.model.k,
+                                          with_derivs=True)
+        dpars = pathsum.pathpar_gradient(paramgroup, var_names)
+        dchi = np.einsum('vij,ijk->vk', dpars, pathsum.dchi_dpars)
+        return np.array([self._transform_diff(-dchi_) for dchi_ in dchi]).T
+
+    def _transform_diff(self, diff):
+        """apply the fit transform to a difference in chi(k), scaled
+        by the uncertainties, giving the residual to be minimized"""
         eps_k = self.epsilon_k
         if isinstance(eps_k, np.ndarray):
             eps_k[np.where(eps_k<1.e-12)[0]] = 1.e-12
 
-        diff  = (self.__chi - self.model.chi)
-        if data_only:  # for extracting transformed data separately from residual
-            diff  = self.__chi
         trans = self.transform
         k     = trans.k_[:len(diff)]
 
@@ -537,7 +568,8 @@ def feffit_transform(_larch=None, **kws):
     """
     return TransformGroup(_larch=_larch, **kws)
 
-def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **kws):
+def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True,
+           analytic_jacobian=False, _larch=None, **kws):
     """execute a Feffit fit: a fit of feff paths to a list of datasets
 
     Parameters:
@@ -546,6 +578,9 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
       datasets:     Feffit Dataset group or list of Feffit Dataset group.
       rmax_out:     maximum R value to calculate output arrays.
       path_output:  Flag to set whether all Path outputs should be written.
+      analytic_jacobian: Flag to use analytic derivatives of chi(k) with
+                    respect to Path Parameters for the Jacobian, instead of
+                    finite differences of the full residual [False]
 
     Returns:
     ---------
@@ -587,6 +622,11 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
         """ this is the residual function"""
         return concatenate([d._residual(params) for d in datasets])
 
+    def _jacob(params, datasets=None, pargroup=None, **kwargs):
+        """ this is the Jacobian function"""
+        var_names = [name for name, par in params.items() if par.vary]
+        return concatenate([d._jacobian(params, var_names) for d in datasets])
+
     if isNamedClass(datasets, FeffitDataSet):
         datasets = [datasets]
 
@@ -600,7 +640,10 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
                     fcn_kws=dict(datasets=datasets, pargroup=work_paramgroup),
                     scale_covar=False, **fit_kws)
 
-    result = fit.leastsq()
+    if analytic_jacobian:
+        result = fit.leastsq(Dfun=_jacob)
+    else:
+        result = fit.leastsq()
     params2group(result.params, work_paramgroup)
 
     dat = concatenate([d._residual(work_paramgroup, data_only=True) for d in datasets])
@@ -11,6 +11,7 @@ from subprocess import Popen, PIPE
 
 from larch import Group, isNamedClass
 from larch.utils import isotime, bytes2str, uname, bindir, get_cwd
+from .feffcache import prune_feffcache
 
 def find_exe(exename):
     if uname == 'win' and not exename.endswith('.exe'):
@@ -219,6 +220,8 @@ class FeffRunner(Group):
 
         if isfile(savefile):
             move(savefile, 'feff.inp')
+        # remove cached Feff path data for feffNNNN.dat files that changed
+        prune_feffcache(abspath(get_cwd()))
         os.chdir(here)
         return None
 
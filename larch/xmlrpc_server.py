@@ -6,19 +6,27 @@ from __future__ import print_function
 
 import os
 import sys
-from time import time, sleep, ctime
+import json
+import uuid
+from time import time, sleep, ctime, perf_counter
 import signal
 import socket
+import http.client
 from subprocess import Popen
-from threading import Thread
+from threading import Thread, RLock, local
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 
-from xmlrpc.server import SimpleXMLRPCServer
-from xmlrpc.client import ServerProxy
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from xmlrpc.client import ServerProxy, Fault, dumps
+
+import numpy as np
 
 from .interpreter import Interpreter
+from .symboltable import isgroup
 from .utils import uname, get_cwd
-from .utils.jsonutils import encode4js
+from .utils.jsonutils import encode4js, BINARY_DTYPE_KINDS
 
 try:
     import psutil
@@ -29,6 +37,13 @@ except ImportError:
 NOT_IN_USE, CONNECTED, NOT_LARCHSERVER = range(3)
 POLL_TIME = 0.50
 
+# number of latest request times per method kept for latency statistics
+STATS_NSAMPLES = 1000
+
+# methods that do not wait for the lock of a session
+UNLOCKED_METHODS = ('get_stats', 'new_session', 'close_session',
+                    'list_sessions')
+
 """Notes:
    0.  test server with HOST/PORT, report status (CREATED, ALREADY_RUNNING, FAILED).
    1.  prompt to kill a running server on HOST/PORT, preferably giving a
@@ -122,18 +137,82 @@ def get_next_port(host='localhost', port=4966, nmax=100):
             return ptest
     return None
 
-class LarchServer(SimpleXMLRPCServer):
-    "xml-rpc server"
-    def __init__(self, host='localhost', port=4966,
-                 logRequests=False, allow_none=True,
-                 keepalive_time=3*24*3600):
+class LarchSession:
+    """Larch interpreter for a LarchServer session, with a buffer for
+    output messages, and a lock for use from several threads"""
+    def __init__(self, name=''):
+        self.name = name
         self.out_buffer = []
-
+        self.lock = RLock()
         self.larch = Interpreter(writer=self)
         self.larch.input.prompt = ''
         self.larch.input.prompt2 = ''
         self.larch.run_init_scripts()
 
+    def write(self, text):
+        if text is None:
+            text = ''
+        self.out_buffer.append(str(text))
+
+    def flush(self):
+        pass
+
+
+class LarchRequestHandler(SimpleXMLRPCRequestHandler):
+    """request handler for LarchServer, accepting XML-RPC requests for
+    sessions at '/session/<name>', and requests for binary array data
+    at '/array' and '/session/<name>/array'"""
+
+    def is_rpc_path_valid(self):
+        return (self.path in self.rpc_paths or
+                self.path.startswith('/session/'))
+
+    def do_POST(self):
+        t0 = perf_counter()
+        if not self.path.endswith('/array'):
+            self.server.current.method = None
+            SimpleXMLRPCRequestHandler.do_POST(self)
+            if self.server.current.method is not None:
+                self.server.record_latency(self.server.current.method,
+                                           perf_counter() - t0)
+            return
+        try:
+            nbytes = int(self.headers['content-length'])
+            expr = self.rfile.read(nbytes).decode('utf-8')
+            arr = self.server.get_array(expr, path=self.path)
+        except Exception as exc:
+            self.send_response(400)
+            msg = f'{exc.__class__.__name__}: {exc}'.encode('utf-8')
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(msg)))
+            self.end_headers()
+            self.wfile.write(msg)
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(arr.nbytes))
+            self.send_header('X-Larch-Dtype', arr.dtype.str)
+            self.send_header('X-Larch-Shape', json.dumps(arr.shape))
+            self.end_headers()
+            self.wfile.write(arr.reshape(-1).view(np.uint8))
+        self.server.record_latency('get_array', perf_counter() - t0)
+
+
+class LarchServer(SimpleXMLRPCServer):
+    """xml-rpc server
+
+    With nthreads > 0, requests are handled by a pool of nthreads threads.
+    Requests for the same session are run one at a time, while requests
+    for different sessions (see new_session()) can run at the same time.
+    """
+    def __init__(self, host='localhost', port=4966,
+                 logRequests=False, allow_none=True,
+                 keepalive_time=3*24*3600, nthreads=0):
+        self.sessions = {'': LarchSession()}
+        self.sessions_lock = RLock()
+        self.current = local()
+        self.larch = self.sessions[''].larch
+
         self.larch('_sys.client = group(keepalive_time=%f)' % keepalive_time)
         self.larch('_sys.wx = group(wxapp=None)')
         _sys = self.larch.symtable._sys
@@ -147,7 +226,17 @@ class LarchServer(SimpleXMLRPCServer):
 
         self.client = self.larch.symtable._sys.client
         self.port = port
+        self.nthreads = nthreads
+        self.executor = None
+        if nthreads > 0:
+            self.executor = ThreadPoolExecutor(max_workers=nthreads)
+
+        self.stats = {}
+        self.stats_lock = RLock()
+        self.stats_start = time()
+
         SimpleXMLRPCServer.__init__(self, (host, port),
+                                    requestHandler=LarchRequestHandler,
                                     logRequests=logRequests,
                                     allow_none=allow_none)
 
@@ -157,7 +246,8 @@ class LarchServer(SimpleXMLRPCServer):
         for method in ('ls', 'chdir', 'cd', 'cwd', 'shutdown',
                         'set_keepalive_time', 'set_client_info',
                         'get_client_info', 'get_data', 'get_rawdata',
-                        'get_messages', 'len_messages'):
+                        'get_messages', 'len_messages', 'get_stats',
+                        'new_session', 'close_session', 'list_sessions'):
             self.register_function(getattr(self, method), method)
 
         # sys.stdout = self
@@ -165,10 +255,142 @@ class LarchServer(SimpleXMLRPCServer):
         signal.signal(signal.SIGINT, self.signal_handler)
         self.activity_thread = Thread(target=self.check_activity)
 
+    @property
+    def out_buffer(self):
+        return self.get_session().out_buffer
+
+    def get_session(self, path=None):
+        """get session for the current request, or for a request path"""
+        if path is None:
+            return getattr(self.current, 'session', self.sessions[''])
+        name = ''
+        if path.startswith('/session/'):
+            name = path[len('/session/'):].split('/')[0]
+        with self.sessions_lock:
+            if name not in self.sessions:
+                raise KeyError(f"no Larch session '{name}'")
+            return self.sessions[name]
+
+    def new_session(self):
+        """create a session with its own Larch interpreter, for requests
+        to the path '/session/<name>', as with
+            ServerProxy(f'http://{host}:{port}/session/{name}')
+
+        Returns:
+            name of session (str)
+        """
+        name = uuid.uuid4().hex[:16]
+        session = LarchSession(name=name)
+        with self.sessions_lock:
+            self.sessions[name] = session
+        return name
+
+    def close_session(self, name):
+        """close a session created with new_session()"""
+        with self.sessions_lock:
+            if name != '':
+                self.sessions.pop(name, None)
+        return 1
+
+    def list_sessions(self):
+        """list names of sessions created with new_session()"""
+        with self.sessions_lock:
+            return [name for name in self.sessions if name != '']
+
+    def _marshaled_dispatch(self, data, dispatch_method=None, path=None):
+        try:
+            self.current.session = self.get_session(path or '/')
+        except KeyError as exc:
+            response = dumps(Fault(1, str(exc)), allow_none=self.allow_none,
+                             encoding=self.encoding)
+            return response.encode(self.encoding, 'xmlcharrefreplace')
+        return SimpleXMLRPCServer._marshaled_dispatch(self, data,
+                                                      dispatch_method, path)
+
+    def _dispatch(self, method, params):
+        # method name for the latency statistics, see LarchRequestHandler
+        self.current.method = method
+        if method in UNLOCKED_METHODS or method.startswith('system.'):
+            return SimpleXMLRPCServer._dispatch(self, method, params)
+        with self.get_session().lock:
+            return SimpleXMLRPCServer._dispatch(self, method, params)
+
+    def process_request(self, request, client_address):
+        if self.executor is None:
+            return SimpleXMLRPCServer.process_request(self, request,
+                                                      client_address)
+        self.executor.submit(self.process_request_thread,
+                             request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        "handle one request in a thread of the thread pool"
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def record_latency(self, method, duration):
+        """record time taken to handle a request, from reading the request
+        to sending the response"""
+        with self.stats_lock:
+            if method not in self.stats:
+                self.stats[method] = {'count': 0, 'total': 0.0,
+                                      'min': duration, 'max': duration,
+                                      'times': deque(maxlen=STATS_NSAMPLES)}
+            stat = self.stats[method]
+            stat['count'] += 1
+            stat['total'] += duration
+            stat['min'] = min(stat['min'], duration)
+            stat['max'] = max(stat['max'], duration)
+            stat['times'].append(duration)
+
+    def get_stats(self, reset=False):
+        """get statistics of the time taken to handle requests
+
+        Arguments:
+            reset (bool): whether to reset the statistics [False]
+
+        Returns:
+            dictionary with 'uptime' (seconds since the start or reset of
+            statistics), 'nthreads', 'nsessions', and 'methods', a
+            dictionary of statistics for each method called, with 'count',
+            'mean', 'min', and 'max' times for all calls, and 'median' and
+            'p95' times for the latest calls, all in seconds.
+        """
+        out = {}
+        with self.stats_lock:
+            for method, stat in self.stats.items():
+                times = np.array(stat['times'])
+                out[method] = {'count': stat['count'],
+                               'mean': stat['total']/stat['count'],
+                               'min': stat['min'], 'max': stat['max'],
+                               'median': float(np.median(times)),
+                               'p95': float(np.percentile(times, 95))}
+            uptime = time() - self.stats_start
+            if reset:
+                self.stats = {}
+                self.stats_start = time()
+        return {'uptime': uptime, 'nthreads': self.nthreads,
+                'nsessions': len(self.sessions), 'methods': out}
+
+    def get_array(self, expr, path=None):
+        """evaluate a larch expression for a request for binary array data,
+        returning a contiguous numpy array"""
+        session = self.get_session(path[:-len('/array')] or '/')
+        with session.lock:
+            self.client.last_event = time()
+            out = session.larch.eval(expr)
+            if len(session.larch.error) > 0:
+                raise ValueError(session.larch.error[0].get_error()[1])
+        arr = None if isgroup(out) else np.ascontiguousarray(out)
+        if arr is None or arr.dtype.kind not in BINARY_DTYPE_KINDS + '?':
+            raise TypeError(f"'{expr}' is not a numeric or string array")
+        return arr
+
     def write(self, text):
-        if text is None:
-            text = ''
-        self.out_buffer.append(str(text))
+        self.get_session().write(text)
 
     def flush(self):
         pass
@@ -212,8 +434,9 @@ class LarchServer(SimpleXMLRPCServer):
     def get_messages(self):
         """get (and clear) all output messages (say, from "print()")
         """
-        out = "".join(self.out_buffer)
-        self.out_buffer = []
+        session = self.get_session()
+        out = "".join(session.out_buffer)
+        session.out_buffer = []
         return out
 
     def len_messages(self):
@@ -253,6 +476,8 @@ class LarchServer(SimpleXMLRPCServer):
         self.finished = True
         if self.activity_thread.is_alive():
             self.activity_thread.join(POLL_TIME)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
         return 1
 
     def check_activity(self):
@@ -270,7 +495,7 @@ class LarchServer(SimpleXMLRPCServer):
         if text in ('quit', 'exit', 'EOF'):
             self.shutdown()
         else:
-            ret = self.larch.eval(text, lineno=0)
+            ret = self.get_session().larch.eval(text, lineno=0)
             if ret is not None:
                 self.write(repr(ret))
             self.client.last_event = time()
@@ -279,12 +504,15 @@ class LarchServer(SimpleXMLRPCServer):
 
     def get_rawdata(self, expr):
         "return non-json encoded data for a larch expression"
-        return self.larch.eval(expr)
+        return self.get_session().larch.eval(expr)
 
     def get_data(self, expr):
-        "return json encoded data for a larch expression"
-        self.larch('_sys.client.last_event = %i' % time())
-        return encode4js(self.larch.eval(expr))
+        """return json encoded data for a larch expression
+
+        see also get_array() for faster transfer of large arrays
+        """
+        self.client.last_event = int(time())
+        return encode4js(self.get_session().larch.eval(expr))
 
     def run(self):
         """run server until times out"""
@@ -295,10 +523,47 @@ class LarchServer(SimpleXMLRPCServer):
             except:
                 break
 
-def spawn_server(port=4966, wait=True, timeout=30):
+def get_array(expr, host='localhost', port=4966, session=None,
+              timeout=None):
+    """get array data for a larch expression from a Larch server, sent
+    as raw binary data instead of XML-RPC
+
+    Arguments
+      expr (str): larch expression for numeric or string array
+      host (str): host name ['localhost']
+      port (int): port number [4966]
+      session (str or None): session name from new_session() [None]
+      timeout (float or None): timeout in seconds [None]
+
+    Returns
+      numpy array
+    """
+    path = '/array' if session is None else f'/session/{session}/array'
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request('POST', path, body=expr.encode('utf-8'),
+                     headers={'Content-Type': 'text/plain'})
+        resp = conn.getresponse()
+        if resp.status != 200:
+            raise ValueError(resp.read().decode('utf-8'))
+        shape = json.loads(resp.getheader('X-Larch-Shape'))
+        out = np.empty(shape, dtype=resp.getheader('X-Larch-Dtype'))
+        buff = memoryview(out.reshape(-1).view(np.uint8))
+        nread = 0
+        while nread < out.nbytes:
+            nbytes = resp.readinto(buff[nread:])
+            if nbytes == 0:
+                raise ValueError(f"incomplete data for '{expr}'")
+            nread += nbytes
+    finally:
+        conn.close()
+    return out
+
+def spawn_server(port=4966, wait=True, timeout=30, nthreads=0):
     """
     start a new process for a LarchServer on selected port,
-    optionally waiting to confirm connection
+    optionally waiting to confirm connection.  With nthreads > 0,
+    the server handles requests with a pool of nthreads threads.
     """
     topdir = sys.exec_prefix
     pyexe = os.path.join(topdir, 'bin', 'python')
@@ -309,6 +574,8 @@ def spawn_server(port=4966, wait=True, timeout=30):
 
     args = [pyexe, os.path.join(topdir, bindir, 'larch'),
             '-r', '-p', '%d' % port]
+    if nthreads > 0:
+        args.extend(['-t', '%d' % nthreads])
     pipe = Popen(args)
     if wait:
         time0 = time()
@@ -330,6 +597,7 @@ command must be one of the following:
   next        start server on next avaialable port (see also '-n' option)
   status      print a short status message: whether server< is running on port
   report      print a multi-line status report
+  stats       print statistics of the time taken to handle requests
 """
 
     parser = ArgumentParser(description='run larch XML-RPC server',
@@ -346,6 +614,10 @@ command must be one of the following:
     parser.add_argument("-q", "--quiet", dest="quiet", action="store_true",
                         default=False, help="suppress messaages [False]")
 
+    parser.add_argument("-t", "--threads", dest="nthreads", type=int,
+                        default=0,
+                        help="number of threads to handle requests [0: one request at a time]")
+
     parser.add_argument("command", nargs='?',  help="server command ['status']")
 
     args = parser.parse_args()
@@ -371,7 +643,7 @@ command must be one of the following:
         if server_state == CONNECTED:
             smsg(port, 'already running')
         elif server_state == NOT_IN_USE:
-            spawn_server(port=port)
+            spawn_server(port=port, nthreads=args.nthreads)
             smsg(port, 'started')
         else:
             smsg(port, 'port is in use, cannot start')
@@ -383,14 +655,14 @@ command must be one of the following:
 
     elif command == 'next':
         port = get_next_port(port=port)
-        spawn_server(port=port)
+        spawn_server(port=port, nthreads=args.nthreads)
         smsg(port, 'started')
 
     elif command == 'restart':
         if server_state == CONNECTED:
             ServerProxy(f'http://localhost:{port:d}').shutdown()
             sleep(POLL_TIME)
-        spawn_server(port=port)
+        spawn_server(port=port, nthreads=args.nthreads)
 
     elif command == 'status':
         if server_state == CONNECTED:
@@ -439,6 +711,23 @@ command must be one of the following:
         else:
             smsg(port, 'port is in use by non-larch server')
 
+    elif command == 'stats':
+        if server_state == CONNECTED:
+            stats = ServerProxy(f'http://localhost:{port:d}').get_stats()
+            print(f"""larch_server stats, for the last {stats['uptime']:.1f} seconds:
+   Threads = {stats['nthreads']}, Sessions = {stats['nsessions']}
+   Times in milliseconds, median and 95th percentile of latest {STATS_NSAMPLES} calls
+   {'method':>18s} {'count':>8s} {'mean':>9s} {'min':>9s} {'max':>9s} {'median':>9s} {'p95':>9s}""")
+            for method, stat in stats['methods'].items():
+                times = [1000*stat[key] for key in ('mean', 'min', 'max', 'median', 'p95')]
+                print(f"   {method:>18s} {stat['count']:8d} " +
+                      ' '.join([f'{t:9.3f}' for t in times]))
+        elif server_state == NOT_IN_USE:
+            smsg(port, 'not running')
+            sys.exit(1)
+        else:
+            smsg(port, 'port is in use by non-larch server')
+
     else:
         print(f"larch_server: unknown command '{command}'. Try -h")
 
@@ -36,7 +36,7 @@ material_add = add_material
 material_get = get_material
 
 # from .cromer_liberman import f1f2 as f1f2_cl
-from .background import XrayBackground
+from .background import XrayBackground, xray_background
 
 _larch_builtins = {'_xray': dict(chemparse=chemparse,
                                  material_get=material_get,
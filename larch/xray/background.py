@@ -43,6 +43,11 @@ background counts in each channel are then determined from:
 bgr(j) is thus the maximum counts for any of the concave down
 polynomials passing though channel j.
 
+Steps 1) and 3) are a grey-scale erosion and dilation of the spectrum with
+the polynomial as structuring element.  Each is computed as a running
+minimum or maximum over the offsets within the width of the polynomial,
+with array operations on all channels (and all spectra) at once.
+
 Before the concave-down polynomials are fitted the spectrum at each
 channel it is possible to subtract out a straight line which is
 tangent to the spectrum at that channel. Use the TANGENT qualifier to
@@ -76,11 +81,9 @@ Input Parameter Fields:
         is constrained to never be larger than the data itself. If the
         spectrum has negative noise spikes they will cause the fit to be
         too low. Compression will smooth out such noise spikes.
-        Second, the algorithm requires about 3*N**2 operations, so the time
-        required grows rapidly with the size of the input spectrum. On a
-        200 MHz Pentium it takes about 3 seconds to fit a 2048 channel
-        spectrum with COMPRESS=1 (no compression), but only 0.2 seconds
-        with COMPRESS=4 (the default).
+        Second, the algorithm requires about N*W operations, for W the
+        full width of the polynomials in channels, so the time grows
+        rapidly with the size of the input spectrum.
 
         Note - compress needs a data array that integer divisible.
 
@@ -93,7 +96,8 @@ Input Parameter Fields:
 
 Inputs to calc()
     data:
-       The raw data to fit the background
+       The raw data to fit the background, a 1-D spectrum or a 2-D
+       array with one spectrum per row.
 
     slope:
         Slope for the conversion from channel number to energy.
@@ -111,24 +115,25 @@ MAX_TANGENT=2
 
 def compress_array(array, compress):
     """
-    Compresses an 1-D array by the integer factor compress.
+    Compresses an array by the integer factor compress, along the last axis.
     near equivalent of IDL's 'rebin'....
     """
-
-    if len(array) % compress != 0:
+    array = np.asarray(array)
+    nlen = array.shape[-1]
+    if nlen % compress != 0:
         ## Trims array to be divisible by compress factor
-        rng_min = int( (len(array) % compress ) / 2)
-        rng_max = int( len(array) / compress ) * compress + 1
-        array = array[rng_min:rng_max]
+        rng_min = int( (nlen % compress ) / 2)
+        rng_max = int( nlen / compress ) * compress + 1
+        array = array[..., rng_min:rng_max]
 
-    nsize = int(len(array)/compress)
-    temp = np.resize(array, (nsize, compress))
-    return np.sum(temp, 1)/compress
+    nsize = int(array.shape[-1]/compress)
+    temp = array[..., :nsize*compress].reshape(array.shape[:-1] + (nsize, compress))
+    return np.sum(temp, -1)/compress
 
 
 def expand_array(array, expand, sample=0):
     """
-    Expands an 1-D array by the integer factor expand.
+    Expands an array by the integer factor expand, along the last axis.
 
     if 'sample' is 1 the new array is created with sampling,
     if 0 then the new array is created via interpolation (default)
@@ -137,18 +142,164 @@ def expand_array(array, expand, sample=0):
     if expand == 1:
         return array
     if sample == 1:
-        return np.repeat(array, expand)
+        return np.repeat(array, expand, axis=-1)
 
+    array = np.asarray(array)
     kernel = np.ones(expand)/expand
-    # The following mimic the behavior of IDL's rebin when expanding
-    temp = np.convolve(np.repeat(array, expand), kernel, mode=2)
+    # The following mimic the behavior of IDL's rebin when expanding.
+    # Spectra are convolved end to end: the values that mix neighboring
+    # spectra are replaced below
+    temp = np.convolve(np.repeat(array, expand, axis=-1).ravel(), kernel, mode=2)
     # Discard the first "expand-1" entries
-    temp = temp[expand-1:]
+    temp = temp[expand-1:expand-1+array.size*expand].reshape(
+        array.shape[:-1] + (array.shape[-1]*expand,))
     # Replace the last "expand" entries with the last entry of original
-    for i in range(1,expand):
-        temp[-i]=array[-1]
+    temp[..., 1-expand:] = array[..., -1:]
     return temp
 
+
+def poly_envelope(data, polynom, half_width, tangent=False, bgr0=-HUGE):
+    """lower envelope of concave down polynomials, for one or more spectra
+
+    Arguments:
+    ----------
+    data        2-D array of spectra, one spectrum per row
+    polynom     function of the channel offset k, returning an array with
+                the polynomial value at k for each spectrum (np.inf
+                for |k| > half_width)
+    half_width  array of the half width of the polynomials, in channels,
+                for each spectrum
+    tangent     whether to tilt the polynomials to the tangent of the
+                spectrum at each channel [False]
+    bgr0        initial value of the background [-HUGE]
+
+    Returns:
+    --------
+    background array, with the same shape as data
+
+    Notes:
+    ------
+    The polynomials are centered on all but the last channel.  The height
+    of each polynomial is the minimum over its offsets (an erosion), and the
+    background is the maximum over the offsets of the polynomials reaching
+    each channel (a dilation), so that the work goes as the number of
+    channels times the width of the polynomials.
+    """
+    nrows, nchans = data.shape
+    half_width = np.asarray(half_width)
+    maxoff = int(half_width.max())
+    chans = np.arange(nchans)
+
+    if tangent:
+        # slope of tangent to spectrum at each channel
+        chan0 = np.maximum(chans - MAX_TANGENT, 0)
+        chan1 = np.minimum(chans + MAX_TANGENT, nchans-1)
+        denom = np.maximum(chans, 1)
+        tan_slope = np.zeros(data.shape)
+        for k in range(-MAX_TANGENT, MAX_TANGENT+1):
+            lo, hi = max(0, -k), min(nchans, nchans-k)
+            tan_slope[:, lo:hi] += (data[:, lo:hi] - data[:, lo+k:hi+k]) / denom[lo:hi]
+        tan_slope = tan_slope / np.maximum(chan1 - chan0, 1)
+
+        # offset of each channel from the center of its window
+        chan0 = np.maximum(chans - half_width[:, None], 0)
+        chan1 = np.minimum(chans + half_width[:, None], nchans-1)
+        win_offset = chans - chan0 - (chan1 - chan0 + 1)/2
+
+    def lin_offset(k, lo, hi):
+        if tangent:
+            return data[:, lo:hi] + (k + win_offset[:, lo:hi]) * tan_slope[:, lo:hi]
+        return data[:, lo:hi]
+
+    # maximum height of the polynomial centered on each channel such that
+    # it is never higher than the counts in any channel
+    height = np.full(data.shape, np.inf)
+    for k in range(-maxoff, maxoff+1):
+        lo, hi = max(0, -k), min(nchans, nchans-k)
+        if lo >= hi:
+            continue
+        test = data[:, lo+k:hi+k] - lin_offset(k, lo, hi) + polynom(k)[:, None]
+        np.minimum(height[:, lo:hi], test, out=height[:, lo:hi])
+
+    # background is the maximum of the polynomials at each channel
+    bckgnd = np.full(data.shape, bgr0, dtype=np.float64)
+    for k in range(-maxoff, maxoff+1):
+        lo, hi = max(0, -k), min(nchans-1, nchans-k)
+        if lo >= hi:
+            continue
+        test = height[:, lo:hi] + lin_offset(k, lo, hi) - polynom(k)[:, None]
+        np.maximum(bckgnd[:, lo+k:hi+k], test, out=bckgnd[:, lo+k:hi+k])
+    return bckgnd
+
+
+def xray_background(data, width=4, slope=1.0, exponent=2, compress=2,
+                    tangent=False, type_int=False):
+    """background of x-ray spectra, as lower envelope of concave down polynomials
+
+    Arguments:
+    ----------
+    data       spectrum, or 2-D array of spectra with one spectrum per row
+    width      full width in energy units of the polynomials
+               at 100 counts [4]
+    slope      slope of conversion of channels to energy [1.0]
+    exponent   power of the polynomials [2]
+    compress   compression factor applied before fitting [2]
+    tangent    whether to tilt the polynomials to the tangent
+               of the spectrum [False]
+    type_int   whether to return an integer background [False]
+
+    Returns:
+    --------
+    background array.  With compression, it may be a few channels
+    shorter than the data.
+
+    See Also:
+    ---------
+    XrayBackground
+    """
+    scratch = np.array(data, dtype=np.float64, ndmin=2)
+
+    # Compress scratch spectrum
+    if compress > 1:
+        scratch = compress_array(scratch, compress)
+        slope = slope * compress
+    nrows, nchans = scratch.shape
+
+    denom = max(TINY, (width / (2. * slope)**exponent))
+    indices     = np.arange(nchans*2+1, dtype=np.float64) - nchans
+    power_funct = indices**exponent  * (REFERENCE_AMPL / denom)
+
+    # The maximum counts in each spectrum limit the size of the function
+    # lookup table.  Spectra keeping the same number of values of
+    # the function share the same table.
+    levels = np.sort(power_funct)
+    nkeep = np.searchsorted(levels, scratch.max(axis=1), side='right')
+    nkeep, itable = np.unique(np.maximum(nkeep, 1), return_inverse=True)
+    half_width = np.maximum((nkeep/2 - 1).astype(int), 0)
+    maxoff = half_width.max()
+    tables = np.full((len(nkeep), 2*maxoff+1), np.inf)
+    for i, (nk, hw) in enumerate(zip(nkeep, half_width)):
+        funct = np.compress(power_funct <= levels[nk-1], power_funct)
+        tables[i, maxoff-hw:maxoff+hw+1] = funct[:2*hw+1]
+
+    bckgnd = poly_envelope(scratch, lambda k: tables[itable, maxoff+k],
+                           half_width[itable], tangent=tangent)
+
+    # Expand spectrum
+    if compress > 1:
+        bckgnd = expand_array(bckgnd, compress)
+
+    ## No negative values in background
+    bckgnd[np.where(bckgnd <= 0)] = 0
+
+    ## Set background to be of type integer
+    if type_int:
+        bckgnd = bckgnd.astype(int)
+    if np.ndim(data) == 1:
+        bckgnd = bckgnd[0]
+    return bckgnd
+
+
 class XrayBackground:
     '''
     Class defining a spectrum background
@@ -187,89 +338,14 @@ class XrayBackground:
 
         Parameters:
         -----------
-        * data is the spectrum
+        * data is the spectrum, or a 2-D array of spectra, one per row
         * slope is the slope of conversion channels to energy
         '''
 
         if data is None:
             data = self.data
 
-        width    = self.width
-        exponent = self.exponent
-        tangent  = self.tangent
-        compress = self.compress
-
-        nchans   = len(data)
-        self.bgr = np.zeros(nchans, dtype=np.int32)
-        scratch  = 1.0*data[:]
-
-        # Compress scratch spectrum
-        if compress > 1:
-            tmp = compress_array(scratch, compress)
-            if tmp is None:
-                compress = 1
-            else:
-                scratch = tmp
-                slope = slope * compress
-                nchans = len(scratch) #nchans / compress
-
-        # Copy scratch spectrum to background spectrum
-        bckgnd = 1.0*scratch[:]
-
-        # Find maximum counts in input spectrum. This information is used to
-        # limit the size of the function lookup table
-        max_counts = max(scratch)
-
-        # Fit functions which come up from below
-        bckgnd = np.arange(nchans, dtype=np.float64) - HUGE
-
-        denom = max(TINY, (width / (2. * slope)**exponent))
-
-        indices     = np.arange(nchans*2+1, dtype=np.float64) - nchans
-        power_funct = indices**exponent  * (REFERENCE_AMPL / denom)
-        power_funct = np.compress((power_funct <= max_counts), power_funct)
-        max_index   = int(len(power_funct)/2 - 1)
-        for chan in range(nchans-1):
-            tan_slope = 0.
-            if tangent:
-                # Find slope of tangent to spectrum at this channel
-                chan0  = max((chan - MAX_TANGENT), 0)
-                chan1  = min((chan + MAX_TANGENT), (nchans-1))
-                denom  = chan - np.arange(chan1 - chan0 + 1, dtype=np.float64)
-                # is this correct?
-                denom   = max(max(denom), 1)
-                tan_slope = (scratch[chan] - scratch[chan0:chan1+1]) / denom
-                tan_slope = np.sum(tan_slope) / (chan1 - chan0)
-
-            chan0 = int(max((chan - max_index), 0))
-            chan1 = int(min((chan + max_index), (nchans-1)))
-            chan1 = max(chan1, chan0)
-            nc    = chan1 - chan0 + 1
-            lin_offset = scratch[chan] + (np.arange(float(nc)) - nc/2) * tan_slope
-
-            # Find the maximum height of a function centered on this channel
-            # such that it is never higher than the counts in any channel
-            f      = int(chan0 - chan + max_index)
-            l      = int(chan1 - chan + max_index)
-            test   = scratch[chan0:chan1+1] - lin_offset + power_funct[f:l+1]
-            height = min(test)
-
-            # We now have the function height. Set the background to the
-            # height of the maximum function amplitude at each channel
-
-            test = height + lin_offset - power_funct[f:l+1]
-            sub  = bckgnd[chan0:chan1+1]
-            bckgnd[chan0:chan1+1] = np.maximum(sub, test)
-
-        # Expand spectrum
-        if compress > 1:
-            bckgnd = expand_array(bckgnd, compress)
-
-        ## Set background to be of type integer
-        if type_int:
-            bckgnd = bckgnd.astype(int)
-
-        ## No negative values in background
-        bckgnd[np.where(bckgnd <= 0)] = 0
-
-        self.bgr = bckgnd
+        self.bgr = xray_background(data, width=self.width, slope=slope,
+                                   exponent=self.exponent,
+                                   compress=self.compress,
+                                   tangent=self.tangent, type_int=type_int)
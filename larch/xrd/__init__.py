@@ -19,7 +19,8 @@ from .xrd_tools import (d_from_q, d_from_twth, twth_from_d, twth_from_q,
                         unit_cell_volume, generate_hkl)
 
 
-from .amcsd import CifStructure, get_amcsd, get_cif, find_cifs, parse_cif_file
+from .amcsd import (CifStructure, get_amcsd, get_cif, find_cifs, parse_cif_file,
+                    get_structure_factors)
 
 from .xrd_files import xy_file_reader
 
@@ -65,6 +66,7 @@ _larch_builtins = {'_xrd':  {'d_from_q': d_from_q,
                              'get_amcsd': get_amcsd,
                              'get_cif': get_cif,
                              'find_cifs': find_cifs,
+                             'get_structure_factors': get_structure_factors,
                              }}
 
 
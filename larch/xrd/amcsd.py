@@ -60,6 +60,10 @@ from .. import logger
 
 _CIFDB = None
 ALL_HKLS = None
+# reflections found with CifStructure.find_hkls(), by (ams_id, nmax, qmax, wavelength)
+HKL_CACHE = {}
+# max number of hkl*site phases calculated at once in calculate_f2()
+F2_BLOCKSIZE = 2**20
 AMCSD_TRIM = 'amcsd_cif1.db'
 AMCSD_FULL = 'amcsd_cif2.db'
 
@@ -392,7 +396,15 @@ class CifStructure():
         only the most important HKL values.
 
         returns hkls, degen of the nmax reflections with the highest scattered intensity
+
+        results are cached by ams_id in HKL_CACHE
         """
+        cachekey = (self.ams_id, nmax, qmax, wavelength)
+        if self.ams_id is not None and cachekey in HKL_CACHE:
+            hkls_main, degen_main = HKL_CACHE[cachekey]
+            self.hkls = pack_hkl_degen(hkls_main, degen_main)
+            return hkls_main, degen_main
+
         self.get_pmg_struct()
 
         pstruct = self.pmg_pstruct
@@ -416,20 +428,11 @@ class CifStructure():
 
         # find duplicate q-values, set degen
         # scale up q values to better find duplicates
-        qscaled = [int(round(q*1.e9)) for q in qhkls]
-        q_unique, q_degen, hkl_unique = [], [], []
-        for i, q in enumerate(qscaled):
-            if q in q_unique:
-                q_degen[q_unique.index(q)] += 1
-            else:
-                q_unique.append(q)
-                q_degen.append(1)
-                hkl_unique.append(hkls[i])
-
-        qorder = np.argsort(q_unique)
-        qhkls  = 1.e-9*np.array(q_unique)[qorder]
-        hkls   = abs(np.array(hkl_unique)[qorder])
-        degen  = np.array(q_degen)[qorder]
+        qscaled = np.round(qhkls*1.e9).astype(np.int64)
+        q_unique, i_unique, degen = np.unique(qscaled, return_index=True,
+                                              return_counts=True)
+        qhkls  = 1.e-9*q_unique
+        hkls   = abs(hkls[i_unique])
 
         # note the f2 is calculated here without resonant corrections
         f2 = self.calculate_f2(hkls, qhkls=qhkls, wavelength=None)
@@ -459,6 +462,10 @@ class CifStructure():
         hkls_main, degen_main = hkls[main_peaks], degen[main_peaks]
         if self.ams_db is not None:
             self.hkls = self.ams_db.set_hkls(self.ams_id, hkls_main, degen_main)
+        else:
+            self.hkls = pack_hkl_degen(hkls_main, degen_main)
+        if self.ams_id is not None:
+            HKL_CACHE[cachekey] = (hkls_main, degen_main)
 
         return hkls_main, degen_main
 
@@ -523,26 +530,32 @@ class CifStructure():
         if energy is None and wavelength is not None:
             energy = E_from_lambda(wavelength, E_units='eV')
 
-        # get f0 and resonant scattering factors
-        f0vals, f1vals, f2vals = {}, {}, {}
-        for elem in sites.keys():
-            if elem not in f0vals:
-                f0vals[elem] = f0(elem, sq)
-                if energy is not None:
-                    f1vals[elem] = f1_chantler(elem, energy)
-                    f2vals[elem] = f2_chantler(elem, energy)
-
-        # and f2
+        # site coordinates, and occupancies for each element (nsites, nelems)
+        elems = list(sites.keys())
+        fcoords = np.array([fcoord for elem in elems
+                            for occu, fcoord in sites[elem]], dtype=float)
+        occupancy = np.zeros((len(fcoords), len(elems)))
+        isite = 0
+        for ielem, elem in enumerate(elems):
+            for occu, fcoord in sites[elem]:
+                occupancy[isite, ielem] = occu
+                isite += 1
+
+        # f0 and resonant scattering factors for each element (nhkls, nelems)
+        fvals = np.array([f0(elem, sq) for elem in elems], dtype=complex).T
+        if energy is not None:
+            fvals += np.array([f1_chantler(elem, energy) - 1j*f2_chantler(elem, energy)
+                               for elem in elems])
+
+        # F(hkl) = sum over sites of f(q)*occu*exp(2 pi i hkl.r), done in
+        # blocks of hkls to limit the size of the (nhkls, nsites) phases
+        hkls = np.asarray(hkls, dtype=float)
         f2 = np.zeros(len(hkls))
-        for i, hkl in enumerate(hkls):
-            fsum = 0.
-            for elem in f0vals:
-                fval = f0vals[elem][i]
-                if energy is not None:
-                    fval += f1vals[elem] - 1j*f2vals[elem]
-                for occu, fcoord in sites[elem]:
-                    fsum += fval*occu*np.exp(1j*TAU*(fcoord*hkl).sum())
-            f2[i] = (fsum*fsum.conjugate()).real
+        nblock = max(1, F2_BLOCKSIZE//max(1, len(fcoords)))
+        for i in range(0, len(hkls), nblock):
+            phases = np.exp(1j*TAU*(hkls[i:i+nblock] @ fcoords.T))
+            fsum = ((phases @ occupancy) * fvals[i:i+nblock]).sum(axis=1)
+            f2[i:i+nblock] = (fsum*fsum.conjugate()).real
         return f2
 
 
@@ -1344,6 +1357,19 @@ def get_cif(ams_id):
     db = get_amcsd()
     return db.get_cif(ams_id)
 
+def get_structure_factors(ams_ids, wavelength=0.75):
+    """
+    get structure factors for a list of AMS IDs
+
+    returns dict of StructureFactor by AMS ID, using the reflections
+    stored in the database or cached from CifStructure.find_hkls()
+    """
+    db = get_amcsd()
+    out = {}
+    for ams_id in ams_ids:
+        out[ams_id] = db.get_cif(ams_id).get_structure_factors(wavelength=wavelength)
+    return out
+
 def find_cifs(mineral_name=None, journal_name=None, author_name=None,
               contains_elements=None, excludes_elements=None,
               strict_contains=False, full_occupancy=False):
@@ -13,7 +13,9 @@ from .xrd_cif import create_xrdcif, SPACEGROUPS
 from .xrd_tools import lambda_from_E
 
 import json
+from scipy import sparse
 from larch.utils.jsonutils import encode4js, decode4js
+from larch.site_config import user_larchdir
 
 from sqlalchemy import (create_engine, MetaData, Table, Column, Integer,
                         String, Unicode, PrimaryKeyConstraint,
@@ -77,6 +79,9 @@ QMAX = 10.0
 QSTEP = 0.01
 QAXIS = np.arange(QMIN, QMAX+QSTEP, QSTEP)
 
+## bin widths of the q index
+QINDEX_STEPS = (0.01, 0.02, 0.05, 0.10)
+
 ENERGY = 19000 ## units eV
 _cifdb = None
 
@@ -124,6 +129,164 @@ def iscifDB(dbname):
     return result
 
 
+
+def nearest_bins(qaxis, q):
+    "index of the nearest value in a uniform, increasing qaxis for each q"
+    q = np.asarray(q, dtype=float)
+    i = np.clip(np.searchsorted(qaxis, q), 1, len(qaxis)-1)
+    # ties go to the lower bin, as with argmin
+    return np.where(q - qaxis[i-1] <= qaxis[i] - q, i-1, i)
+
+class QIndex(object):
+    '''
+    inverted index from q bins to structures, at several bin widths
+
+    For each bin width qstep, bins[qstep] is a sparse (nbins, nstructures)
+    matrix with the structures having a peak in each q bin, for the bins
+    at qaxes[qstep].  Structures are in the order of amcsd.
+    '''
+    def __init__(self, amcsd, axis, peaks, qsteps=QINDEX_STEPS, signature=''):
+        """
+        amcsd      array of amcsd ids
+        axis       q values of the database
+        peaks      sparse (nstructures, len(axis)) matrix, 1 for the q values
+                   of the peaks of each structure
+        qsteps     bin widths to index
+        signature  string identifying the database version
+        """
+        self.amcsd = np.asarray(amcsd)
+        self.axis = np.asarray(axis, dtype=float)
+        self.peaks = sparse.csr_matrix(peaks, dtype=np.int8)
+        self.signature = signature
+        self.qaxes, self.bins = {}, {}
+        for qstep in qsteps:
+            self.get_bins(qstep)
+
+    def get_bins(self, qstep=None, qmin=None, qmax=None):
+        """q values and inverted index for a bin width, made if needed.
+        Widths below the step of the database give the database q values.
+
+        With qmin or qmax, the bins start at the database q value nearest
+        qmin and stop before the one nearest qmax, as for amcsd_by_q().
+        These bins are not kept.
+        """
+        stepq = self.axis[1] - self.axis[0]
+        if qstep is None or qstep <= stepq:
+            qstep = round(stepq, 6)
+        qstep = round(qstep, 6)
+        imin, imax = 0, len(self.axis)
+        if qmin is not None and qmin > self.axis.min():
+            imin = abs(self.axis-qmin).argmin()
+        if qmax is not None and qmax < self.axis.max():
+            imax = abs(self.axis-qmax).argmin()
+        if imin > 0 or imax < len(self.axis):
+            return self._rebin(self.axis[imin:imax],
+                               self.peaks[:, imin:imax], qstep)
+        if qstep not in self.bins:
+            self.qaxes[qstep], self.bins[qstep] = self._rebin(self.axis,
+                                                              self.peaks, qstep)
+        return self.qaxes[qstep], self.bins[qstep]
+
+    def _rebin(self, axis, peaks, qstep):
+        "bins of width qstep for peaks on axis, each in the nearest bin"
+        stepq = axis[1] - axis[0]
+        qaxis = axis
+        if qstep > stepq:
+            qaxis = np.arange(axis.min(), axis.max()+stepq, qstep)
+        rebin = sparse.csr_matrix((np.ones(len(axis), dtype=np.int8),
+                                   (np.arange(len(axis)),
+                                    nearest_bins(qaxis, axis))),
+                                  shape=(len(axis), len(qaxis)))
+        binned = (peaks @ rebin).T.tocsr()
+        binned.data[:] = 1
+        return qaxis, binned
+
+    def save(self, fname):
+        "save index to a .npz file"
+        arrays = {'amcsd': self.amcsd, 'axis': self.axis,
+                  'signature': np.array(self.signature),
+                  'qsteps': np.array(sorted(self.bins))}
+        for i, qstep in enumerate(sorted(self.bins)):
+            binned = self.bins[qstep]
+            arrays['qaxis%d' % i] = self.qaxes[qstep]
+            arrays['indptr%d' % i] = binned.indptr
+            arrays['indices%d' % i] = binned.indices
+        peaks = self.peaks
+        arrays.update({'peaks_indptr': peaks.indptr,
+                       'peaks_indices': peaks.indices})
+        np.savez_compressed(fname, **arrays)
+
+    @classmethod
+    def load(cls, fname):
+        "read index from a .npz file"
+        out = cls.__new__(cls)
+        with np.load(fname) as npz:
+            out.amcsd, out.axis = npz['amcsd'], npz['axis']
+            out.signature = str(npz['signature'])
+            nstruct, naxis = len(out.amcsd), len(out.axis)
+            indices = npz['peaks_indices']
+            out.peaks = sparse.csr_matrix((np.ones(len(indices), dtype=np.int8),
+                                           indices, npz['peaks_indptr']),
+                                          shape=(nstruct, naxis))
+            out.qaxes, out.bins = {}, {}
+            for i, qstep in enumerate(npz['qsteps']):
+                qstep = round(float(qstep), 6)
+                qaxis = out.qaxes[qstep] = npz['qaxis%d' % i]
+                indices = npz['indices%d' % i]
+                out.bins[qstep] = sparse.csr_matrix(
+                    (np.ones(len(indices), dtype=np.int8), indices,
+                     npz['indptr%d' % i]), shape=(len(qaxis), nstruct))
+        return out
+
+    def match(self, patterns, qstep=None, qtol=0, qmin=None, qmax=None,
+              list=None):
+        """match lists of peak positions to structures
+
+        Arguments:
+        ----------
+        patterns  list of arrays of q values of peaks, one array per pattern
+        qstep     bin width [None, using the database q values]
+        qtol      tolerance in q for a peak to match a bin [0].  Each peak
+                  matches the nearest bin and all bins within qtol.
+        qmin      minimum q for bins to compare [None, all q]
+        qmax      maximum q for bins to compare [None, all q].  See
+                  get_bins() for the bins used with qmin or qmax.
+        list      list of amcsd ids to compare [None, all structures]
+
+        Returns:
+        --------
+        sparse (npatterns, nstructures) matrix of the number of bins with
+        peaks that are matched, with entries only for candidate structures,
+        and array of the number of bins with peaks for each structure.
+        """
+        qaxis, binned = self.get_bins(qstep, qmin=qmin, qmax=qmax)
+        nbins = len(qaxis)
+
+        # bins matched by peaks of each pattern: from the first bin within
+        # qtol below the peak to the last bin within qtol above it,
+        # and the nearest bin.  Peaks outside the bins match the end bins.
+        rows = np.concatenate([np.full(len(p), i) for i, p in enumerate(patterns)] +
+                              [np.zeros(0, dtype=int)]).astype(int)
+        qpeaks = np.concatenate([np.asarray(p, dtype=float).ravel()
+                                 for p in patterns] + [np.zeros(0)])
+        near = nearest_bins(qaxis, qpeaks)
+        lo = np.minimum(np.searchsorted(qaxis, qpeaks - qtol, side='left'), near)
+        hi = np.maximum(np.searchsorted(qaxis, qpeaks + qtol, side='right'), near+1)
+        nper = hi - lo
+        starts = np.repeat(lo - np.cumsum(nper) + nper, nper)
+        cols = starts + np.arange(nper.sum())
+        rows = np.repeat(rows, nper)
+        matched = sparse.csr_matrix((np.ones(len(cols), dtype=np.int32),
+                                     (rows, cols)),
+                                    shape=(len(patterns), nbins))
+        matched.data[:] = 1
+
+        if list is not None:
+            use = np.isin(self.amcsd, np.asarray(list)).astype(np.int8)
+            binned = binned @ sparse.diags(use, dtype=np.int8)
+        total = np.asarray(binned.sum(axis=0), dtype=int).ravel()
+        return (matched @ binned).tocsr(), total
+
 class cifDB(object):
     '''
     interface to the American Mineralogist Crystal Structure Database
@@ -749,11 +912,8 @@ class cifDB(object):
         if qstep > stepq:
             new_qaxis   = np.arange(np.min(qaxis),np.max(qaxis)+stepq,qstep)
             new_q_amcsd = np.zeros((np.shape(q_amcsd)[0],np.shape(new_qaxis)[0]))
-            for m,qrow in enumerate(q_amcsd):
-                for n,qn in enumerate(qrow):
-                    if qn == 1:
-                        k = np.abs(new_qaxis-qaxis[n]).argmin()
-                        new_q_amcsd[m][k] = 1
+            rows, cols = np.nonzero(np.array(q_amcsd) == 1)
+            new_q_amcsd[rows, nearest_bins(new_qaxis, qaxis[cols])] = 1
             qaxis = new_qaxis
             q_amcsd = new_q_amcsd
 
@@ -775,6 +935,103 @@ class cifDB(object):
         return sorted(zip(scores, amcsd, total_peaks, match_peaks, miss_peaks), reverse=True)
 
 
+    def get_qindex(self, fname=None, rebuild=False):
+        """inverted index from q bins to structures, as QIndex
+
+        The index is read from fname, or built from the database and saved
+        to fname if fname does not exist or is for a different version of
+        the database.  By default fname is in the larch user folder.
+        """
+        signature = '%s:%d:%d' % (os.path.basename(self.dbname),
+                                  os.path.getsize(self.dbname),
+                                  self.cif_count())
+        qindex = getattr(self, '_qindex', None)
+        if qindex is not None and qindex.signature == signature and not rebuild:
+            return qindex
+        if fname is None:
+            name = os.path.splitext(os.path.basename(self.dbname))[0]
+            fname = os.path.join(user_larchdir, 'xrd', 'qindex_%s.npz' % name)
+        qindex = None
+        if os.path.exists(fname) and not rebuild:
+            try:
+                qindex = QIndex.load(fname)
+            except (OSError, KeyError, ValueError):
+                qindex = None
+            if qindex is not None and qindex.signature != signature:
+                qindex = None
+        if qindex is None:
+            amcsd, q_amcsd = self.match_qc()
+            qindex = QIndex(amcsd, self.axis,
+                            sparse.csr_matrix(np.array(q_amcsd) == 1),
+                            signature=signature)
+            try:
+                os.makedirs(os.path.dirname(fname), exist_ok=True)
+                qindex.save(fname)
+            except OSError:
+                pass
+        self._qindex = qindex
+        return qindex
+
+    def match_peaks_batch(self, patterns, qstep=None, qtol=0, qmin=None,
+                          qmax=None, list=None, minscore=None, nmax=None):
+        """match lists of peak positions to structures, using the q index
+
+        Arguments:
+        ----------
+        patterns  list of arrays of q values of peaks, for example one
+                  array for each pixel of an XRD map
+        qstep     bin width of q for comparing peaks [None, the q step
+                  of the database, 0.01]
+        qtol      tolerance in q for a peak to match a bin [0]. Each peak
+                  matches the nearest bin and all bins within qtol.
+        qmin      minimum q to compare [None, all q]
+        qmax      maximum q to compare [None, all q].  As for amcsd_by_q(),
+                  peaks outside the range match the bins at its ends.
+        list      list of amcsd ids to compare [None, all structures]
+        minscore  minimum score of returned matches [None]
+        nmax      maximum number of returned matches per pattern [None]
+
+        Returns:
+        --------
+        list for each pattern of (score, amcsd, total_peaks, match_peaks,
+        miss_peaks) for the structures with at least one matched peak,
+        sorted by score, as from amcsd_by_q().  total_peaks is the number
+        of bins with a peak for the structure, match_peaks the number of
+        these matched by peaks of the pattern, miss_peaks the number not
+        matched, and score is match_peaks - miss_peaks.
+        """
+        qindex = self.get_qindex()
+        matched, total = qindex.match(patterns, qstep=qstep, qtol=qtol,
+                                      qmin=qmin, qmax=qmax, list=list)
+        matched.eliminate_zeros()
+        out = []
+        for i in range(matched.shape[0]):
+            start, end = matched.indptr[i], matched.indptr[i+1]
+            icand = matched.indices[start:end]
+            match = matched.data[start:end].astype(int)
+            totals = total[icand]
+            scores = 2*match - totals
+            ids = qindex.amcsd[icand]
+            order = np.lexsort((ids, scores))[::-1]
+            if minscore is not None:
+                order = order[scores[order] >= minscore]
+            if nmax is not None:
+                order = order[:nmax]
+            out.append([(scores[j], ids[j], totals[j], match[j],
+                         totals[j]-match[j]) for j in order])
+        return out
+
+    def match_peaks(self, peaks, qstep=None, qtol=0, qmin=None, qmax=None,
+                    list=None, minscore=None, nmax=None):
+        """match peak positions to structures, using the q index
+
+        Like amcsd_by_q(), but returning only the structures with at least
+        one matched peak.  See match_peaks_batch() for arguments.
+        """
+        return self.match_peaks_batch([peaks], qstep=qstep, qtol=qtol,
+                                      qmin=qmin, qmax=qmax, list=list,
+                                      minscore=minscore, nmax=nmax)[0]
+
     def amcsd_by_chemistry(self, include=[], exclude=[]):
 
         amcsd_incld = []
@@ -1248,11 +1505,9 @@ def match_database(cifdb, peaks, minq=QMIN, maxq=QMAX, verbose=True):
     pk_wid : maximum range in q which qualifies as a match between fitted and ideal
     """
     stepq = 0.05
-    scores,amcsd,total_peaks,match_peaks,miss_peaks = zip(*cifdb.amcsd_by_q(peaks,
-                                                       qmin=minq,qmax=maxq,qstep=stepq,
-                                                       list=None,verbose=False))
-
-    MATCHES = [match for i,match in enumerate(amcsd) if scores[i] > 0]
+    rows = cifdb.match_peaks(peaks, qstep=stepq, qmin=minq, qmax=maxq,
+                             minscore=1)
+    MATCHES = [row[1] for row in rows]
 
     if verbose:
         print('\n')
@@ -1260,15 +1515,11 @@ def match_database(cifdb, peaks, minq=QMIN, maxq=QMAX, verbose=True):
             print('DISPLAYING TOP 100 of %i TOTAL MATCHES FOUND.' % len(MATCHES))
         else:
             print('%i TOTAL MATCHES FOUND.' % len(MATCHES))
-        j = 0
-        for i,id_no in enumerate(amcsd):
-            if j < 100:
-                if scores[i] > 0:
-                    j += 1
-                    str = 'AMCSD %5d, %s (score of %2d --> %i of %i peaks)' % (id_no,
-                             cifdb.mineral_by_amcsd(id_no),scores[i],
-                             match_peaks[i],total_peaks[i])
-                    print(str)
+        for score, id_no, total_peaks, match_peaks, miss_peaks in rows[:100]:
+            str = 'AMCSD %5d, %s (score of %2d --> %i of %i peaks)' % (id_no,
+                     cifdb.mineral_by_amcsd(id_no),score,
+                     match_peaks,total_peaks)
+            print(str)
         print('')
 
     return MATCHES
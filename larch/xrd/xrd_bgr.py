@@ -14,7 +14,8 @@ def xrd_background(xdata, ydata, width=4, compress=5, exponent=2, slope=None):
     ---------
     xdata     array of q values (or 2th, d?)
 
-    ydata     associated array of I values
+    ydata     associated array of I values, or 2-D array with
+              one pattern per row
 
     group     group for outputs
 
@@ -39,5 +40,5 @@ def xrd_background(xdata, ydata, width=4, compress=5, exponent=2, slope=None):
 
     xb = XrayBackground(ydata, width=width, compress=compress,
                         exponent=exponent, slope=slope, tangent=True)
-    bgr[:len(xb.bgr)] = xb.bgr
+    bgr[..., :xb.bgr.shape[-1]] = xb.bgr
     return bgr
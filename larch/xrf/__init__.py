@@ -10,7 +10,7 @@ create_roi       create an ROI
 
 from .mca import MCA, isLarchMCAGroup, Environment, create_mca
 from .roi import ROI, split_roiname, create_roi
-from .deadtime import calc_icr, correction_factor
+from .deadtime import calc_icr, solve_icr, correction_factor
 from .xrf_bgr import xrf_background
 
 from .xrf_calib import (xrf_calib_fitrois, xrf_calib_compute,
@@ -148,12 +148,13 @@ Example:
 import numpy as np
 import scipy
 from scipy.optimize import leastsq
+from scipy.special import lambertw
 from scipy.stats import linregress
 
 E_INV = np.exp(-1)
 
 ##############################################################################
-def correction_factor(rt, lt, icr=None, ocr=None):
+def correction_factor(rt, lt, icr=None, ocr=None, tau=None):
     """
     Calculate the deadtime correction factor.
 
@@ -166,8 +167,11 @@ def correction_factor(rt, lt, icr=None, ocr=None):
             impinging the detector)
     * ocr = output count rate (TOC_s/lt, where TOC_s = total processed
             {slow filter for dxp} counts output by the detector)
+    * tau = deadtime, used to calculate icr from ocr with solve_icr()
+            if icr is None
 
-    If icr and/or ocr are None then only lt correction is applied
+    If icr and/or ocr are None then only lt correction is applied.
+    All values can be scalars or arrays, for example with shape (npix, ndet).
 
     Outputs:
     -------
@@ -175,6 +179,8 @@ def correction_factor(rt, lt, icr=None, ocr=None):
       the correction factor. the correction is applied as:
         corrected_counts = counts * cor
     """
+    if icr is None and ocr is not None and tau is not None:
+        icr = solve_icr(ocr, tau)
     if icr is not None and ocr is not None:
         return (icr/ocr)*(rt/lt)
     return (rt/lt)
@@ -235,6 +241,54 @@ def calc_icr(ocr, tau):
         icr = None
     return icr
 
+def solve_icr(ocr, tau, saturate=False):
+    """
+    Calculate the true icr from arrays of ocr and deadtime factor tau,
+    solving
+
+        ocr = icr * exp(-icr*tau)
+
+    for all values at once, with the principal branch of the Lambert W
+    function:  icr = -W(-ocr*tau)/tau
+
+    Parameters:
+    -----------
+    * ocr = output count rate, scalar or array (for example (npix, ndet))
+    * tau = deadtime, scalar or array that broadcasts with ocr
+            (for example, one value per detector)
+    * saturate = how to treat ocr above the maximum correctible value of
+            exp(-1)/tau: if True, icr is the maximum value of 1/tau,
+            otherwise icr is nan [False]
+
+    Outputs:
+    -------
+    * icr, array with the shape of ocr and tau, or a scalar for scalar
+      ocr and tau.  Where tau <= 0, icr = ocr, and where ocr < 0, icr is nan.
+
+    Example:
+    --------
+    >>ocr = outcounts/livetime          # shape (npix, ndet)
+    >>icr = solve_icr(ocr, taus)        # taus has shape (ndet,)
+    >>cor = correction_factor(realtime, livetime, icr, ocr)
+    """
+    ocr, tau = np.broadcast_arrays(np.asarray(ocr, dtype=np.float64),
+                                   np.asarray(tau, dtype=np.float64))
+    icr = ocr.copy()
+    dtc = tau > 0
+    tau = tau[dtc]
+    arg = -ocr[dtc]*tau
+    over = arg < -E_INV
+    arg[over] = -E_INV
+    with np.errstate(invalid='ignore'):
+        out = -lambertw(arg).real / tau
+    if not saturate:
+        out[over] = np.nan
+    icr[dtc] = out
+    icr[ocr < 0] = np.nan
+    if icr.ndim == 0:
+        return icr[()]
+    return icr
+
 ##############################################################################
 def fit_deadtime(mon, ocr, offset=True):
     """
@@ -1,9 +1,12 @@
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import time
 import json
+import multiprocessing as mp
+from multiprocessing import shared_memory
 import numpy as np
 from numpy.linalg import lstsq
 from scipy.optimize import nnls
+from scipy.fft import rfft, irfft, next_fast_len
 
 
 from lmfit import  Parameters, minimize, fit_report
@@ -14,6 +17,7 @@ from xraydb.xray import XrayLine
 
 from .. import Group
 from ..math import index_of, interp, savitzky_golay, hypermet, erfc
+from ..math.nnls import nnls_gram
 from ..xafs import ftwindow
 from ..utils import group2dict, json_dump, json_load, gformat, unixpath
 
@@ -25,6 +29,9 @@ xrf_peak = namedtuple('xrf_peak', ('name', 'amplitude', 'center', 'step',
 
 predict_methods = {'lstsq': lstsq, 'nnls': nnls}
 
+# number of peak profiles kept by XRF_Model for reuse
+PROFILE_CACHE_SIZE = 32
+
 # Note on units:  energies are in keV, lengths in cm
 
 
@@ -256,6 +263,9 @@ class XRF_Model:
         self.escape_scale = None
         self.script = ''
         self.mca = None
+        self._profile_cache = OrderedDict()
+        self._profile_energy = None
+        self._escape_cache = {}
         if bgr is not None:
             self.add_background(bgr)
 
@@ -276,6 +286,10 @@ class XRF_Model:
         if matname not in FanoFactors:
             matname = 'Si'
         self.efano = FanoFactors[matname]
+        # cached profiles and escape depend on the detector
+        self._profile_cache.clear()
+        self._escape_cache.clear()
+        self.escape_scale = None
         self.params.add('det_thickness', value=thickness, vary=vary_thickness, min=0)
         self.params.add('det_noise', value=noise, vary=vary_noise, min=0)
         self.params.add('cal_offset', value=cal_offset, vary=vary_cal_offset, min=-500, max=500)
@@ -444,26 +458,29 @@ class XRF_Model:
         #     self.calc_matrix_attenuation(energy)
         # atten *= self.matrix_atten
 
-        nlines = 0
+        # fluorescence lines: the components are linear in the element
+        # amplitudes, using cached unit profiles for each element
+        elems, amps, comp_names = [], [], []
         for elem in self.elements:
-            comp = 0. * energy
             amp = pars.get('amp_%s' % elem.symbol.lower(), None)
-            if amp is None:
-                continue
-            for key, line in elem.lines.items():
-                ecen = 0.001*line.energy
-                nlines += 1
-                line_amp = line.intensity * elem.mu * elem.fyields[line.initial_level]
-                sigma = self.det_sigma(ecen, det_noise)
-                comp += hypermet(energy, amplitude=line_amp, center=ecen,
-                                 sigma=sigma, step=step, tail=tail,
-                                 beta=beta, gamma=gamma)
-            comp *= amp * self.atten * self.count_time
-            comp += self.escape_amp * interp(energy-self.escape_energy, comp, energy)
-
-            self.comps[elem.symbol] = comp
-            self.eigenvalues[elem.symbol] = amp
-
+            if amp is not None:
+                elems.append(elem)
+                comp_names.append(elem.symbol)
+                amps.append(amp)
+        # components before escape, as rows of ecomps
+        scale = self.atten * self.count_time
+        ecomps = []
+        if len(elems) > 0:
+            amps = np.array(amps)
+            profiles = self.calc_element_profiles(energy, elems, det_noise=det_noise,
+                                                  step=step, tail=tail, beta=beta,
+                                                  gamma=gamma)
+            total = (amps @ profiles) * scale
+            ecomps = list(amps[:, np.newaxis] * profiles * scale)
+            for i, elem in enumerate(elems):
+                self.eigenvalues[elem.symbol] = amps[i]
+        else:
+            total = 0. * energy
 
         # scatter peaks for Rayleigh and Compton
         for peak in self.scatter:
@@ -477,28 +494,36 @@ class XRF_Model:
             beta = pars['%s_beta' % p]
             sigma = pars['%s_sigmax' % p]
             sigma *= self.det_sigma(ecen, det_noise)
-            comp = hypermet(energy, amplitude=1.0, center=ecen,
-                            sigma=sigma, step=step, tail=tail, beta=beta,
-                            gamma=gamma)
-            comp *= amp * self.atten * self.count_time
-            comp += self.escape_amp * interp(energy-self.escape_energy, comp, energy)
-            self.comps[p] = comp
+            key = ('scatter', p, self.efano, ecen, sigma, step, tail, beta, gamma)
+            comp = self._cached_profile(energy, key, hypermet, energy,
+                                        amplitude=1.0, center=ecen,
+                                        sigma=sigma, step=step, tail=tail,
+                                        beta=beta, gamma=gamma)
+            comp = comp * (amp * scale)
+            total += comp
+            ecomps.append(comp)
+            comp_names.append(p)
             self.eigenvalues[p] = amp
 
+        # escape: linear in the spectrum, so added to the summed
+        # spectrum once, and to all components together
+        if len(comp_names) > 0:
+            ecomps = np.array(ecomps)
+            if np.any(self.escape_amp):
+                total += self.calc_escape(energy, total)
+                ecomps += self.calc_escape(energy, ecomps)
+            for i, name in enumerate(comp_names):
+                self.comps[name] = ecomps[i]
+
         if self.bgr is not None:
             bgr_amp = pars.get('background_amp', 0.0)
             self.comps['background'] = bgr_amp * self.bgr
             self.eigenvalues['background'] = bgr_amp
-
-        # calculate total spectrum
-        total = 0. * energy
-        for comp in self.comps.values():
-            total += comp
+            total += self.comps['background']
 
         if self.use_pileup:
             pamp = pars.get('pileup_amp', 0.0)
-            npts = len(energy)
-            pileup = pamp*1.e-9*np.convolve(total, total*1.0, 'full')[:npts]
+            pileup = pamp*1.e-9*self.calc_pileup(total)
             self.comps['pileup'] = pileup
             self.eigenvalues['pileup'] = pamp
             total += pileup
@@ -509,6 +534,94 @@ class XRF_Model:
         self.current_model = total
         return total
 
+    def _cached_profile(self, energy, key, func, *args, **kws):
+        """return func(*args, **kws), cached for the energy array and a key
+        holding the values of all other arguments of func.  The most
+        recently used PROFILE_CACHE_SIZE results are kept."""
+        cache = self._profile_cache
+        if (self._profile_energy is None or
+            len(self._profile_energy) != len(energy) or
+            not np.array_equal(self._profile_energy, energy)):
+            cache.clear()
+            self._profile_energy = 1.0*energy
+        if key in cache:
+            cache.move_to_end(key)
+        else:
+            cache[key] = func(*args, **kws)
+            while len(cache) > PROFILE_CACHE_SIZE:
+                cache.popitem(last=False)
+        return cache[key]
+
+    def _element_profiles(self, energy, elems, det_noise, step, tail, beta, gamma):
+        "hypermet profiles summed over all lines of each element, for unit amplitude"
+        out = np.zeros((len(elems), len(energy)))
+        for i, elem in enumerate(elems):
+            for key, line in elem.lines.items():
+                ecen = 0.001*line.energy
+                line_amp = line.intensity * elem.mu * elem.fyields[line.initial_level]
+                sigma = self.det_sigma(ecen, det_noise)
+                out[i] += hypermet(energy, amplitude=line_amp, center=ecen,
+                                   sigma=sigma, step=step, tail=tail,
+                                   beta=beta, gamma=gamma)
+        return out
+
+    def calc_element_profiles(self, energy, elems, det_noise=0.05, step=1e-3,
+                              tail=0.01, beta=0.5, gamma=0):
+        """
+        spectra of elements for unit amplitude, before attenuation and escape
+
+        Arguments:
+        ----------
+        energy     array of energies, in keV
+        elems      list of XRF_Element
+        det_noise, step, tail, beta, gamma:  detector and peak shape parameters
+
+        Returns:
+        ---------
+        2-d array [len(elems), len(energy)], the sum of hypermet profiles for
+        all lines of each element.  These are cached for the energy array,
+        elements, detector and peak shape parameters, so that the fluorescence spectrum for new
+        element amplitudes is a single matrix-vector product.
+        """
+        elem_keys = tuple((elem.symbol, elem.xray_energy, elem.mu) for elem in elems)
+        pkey = ('elements', elem_keys, self.efano, det_noise, step, tail,
+                beta, gamma)
+        return self._cached_profile(energy, pkey, self._element_profiles,
+                                    energy, elems, det_noise, step, tail,
+                                    beta, gamma)
+
+    def calc_escape(self, energy, spectra):
+        """
+        escape peaks for one spectrum or a 2-d array of spectra on energy,
+        the spectra shifted down by the escape energy, times escape_amp.
+
+        The spectra are interpolated linearly at energy + escape_energy
+        (extrapolated above the last energy), with indices and weights
+        cached for the energy array, so that many spectra can be shifted
+        at once.
+        """
+        eshift = energy + self.escape_energy
+        cache = self._escape_cache
+        if (cache.get('eshift') is None or len(cache['eshift']) != len(eshift)
+            or not np.array_equal(cache['eshift'], eshift)):
+            idx = np.clip(np.searchsorted(energy, eshift) - 1, 0, len(energy)-2)
+            frac = (eshift - energy[idx]) / (energy[idx+1] - energy[idx])
+            cache.update(eshift=1.0*eshift, idx=idx, frac=frac)
+        idx, frac = cache['idx'], cache['frac']
+        return self.escape_amp * (spectra[..., idx]*(1-frac) +
+                                  spectra[..., idx+1]*frac)
+
+    def calc_pileup(self, spectrum):
+        """
+        pileup spectrum: the self-convolution of the spectrum, truncated to
+        the length of the spectrum.  This uses real FFTs padded to a fast
+        length at least twice the spectrum length.
+        """
+        npts = len(spectrum)
+        nfft = next_fast_len(2*npts - 1, real=True)
+        fspec = rfft(spectrum, nfft)
+        return irfft(fspec*fspec, nfft)[:npts]
+
     def __resid(self, params, data, index):
         pars = params.valuesdict()
         self.best_en = (pars['cal_offset'] + pars['cal_slope'] * index +
@@ -735,21 +848,31 @@ class XRFFitResult(Group):
         return xrf_prediction(weights, total)
 
     def decompose_map(self, map, scale=1.0, pixel_time=1.0, method='lstsq',
-                      nworkers=4):
+                      nworkers=4, chunk_bytes=2**26):
         """
         Apply XRFFitResult to an XRF Map, decomposing it into maps of elemental weights
 
         Arguments:
         ----------
         map          XRF map array: [NY, NX, NMCA], on the same energy grid as the fitted data.
+                     This can be an HDF5 dataset, which will be read in chunks of rows.
         scale        scale factor to apply to output weights [1]
         pixel_time   count time in seconds for each pixel [1.0]
         method       decomposition method: one of `lstsq` for basic least-squares or
                      `nnls` for non-negative least-squares [`lstsq`]
+        nworkers     number of processes to use [4]
+        chunk_bytes  approximate size in bytes of map data read at one time [2**26]
 
         Returns:
         ---------
         dict of elements: weights maps (NY, NX) for all components used in the fit
+
+        Notes:
+        ------
+        The transfer matrix is factored once for all pixels: `lstsq` uses its
+        pseudo-inverse, and `nnls` solves all pixels of a chunk of rows at once.
+        With nworkers > 1, chunks are decomposed by a pool of processes that
+        write into a shared-memory result array.
         """
         method, scale = self._prep_decompose(scale, pixel_time, method)
         ny, nx, nchan = map.shape
@@ -764,43 +887,68 @@ class XRFFitResult(Group):
 
         xfer = self.transfer_matrix[w0:w1, :]
         win = self.fit_window[w0:w1]
-        result = np.zeros((ny, nx, ncomps), dtype='float32')
-
-        def decomp_lstsq(i0, i1):
-            """very efficient lstsq"""
-            tmap = map[i0:i1, :, w0:w1].swapaxes(1, 2)
-            ny = tmap.shape[0]
-            win.shape = (win.shape[0], 1)
-            for iy in range(ny):
-                results = lstsq(xfer, win*tmap[iy])
-                for i in range(ncomps):
-                    result[i0+iy,:,i] = results[0][i] * scale
-
-        def decomp_nnls(i0, i1):
-            """need to explicitly loop of nx as well as ny"""
-            tmap = map[i0:i1, :, w0:w1]
-            ny = tmap.shape[0]
-            for iy in range(ny):
-                for ix in range(nx):
-                    results = nnls(xfer, win*tmap[iy,ix,:])
-                    for i in range(ncomps):
-                        result[i0+iy,ix,i] = results[0][i] * scale
-
-        decomp = decomp_lstsq
-        if method == nnls:
-            decomp = decomp_nnls
-        # if we're going to use up more than ~1Gb per lstsq, do it in chunks
-        if (ny*nx*(w1-w0) > 1e8):
-            nchunks = 1+int(1.e-8*ny*nx*(w1-w0))
-            ns = int(ny/nchunks)
-            for i in range(nchunks):
-                ilast = (i+1)*ns
-                if i == nchunks-1: ilast = ny
-                decomp(i*ns, ilast)
+        solver = dict(method='nnls' if method == nnls else 'lstsq', scale=scale)
+        if solver['method'] == 'nnls':
+            solver.update(xfer=xfer, win=win, gram=xfer.T @ xfer,
+                          proj=(xfer*win[:, np.newaxis]).T)
         else:
-            decomp(0, ny)
+            solver['proj'] = np.linalg.pinv(xfer) * win
+
+        itemsize = np.dtype(getattr(map, 'dtype', 'float64')).itemsize
+        nrows = max(1, int(chunk_bytes/(nx*(w1-w0)*itemsize)))
+        chunks = [(i0, min(ny, i0+nrows)) for i0 in range(0, ny, nrows)]
+        shape = (ny, nx, ncomps)
+
+        if nworkers < 2 or len(chunks) < 2:
+            result = np.zeros(shape, dtype='float32')
+            for i0, i1 in chunks:
+                result[i0:i1] = _decompose_rows(map[i0:i1, :, w0:w1], **solver)
+        else:
+            shm = shared_memory.SharedMemory(create=True,
+                                             size=int(np.prod(shape))*4)
+            try:
+                with mp.Pool(min(nworkers, len(chunks))) as pool:
+                    pending = []
+                    for i0, i1 in chunks:
+                        data = np.asarray(map[i0:i1, :, w0:w1])
+                        pending.append(pool.apply_async(_decompose_task,
+                                                        (data, i0, shm.name, shape),
+                                                        solver))
+                        # limit the number of chunks in memory
+                        if len(pending) > 2*nworkers:
+                            pending.pop(0).get()
+                    for task in pending:
+                        task.get()
+                result = np.ndarray(shape, dtype='float32', buffer=shm.buf).copy()
+            finally:
+                shm.close()
+                shm.unlink()
         return {name: result[:,:,i] for i, name in enumerate(self.eigenvalues.keys())}
 
+def _decompose_rows(data, method='lstsq', scale=1.0, proj=None, gram=None,
+                    xfer=None, win=None):
+    """decompose a chunk of rows of an XRF map [nrows, nx, nchan],
+    returning weights [nrows, nx, ncomps]"""
+    nrows, nx, nchan = data.shape
+    data = np.asarray(data, dtype='float64').reshape(nrows*nx, nchan)
+    if method == 'nnls':
+        weights, converged = nnls_gram(gram, proj @ data.T)
+        for i in np.where(~converged)[0]:
+            weights[:, i] = nnls(xfer, win*data[i])[0]
+        weights = weights.T
+    else:
+        weights = data @ proj.T
+    return (scale*weights).reshape(nrows, nx, -1)
+
+def _decompose_task(data, i0, shm_name, shape, **solver):
+    "worker for XRFFitResult.decompose_map(), writing to shared memory"
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        result = np.ndarray(shape, dtype='float32', buffer=shm.buf)
+        result[i0:i0+data.shape[0]] = _decompose_rows(data, **solver)
+    finally:
+        shm.close()
+
 def xrf_model(xray_energy=None, energy_min=1500, energy_max=None, use_bgr=False, **kws):
     """create an XRF Peak
 
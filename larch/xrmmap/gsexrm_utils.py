@@ -11,6 +11,7 @@ from .asciifiles import (readASCII, readMasterFile, readROIFile,
                          readEnvironFile, read1DXRDFile, parseEnviron)
 
 from ..xrd import integrate_xrd_row
+from ..xrf.deadtime import correction_factor
 
 def fix_xrd1d_filename(xrd_file):
     """check for 1D XRD file from Eiger or other detector --
@@ -309,10 +310,12 @@ class GSEXRM_MapRow:
             if self.realtime.max() < 0.01:
                 self.realtime = 0.100 * np.ones(self.realtime.shape)
 
-            dt_denom = self.outcounts*self.livetime
-            dt_denom[np.where(dt_denom < 1)] = 1.0
-            self.dtfactor  = self.inpcounts*self.realtime/dt_denom
-            self.dtfactor[np.where(np.isnan(self.dtfactor))] = 1.0
+            # the ratio of input to output counts is icr/ocr
+            outcounts = self.outcounts*1.0
+            outcounts[np.where(outcounts*self.livetime < 1)] = np.nan
+            self.dtfactor = correction_factor(self.realtime, self.livetime,
+                                              icr=self.inpcounts, ocr=outcounts)
+            self.dtfactor[np.where(~np.isfinite(self.dtfactor))] = 1.0
             self.dtfactor[np.where(self.dtfactor < 0.95)] = 0.95
             if force_no_dtc: # in case deadtime info is unreliable (some v old data)
                 self.outcounts = self.inpcounts*1.0
@@ -471,11 +474,11 @@ class GSEXRM_MapRow:
             self.livetime = self.livetime.swapaxes(0, 1)
             self.realtime = self.realtime.swapaxes(0, 1)
             self.counts   = self.counts.swapaxes(0, 1)
-            iy, ix = self.dtfactor.shape
 
             self.total = self.counts.sum(axis=0)
-            # dtfactor for total
-            total_dtc = (self.counts * self.dtfactor.reshape(iy, ix, 1)).sum(axis=0).sum(axis=1)
+            # dtfactor for total, summing counts over channels first
+            # to not make a float copy of counts
+            total_dtc = (self.counts.sum(axis=2) * self.dtfactor).sum(axis=0)
             dt_denom = self.total.sum(axis=1)
             dt_denom[np.where(dt_denom < 1)] = 1.0
             dtfact  = total_dtc / dt_denom
@@ -8,6 +8,7 @@ import scipy.stats as stats
 import json
 import multiprocessing as mp
 from functools import partial
+from collections import deque
 
 import larch
 from larch.utils import debugtime, isotime
@@ -40,6 +41,10 @@ VALID_ROOTNAMES = ('xrmmap', 'xrfmap')
 EXTRA_DETGROUPS =  ('scalars', 'work', 'xrd1d', 'xrd2d')
 NOT_OWNER = "Not Owner of HDF5 file %s"
 READ_ONLY = "HDF5 file %s is open read-only"
+
+# cumulative sum over channels of MCA counts, used for fast ROI maps
+ROI_INDEX = 'counts_cumsum'
+ROI_INDEX_NCHAN = 16
 QSTEPS = 2048
 
 H5ATTRS = {'Type': 'XRM 2D Map',
@@ -271,6 +276,7 @@ class GSEXRM_MapFile(object):
         self.masterfile    = None
         self.force_no_dtc  = False
         self.all_mcas      = all_mcas
+        self.use_roi_index = False
         self.detector_list = None
 
         self.compress_args = {'compression': compression}
@@ -733,18 +739,28 @@ class GSEXRM_MapFile(object):
     def process_row(self, irow, flush=False, complete=False, offset=None,
                     nrows_expected=None, callback=None):
         row = self.read_rowdata(irow, offset=offset)
+        self.store_row(irow, row, flush=flush, complete=complete,
+                       nrows_expected=nrows_expected, callback=callback)
+
+    def store_row(self, irow, row, flush=False, complete=False,
+                  nrows_expected=None, callback=None):
+        """add row data read with read_rowdata() to the HDF5 file,
+        building the schema for the first row"""
         if irow == 0:
             nmca, nchan = 0, 2048
             if row.counts is not None:
                 nmca, xnpts, nchan = row.counts.shape
             xrd2d_shape = None
             if row.xrd2d is not None:
-                xrd2d_shape = rows.xrd2d.shape
+                xrd2d_shape = row.xrd2d.shape
             self.build_schema(row.npts, nmca=nmca, nchan=nchan,
                               scaler_names=row.scaler_names,
                               scaler_addrs=row.scaler_addrs,
                               xrd2d_shape=xrd2d_shape, verbose=True,
                               nrows_expected=nrows_expected)
+            if (self.use_roi_index and self.has_xrf and
+                version_ge(self.version, '2.0.0')):
+                self.build_roi_index()
         if row.read_ok:
             self.add_rowdata(row, callback=callback)
 
@@ -760,8 +776,19 @@ class GSEXRM_MapFile(object):
 
 
     def process(self, maxrow=None, force=False, callback=None, offset=None,
-                force_no_dtc=False, all_mcas=None):
-        "look for more data from raw folder, process if needed"
+                force_no_dtc=False, all_mcas=None, nworkers=1, max_pending=None,
+                roi_index=False):
+        """look for more data from raw folder, process if needed
+
+        With nworkers > 1, rows are read and dead-time corrected by a pool
+        of nworkers processes, reading ahead of the rows being written.
+        Rows are still written to the HDF5 file one at a time and in order
+        by this process.  At most max_pending rows [2*nworkers] are read
+        ahead, which limits the memory used.
+
+        With roi_index=True, the ROI index (see build_roi_index) is built
+        if needed, and filled in as rows are added.
+        """
         self.force_no_dtc = force_no_dtc
         if all_mcas is not None:
             self.all_mcas = all_mcas
@@ -782,16 +809,59 @@ class GSEXRM_MapFile(object):
         if maxrow is not None:
             nrows = min(nrows, maxrow)
 
+        # for a new map, the index is made with the schema for the first row
+        self.use_roi_index = roi_index
+        if (roi_index and self.has_xrf and version_ge(self.version, '2.0.0')
+            and 'mcasum' in self.xrmmap and not self.has_roi_index('mcasum')):
+            self.build_roi_index()
+
         if force or self.folder_has_newdata():
             irow = self.last_row + 1
+            if nworkers > 1 and irow < nrows-1:
+                self.process_pipelined(irow, nrows, offset=offset,
+                                       callback=callback, nworkers=nworkers,
+                                       max_pending=max_pending)
+            else:
+                while irow < nrows:
+                    flush = irow < 2 or (irow % 64 == 0)
+                    complete = irow >= nrows-1
+                    self.process_row(irow, flush=flush, offset=offset,
+                                     complete=complete, callback=callback)
+                    irow  = irow + 1
+            if callable(callback):
+                callback(filename=self.filename, status='complete')
+
+    def process_pipelined(self, irow, nrows, offset=None, callback=None,
+                          nworkers=4, max_pending=None):
+        """process rows irow through nrows-1, with rows read by a pool of
+        nworkers processes and written in order by this process"""
+        if max_pending is None:
+            max_pending = 2*nworkers
+        max_pending = max(1, max_pending)
+        pending = deque()
+        next_row = irow
+        pool = mp.Pool(nworkers)
+        try:
             while irow < nrows:
+                # keep up to max_pending rows reading ahead of the writer
+                while next_row < nrows and len(pending) < max_pending:
+                    rowargs = self._rowdata_args(next_row, offset=offset)
+                    if rowargs is None:
+                        pending.append(None)
+                    else:
+                        pending.append(pool.apply_async(_read_maprow, rowargs))
+                    next_row += 1
+                task = pending.popleft()
+                row = None if task is None else task.get()
                 flush = irow < 2 or (irow % 64 == 0)
                 complete = irow >= nrows-1
-                self.process_row(irow, flush=flush, offset=offset,
-                                 complete=complete, callback=callback)
-                irow  = irow + 1
-            if callable(callback):
-                callback(filename=self.filename, status='complete')
+                self.store_row(irow, row, flush=flush, complete=complete,
+                               callback=callback)
+                irow = irow + 1
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
 
 
     def set_roidata(self, row_start=0, row_end=None):
@@ -853,6 +923,16 @@ class GSEXRM_MapFile(object):
         '''read a row worth of raw data from the Map Folder
         returns arrays of data
         '''
+        rowargs = self._rowdata_args(irow, offset=offset)
+        if rowargs is None:
+            return
+        args, kws = rowargs
+        return GSEXRM_MapRow(*args, **kws)
+
+    def _rowdata_args(self, irow, offset=None):
+        '''arguments for GSEXRM_MapRow to read a row of raw data,
+        as (args, kws), or None if the row is not available
+        '''
         if self.dimension is None or irow > len(self.rowdata):
             self.read_master()
 
@@ -913,20 +993,21 @@ class GSEXRM_MapFile(object):
         if offset is not None:
             ioffset = offset
         self.has_xrf = self.has_xrf and xrff != '_unused_'
-        return GSEXRM_MapRow(yval, xrff, xrdf, xpsf, sisf, self.folder,
-                             irow=irow, nrows_expected=self.nrows_expected,
-                             ixaddr=0, dimension=self.dimension,
-                             npts=self.npts,
-                             reverse=reverse,
-                             ioffset=ioffset,
-                             force_no_dtc=self.force_no_dtc,
-                             masterfile=self.masterfile, flip=self.flip,
-                             xrdcal=self.xrdcalfile,
-                             xrd2dmask=self.mask_xrd2d,
-                             xrd2dbkgd=self.bkgd_xrd2d, wdg=self.azwdgs,
-                             steps=self.qstps, has_xrf=self.has_xrf,
-                             has_xrd2d=self.has_xrd2d,
-                             has_xrd1d=self.has_xrd1d)
+        args = (yval, xrff, xrdf, xpsf, sisf, self.folder)
+        kws = dict(irow=irow, nrows_expected=self.nrows_expected,
+                   ixaddr=0, dimension=self.dimension,
+                   npts=self.npts,
+                   reverse=reverse,
+                   ioffset=ioffset,
+                   force_no_dtc=self.force_no_dtc,
+                   masterfile=self.masterfile, flip=self.flip,
+                   xrdcal=self.xrdcalfile,
+                   xrd2dmask=self.mask_xrd2d,
+                   xrd2dbkgd=self.bkgd_xrd2d, wdg=self.azwdgs,
+                   steps=self.qstps, has_xrf=self.has_xrf,
+                   has_xrd2d=self.has_xrd2d,
+                   has_xrd1d=self.has_xrd1d)
+        return args, kws
 
 
     def add_rowdata(self, row, callback=None, flush=True):
@@ -996,6 +1077,8 @@ class GSEXRM_MapFile(object):
                     for idet, gname in enumerate(mca_dets):
                         grp = self.xrmmap[gname]
                         grp['counts'][thisrow, :npts, :] = row.counts[idet, :npts, :]
+                        if ROI_INDEX in grp:
+                            self.set_roi_index_row(grp, thisrow, row.counts[idet, :npts, :])
                         grp['dtfactor'][thisrow,  :npts] = row.dtfactor[idet, :npts]
                         grp['realtime'][thisrow,  :npts] = row.realtime[idet, :npts]
                         grp['livetime'][thisrow,  :npts] = row.livetime[idet, :npts]
@@ -1020,6 +1103,8 @@ class GSEXRM_MapFile(object):
 
                 sumgrp = self.xrmmap['mcasum']
                 sumgrp['counts'][thisrow, :npts, :nchan] = row.total[:npts, :nchan]
+                if ROI_INDEX in sumgrp:
+                    self.set_roi_index_row(sumgrp, thisrow, row.total[:npts, :nchan])
                 dt.add(" map xrf 4b: set counts")
                 # print("add realtime ", sumgrp['realtime'].shape, self.xrmmap['roimap/det_raw'].shape, thisrow)
                 sumgrp['realtime'][thisrow,  :npts] = realtime
@@ -1786,12 +1871,16 @@ class GSEXRM_MapFile(object):
                     elif type_attr.startswith('mca'):
                         oldnrow, npts, nchan = g['counts'].shape
                         g['counts'].resize((nrow, npts, nchan))
+                        if ROI_INDEX in g:
+                            g[ROI_INDEX].resize((nrow, npts, nchan))
                         for aname in ('livetime', 'realtime',
                                       'inpcounts', 'outcounts', 'dtfactor'):
                             g[aname].resize((nrow, npts))
                     elif type_attr.startswith('virtual mca'):
                         oldnrow, npts, nchan = g['counts'].shape
                         g['counts'].resize((nrow, npts, nchan))
+                        if ROI_INDEX in g:
+                            g[ROI_INDEX].resize((nrow, npts, nchan))
                         for aname in ('livetime', 'realtime',
                                       'inpcounts', 'outcounts', 'dtfactor'):
                             if aname in g:
@@ -3046,6 +3135,100 @@ class GSEXRM_MapFile(object):
 
         return roigroup, det_list, sumdet
 
+    def build_roi_index(self, det=None, nrows_chunk=8, callback=None):
+        """build the cumulative sum over channels of MCA counts, used to
+        make ROI maps without reading the full counts array.
+
+        Parameters:
+        -----------
+          det          name of MCA detector group, or None for all MCA
+                       detectors and the summed MCA [None]
+          nrows_chunk  number of rows read at a time [8]
+          callback     function called after each chunk of rows, with
+                       arguments det, row, and maxrow [None]
+
+        Notes:
+        ------
+          1. the index is stored as 'counts_cumsum' in each detector
+             group, with chunks that hold a few channels for all pixels
+             in a row, so that reading one channel plane is cheap.
+          2. once built, the index is kept up-to-date as rows are added.
+          3. the index is uint64 for integer counts and float64 for
+             the summed MCA, so it adds twice the size of the uint32
+             detector counts, and the size of the float64 summed counts,
+             to the file (before compression).
+        """
+        if not self.check_hostid():
+            raise GSEXRM_Exception(NOT_OWNER % self.filename)
+        if not self.write_access:
+            raise GSEXRM_Exception(READ_ONLY % self.filename)
+        if not (self.has_xrf and version_ge(self.version, '2.0.0')):
+            return
+
+        if det is None:
+            roigroup, det_list, sumdet = self.build_mca_roimap()
+            if sumdet is not None and sumdet not in det_list:
+                det_list.append(sumdet)
+        else:
+            det_list = [det]
+
+        for det in det_list:
+            grp = self.xrmmap[det]
+            counts = grp['counts']
+            nrow, npts, nchan = counts.shape
+            if ROI_INDEX in grp:
+                del grp[ROI_INDEX]
+            dtype = np.uint64 if counts.dtype.kind in 'ui' else np.float64
+            index = grp.create_dataset(ROI_INDEX, (nrow, npts, nchan),
+                                       dtype=dtype,
+                                       chunks=(1, npts, min(nchan, ROI_INDEX_NCHAN)),
+                                       maxshape=(None, npts, nchan),
+                                       **self.compress_args)
+            for irow in range(0, nrow, nrows_chunk):
+                rows = slice(irow, min(nrow, irow+nrows_chunk))
+                index[rows] = np.cumsum(counts[rows], axis=2, dtype=dtype)
+                if callable(callback):
+                    callback(det=det, row=rows.stop, maxrow=nrow)
+        self.h5root.flush()
+
+    def has_roi_index(self, det):
+        "return whether MCA detector group has an ROI index"
+        return ROI_INDEX in self.xrmmap[det]
+
+    def set_roi_index_row(self, grp, irow, counts):
+        "set one row of the ROI index for an MCA detector group"
+        index = grp[ROI_INDEX]
+        npts, nchan = counts.shape
+        index[irow, :npts, :nchan] = np.cumsum(counts, axis=1, dtype=index.dtype)
+
+    def get_roi_counts(self, det, roi_slice, rows=None):
+        """return summed counts in a channel range for an MCA detector,
+        using the ROI index if available
+
+        Parameters:
+        -----------
+          det        name of MCA detector group
+          roi_slice  slice of channels
+          rows       slice of rows [None: all rows]
+
+        Returns:
+        ---------
+          2-d array of summed counts, shape (nrow, npts)
+        """
+        grp = self.xrmmap[det]
+        if rows is None:
+            rows = slice(None)
+        if ROI_INDEX not in grp:
+            return grp['counts'][rows, :, roi_slice].sum(axis=2)
+        index = grp[ROI_INDEX]
+        emin, emax, _ = roi_slice.indices(index.shape[2])
+        if emax <= emin:
+            return np.zeros(index[rows, :, 0].shape, dtype=index.dtype)
+        out = index[rows, :, emax-1]
+        if emin > 0:
+            out = out - index[rows, :, emin-1]
+        return out
+
     def add_xrfroi(self, roiname, Erange, unit='keV'):
         if not self.has_xrf:
             return
@@ -3068,7 +3251,7 @@ class GSEXRM_MapFile(object):
                 en  = mapdat['energy'][:]
                 emin = (np.abs(en-Erange[0])).argmin()
                 emax = (np.abs(en-Erange[1])).argmin()+1
-            raw = mapdat['counts'][:, :, emin:emax].sum(axis=2)
+            raw = self.get_roi_counts(det, slice(emin, emax))
             cor = raw * mapdat['dtfactor']
             self.save_roi(roiname, det, raw, cor, Erange, 'energy', unit)
         self.get_roi_list('mcasum', force=True)
@@ -3364,6 +3547,10 @@ class GSEXRM_MapFile(object):
         roi_names.pop(iroi)
 
 
+def _read_maprow(args, kws):
+    "read a row of raw map data, for GSEXRM_MapFile.process_pipelined()"
+    return GSEXRM_MapRow(*args, **kws)
+
 def read_xrmmap(filename, root=None, **kws):
     '''read GSE XRF FastMap data from HDF5 file or raw map folder'''
     key = 'filename'
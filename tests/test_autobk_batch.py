@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+""" Tests of autobk() residual and autobk_batch() """
+from pathlib import Path
+import numpy as np
+
+from larch import Group
+from larch.io import read_ascii
+from larch.xafs import pre_edge, autobk, autobk_batch
+
+base_dir = Path(__file__).parent.parent.resolve()
+data_dir = base_dir / 'examples' / 'xafsdata'
+
+def get_groups(nspec=4):
+    dat = read_ascii(data_dir / 'cu_10k.xmu', labels='energy mu i0')
+    pre_edge(dat)
+    rng = np.random.default_rng(7)
+    groups = []
+    for i in range(nspec):
+        mu = dat.mu + 0.002*i*rng.normal(size=len(dat.mu))
+        groups.append(Group(energy=dat.energy.copy(), mu=mu, e0=dat.e0,
+                            edge_step=dat.edge_step))
+    return groups
+
+def test_autobk_batch():
+    groups = get_groups()
+    out = autobk_batch(groups, rbkg=1.1, kweight=2)
+    assert out.chi.shape == (len(groups), len(out.k))
+    for i, grp in enumerate(groups):
+        assert np.allclose(grp.chi, out.chi[i])
+        ref = Group(energy=grp.energy, mu=grp.mu, e0=grp.e0,
+                    edge_step=grp.edge_step)
+        autobk(ref, rbkg=1.1, kweight=2)
+        assert np.allclose(ref.k, out.k)
+        assert np.allclose(ref.chi, out.chi[i], atol=2.e-5)
+        assert np.allclose(ref.bkg, out.bkg[i], atol=5.e-5)
+        assert np.allclose(ref.delta_chi, out.delta_chi[i], atol=1.e-5)
+
+def test_autobk_batch_array():
+    groups = get_groups()
+    energy = groups[0].energy
+    mu = np.array([grp.mu for grp in groups])
+    out1 = autobk_batch(energy, mu, ek0=groups[0].e0, clamp_hi=10)
+    out2 = autobk_batch(energy, mu, ek0=groups[0].e0, clamp_hi=10,
+                        nworkers=2, chunksize=2)
+    assert np.allclose(out1.chi, out2.chi)
+    assert len(out1.edge_step) == len(groups)
+    assert np.allclose(out1.ek0, groups[0].e0)
+
+def test_autobk_residual_timing():
+    from larch.xafs.autobk import autobk_residual_timing
+    grp = get_groups(nspec=1)[0]
+    autobk(grp, rbkg=1.0, kweight=2, clamp_hi=5)
+    assert grp.autobk_details.resid_time > 0
+    timing = autobk_residual_timing(grp, nrepeat=5)
+    assert timing.max_diff < 1.e-8
+    assert timing.spline > 0 and timing.basis > 0
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+""" test x-ray backgrounds, compared to the loop over channels"""
+import pytest
+import numpy as np
+
+from larch.xray import XrayBackground, xray_background
+from larch.xray.background import (compress_array, expand_array, HUGE,
+                                   TINY, REFERENCE_AMPL, MAX_TANGENT)
+from larch.xrf import xrf_background
+from larch.xrd import xrd_background
+
+def make_spectra(nspectra=4, nchans=1023, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.arange(nchans)
+    y = (200*np.exp(-x/300) + 3000*np.exp(-(x-400)**2/50) +
+         900*np.exp(-(x-650)**2/200) + 50*np.sin(x/50)**2)
+    return rng.poisson(np.outer(rng.uniform(0.05, 5, nspectra), y)).astype(float)
+
+def loop_background(data, width=4, slope=1.0, exponent=2, compress=2,
+                    tangent=False, type_int=False):
+    "background of one spectrum, with one polynomial at a time"
+    scratch = compress_array(1.0*data, compress)
+    slope = slope * compress
+    nchans = len(scratch)
+    bckgnd = np.arange(nchans, dtype=np.float64) - HUGE
+    denom = max(TINY, (width / (2. * slope)**exponent))
+    indices = np.arange(nchans*2+1, dtype=np.float64) - nchans
+    power_funct = indices**exponent * (REFERENCE_AMPL / denom)
+    power_funct = np.compress((power_funct <= max(scratch)), power_funct)
+    max_index = int(len(power_funct)/2 - 1)
+    for chan in range(nchans-1):
+        tan_slope = 0.
+        if tangent:
+            chan0 = max((chan - MAX_TANGENT), 0)
+            chan1 = min((chan + MAX_TANGENT), (nchans-1))
+            tan_slope = (scratch[chan] - scratch[chan0:chan1+1]) / max(chan, 1)
+            tan_slope = np.sum(tan_slope) / (chan1 - chan0)
+        chan0 = int(max((chan - max_index), 0))
+        chan1 = int(min((chan + max_index), (nchans-1)))
+        nc = chan1 - chan0 + 1
+        lin_offset = scratch[chan] + (np.arange(float(nc)) - nc/2) * tan_slope
+        funct = power_funct[chan0-chan+max_index:chan1-chan+max_index+1]
+        height = min(scratch[chan0:chan1+1] - lin_offset + funct)
+        bckgnd[chan0:chan1+1] = np.maximum(bckgnd[chan0:chan1+1],
+                                           height + lin_offset - funct)
+    bckgnd = expand_array(bckgnd, compress)
+    if type_int:
+        bckgnd = bckgnd.astype(int)
+    bckgnd[np.where(bckgnd <= 0)] = 0
+    return bckgnd
+
+@pytest.mark.parametrize('kws', [dict(), dict(tangent=True),
+                                 dict(width=100, compress=1),
+                                 dict(width=40, slope=0.5, compress=5, tangent=True),
+                                 dict(width=200, exponent=4, compress=3),
+                                 dict(width=20, type_int=True)])
+def test_xray_background(kws):
+    spectra = make_spectra()
+    out = xray_background(spectra, **kws)
+    for spectrum, bgr in zip(spectra, out):
+        assert np.array_equal(bgr, loop_background(spectrum, **kws))
+    assert np.array_equal(xray_background(spectra[1], **kws), out[1])
+    assert np.all(out <= spectra[:, :out.shape[1]].max(axis=1)[:, None])
+
+def test_xray_background_class():
+    spectra = make_spectra(nchans=1024)
+    xb = XrayBackground(spectra[2], width=50, tangent=True)
+    assert xb.bgr.dtype == int
+    assert np.array_equal(xb.bgr, loop_background(spectra[2], width=50,
+                                                  tangent=True, type_int=True))
+    bgr = xrd_background(np.arange(1024), spectra, width=50)
+    assert bgr.shape == spectra.shape
+    assert np.array_equal(bgr[2], xrd_background(np.arange(1024), spectra[2],
+                                                 width=50))
+
+def test_xrf_background_stack():
+    energy = np.linspace(0, 20, 1024)
+    spectra = make_spectra(nchans=1024).astype(int)
+    out = xrf_background(energy, spectra)
+    assert out.shape == spectra.shape and out.dtype == spectra.dtype
+    for spectrum, bgr in zip(spectra, out):
+        assert np.array_equal(xrf_background(energy, spectrum), bgr)
+        assert np.all(bgr <= np.maximum(spectrum.max(), 0))
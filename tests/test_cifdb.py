@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+""" test peak matching with the q index of the AMCSD database"""
+import pytest
+import numpy as np
+
+from larch.xrd.cifdb import cifDB, QIndex, match_database, QMIN, QMAX
+
+@pytest.fixture(scope='module')
+def cifdb():
+    return cifDB('amcsd_cif0.db')
+
+@pytest.fixture(scope='module')
+def qindex(cifdb, tmp_path_factory):
+    fname = tmp_path_factory.mktemp('xrd') / 'qindex.npz'
+    return cifdb.get_qindex(fname=str(fname), rebuild=True), str(fname)
+
+def make_patterns(cifdb, amcsd, npat=4, seed=5):
+    rng = np.random.default_rng(seed)
+    patterns = []
+    for i in range(npat):
+        sid = int(amcsd[rng.integers(len(amcsd))])
+        peaks = np.array(cifdb.q_by_amcsd(sid))[:12]
+        peaks = peaks + rng.normal(0, 0.004, len(peaks))
+        patterns.append(np.concatenate([peaks, rng.uniform(0.5, 6, 3)]))
+    return patterns
+
+@pytest.mark.parametrize('qstep', [None, 0.03, 0.05, 0.1])
+@pytest.mark.parametrize('qmin, qmax', [(None, None), (1, 5), (0.1, 4.33),
+                                        (2.004, 12)])
+def test_match_peaks(cifdb, qindex, qstep, qmin, qmax):
+    for peaks in make_patterns(cifdb, qindex[0].amcsd):
+        ref = [tuple(float(x) for x in row)
+               for row in cifdb.amcsd_by_q(peaks, qstep=qstep, qmin=qmin,
+                                           qmax=qmax) if row[3] > 0]
+        out = [tuple(float(x) for x in row)
+               for row in cifdb.match_peaks(peaks, qstep=qstep, qmin=qmin,
+                                            qmax=qmax)]
+        assert out == ref
+
+def test_match_database(cifdb, qindex):
+    for peaks in make_patterns(cifdb, qindex[0].amcsd):
+        for minq, maxq in ((QMIN, QMAX), (1, 5)):
+            ref = [row[1] for row in cifdb.amcsd_by_q(peaks, qstep=0.05,
+                                                      qmin=minq, qmax=maxq)
+                   if row[0] > 0]
+            assert match_database(cifdb, peaks, minq=minq, maxq=maxq,
+                                  verbose=False) == ref
+
+def test_match_batch(cifdb, qindex):
+    patterns = make_patterns(cifdb, qindex[0].amcsd, npat=8)
+    batch = cifdb.match_peaks_batch(patterns, qstep=0.05, qmin=1, qmax=5)
+    assert len(batch) == 8
+    for peaks, rows in zip(patterns, batch):
+        assert rows == cifdb.match_peaks(peaks, qstep=0.05, qmin=1, qmax=5)
+        scores = [row[0] for row in rows]
+        assert scores == sorted(scores, reverse=True)
+
+def test_qtol(cifdb, qindex):
+    peaks = make_patterns(cifdb, qindex[0].amcsd, npat=1)[0]
+    exact = {row[1]: row[3] for row in cifdb.match_peaks(peaks, qstep=0.01)}
+    wide = {row[1]: row[3] for row in cifdb.match_peaks(peaks, qstep=0.01,
+                                                         qtol=0.02)}
+    assert set(exact) <= set(wide)
+    assert all(wide[sid] >= nmatch for sid, nmatch in exact.items())
+    assert sum(wide.values()) > sum(exact.values())
+
+def test_save_load(qindex):
+    qindex, fname = qindex
+    saved = QIndex.load(fname)
+    assert saved.signature == qindex.signature
+    assert np.all(saved.amcsd == qindex.amcsd)
+    for qstep in qindex.bins:
+        qaxis, bins = qindex.get_bins(qstep)
+        saxis, sbins = saved.get_bins(qstep)
+        assert np.allclose(qaxis, saxis)
+        assert (bins != sbins).nnz == 0
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+""" test deadtime corrections for arrays of count rates"""
+import pytest
+import numpy as np
+
+from larch.xrf.deadtime import calc_icr, solve_icr, correction_factor
+from larch.io.xsp3_hdf5 import estimate_icr, XSPRESS3_TAU
+
+TAUS = np.array([80, 90, 100])*1.e-9
+
+def make_ocr(npix=500, seed=0):
+    rng = np.random.default_rng(seed)
+    icr = rng.uniform(1.e3, 0.95/TAUS, size=(npix, len(TAUS)))
+    return icr, icr*np.exp(-icr*TAUS)
+
+def test_solve_icr():
+    icr, ocr = make_ocr()
+    out = solve_icr(ocr, TAUS)
+    assert out.shape == ocr.shape
+    assert np.allclose(out, icr, rtol=1.e-12)
+    for i in range(0, 500, 37):
+        for j, tau in enumerate(TAUS):
+            assert out[i, j] == pytest.approx(calc_icr(ocr[i, j], tau), rel=1.e-6)
+
+def test_solve_icr_limits():
+    tau = 1.e-6
+    ocr = np.array([0, 1.e4, np.exp(-1)/tau, 0.5/tau, -1])
+    out = solve_icr(ocr, tau)
+    assert out[0] == 0
+    assert out[2] == pytest.approx(1/tau)
+    assert np.isnan(out[3]) and np.isnan(out[4])
+    out = solve_icr(ocr, tau, saturate=True)
+    assert out[3] == pytest.approx(1/tau)
+    assert np.isnan(out[4])
+    # no deadtime correction for tau <= 0
+    assert np.array_equal(solve_icr(ocr[:4], [0, 0, 0, -1]), ocr[:4])
+
+def test_solve_icr_scalar():
+    icr = solve_icr(1.e5, 1.e-7)
+    assert np.ndim(icr) == 0
+    assert icr == pytest.approx(calc_icr(1.e5, 1.e-7), rel=1.e-6)
+    assert np.isnan(solve_icr(-1.0, 1.e-7))
+    assert np.isnan(solve_icr(1.e7, 1.e-7))
+    assert solve_icr(1.e5, 0) == 1.e5
+    cor = correction_factor(1.0, 0.9, ocr=1.e5, tau=1.e-7)
+    assert cor == pytest.approx(icr/1.e5/0.9)
+
+def test_correction_factor():
+    icr, ocr = make_ocr()
+    rt, lt = 1.0, np.full(ocr.shape, 0.9)
+    cor = correction_factor(rt, lt, ocr=ocr, tau=TAUS)
+    assert np.allclose(cor, (icr/ocr)/0.9)
+    assert np.allclose(correction_factor(rt, lt, icr=icr, ocr=ocr), cor)
+    assert np.allclose(correction_factor(rt, lt), 1/0.9)
+
+def test_estimate_icr():
+    ocr = np.array([[1.e5, 2.e6], [4.e6, 1.e7]])
+    icr = estimate_icr(ocr, XSPRESS3_TAU)
+    assert np.allclose(icr[:, :1]*np.exp(-icr[:, :1]*XSPRESS3_TAU), ocr[:, :1])
+    assert icr[1, 1] == pytest.approx(1/XSPRESS3_TAU)
+    assert ocr[1, 1] == 1.e7
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+""" Tests of on-disk cache of Feff path files """
+from pathlib import Path
+import shutil
+import numpy as np
+
+from larch.xafs import feffpath, feffcache
+from larch.xafs.feffdat import FeffDatFile
+
+base_dir = Path(__file__).parent.parent.resolve()
+feff_dir = base_dir / 'examples' / 'feffit'
+
+def test_feffcache(tmp_path):
+    fname = str(tmp_path / 'feff0001.dat')
+    shutil.copy(feff_dir / 'feff0001.dat', fname)
+    cache_dir = tmp_path / feffcache.CACHE_FOLDER
+
+    parsed = FeffDatFile(fname, use_cache=False)
+    assert not cache_dir.exists()
+
+    path1 = feffpath(fname)
+    assert len(list(cache_dir.iterdir())) == 1
+    cached = feffcache.read_feffcache(fname)
+    assert cached is not None
+
+    fdat = FeffDatFile(fname)
+    assert fdat.spline_tcks is not None
+    assert fdat.geom == parsed.geom
+    assert fdat.potentials == parsed.potentials
+    assert fdat.reff == parsed.reff
+    assert fdat.nleg == parsed.nleg
+    assert fdat.rmass == parsed.rmass
+    for attr in feffcache.TABLE_ARRAYS:
+        np.testing.assert_array_equal(getattr(fdat, attr), getattr(parsed, attr))
+
+    path2 = feffpath(fname)
+    k = 0.05 + 0.1*np.arange(150)
+    for name in ('pha', 'amp', 'rep', 'lam'):
+        np.testing.assert_allclose(path2.spline_coefs[name](k),
+                                   path1.spline_coefs[name](k))
+
+    # changing the file invalidates the cache, pruning removes old data
+    with open(fname, 'a') as fh:
+        fh.write('\n')
+    assert feffcache.read_feffcache(fname) is None
+    feffpath(fname)
+    assert len(list(cache_dir.iterdir())) == 2
+    removed = feffcache.prune_feffcache(str(tmp_path))
+    assert len(removed) == 1
+    assert feffcache.read_feffcache(fname) is not None
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+""" Tests of batched Feff path sums """
+from pathlib import Path
+import numpy as np
+from lmfit import Parameters
+
+from larch.xafs import feffpath, ff2chi
+from larch.xafs.feffdat import FeffPathSum, PATH_PARS
+
+base_dir = Path(__file__).parent.parent.resolve()
+feff_dir = base_dir / 'examples' / 'feffit'
+
+def get_paths():
+    p1 = feffpath(str(feff_dir / 'feff0001.dat'), s02='amp', e0='del_e0',
+                  sigma2='sig2', deltar='alpha*reff', third=0.0002)
+    p2 = feffpath(str(feff_dir / 'feff0002.dat'), s02='amp', e0='del_e0',
+                  sigma2='sig2*1.2', deltar='alpha*reff', ei=0.5)
+    p3 = feffpath(str(feff_dir / 'feff0003.dat'), s02='amp', e0='del_e0+2',
+                  sigma2='sig2*1.5', fourth=1.e-5)
+    return [p1, p2, p3]
+
+def get_params():
+    params = Parameters()
+    params.add('amp', value=0.9)
+    params.add('del_e0', value=3.0)
+    params.add('sig2', value=0.008)
+    params.add('alpha', value=0.003)
+    return params
+
+def test_pathsum_matches_paths():
+    paths = get_paths()
+    params = get_params()
+    k = 0.05*np.arange(401)
+    expected = np.zeros_like(k)
+    for path in paths:
+        path.create_path_params(params=params)
+        path._calc_chi(k=k)
+        expected += path.chi
+
+    pathsum = FeffPathSum(get_paths())
+    calculated = pathsum.calc_chi(params, k=k)
+    np.testing.assert_allclose(calculated, expected, rtol=1.e-6, atol=1.e-9)
+
+def test_pathsum_unused_path():
+    paths = get_paths()
+    params = get_params()
+    paths[1].use = False
+    k = 0.05*np.arange(401)
+    out = ff2chi(paths, paramgroup=params, k=k)
+    assert np.all(paths[1].chi == 0)
+    np.testing.assert_allclose(out.chi, paths[0].chi + paths[2].chi)
+
+def test_pathsum_derivatives():
+    paths = get_paths()
+    params = get_params()
+    k = 0.05*np.arange(401)
+    pathsum = FeffPathSum(paths)
+    chi0 = pathsum.calc_chi(params, k=k, with_derivs=True)
+    # sigma2 for all paths depends on 'sig2', e0 on 'del_e0'
+    dpars = pathsum.pathpar_gradient(params, ['sig2', 'del_e0'])
+    assert dpars.shape == (2, len(PATH_PARS), 3)
+    np.testing.assert_allclose(dpars[0, PATH_PARS.index('sigma2')],
+                               [1.0, 1.2, 1.5], rtol=1.e-5)
+    np.testing.assert_allclose(dpars[1, PATH_PARS.index('e0')],
+                               [1.0, 1.0, 1.0], rtol=1.e-5)
+
+    for vname, ipar in (('sig2', 'sigma2'), ('del_e0', 'e0')):
+        step = 1.e-5*max(1, abs(params[vname].value))
+        params[vname].value += step
+        params.update_constraints()
+        chi1 = FeffPathSum(get_paths()).calc_chi(params, k=k)
+        params[vname].value -= step
+        params.update_constraints()
+        ivar = 0 if vname == 'sig2' else 1
+        dchi = np.einsum('ij,ijk->k', dpars[ivar], pathsum.dchi_dpars)
+        np.testing.assert_allclose(dchi, (chi1-chi0)/step,
+                                   rtol=1.e-3, atol=1.e-3*abs(dchi).max())
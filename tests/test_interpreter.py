@@ -765,6 +765,49 @@ class TestEval(TestCase):
         z = self.interp("""def foo(): return 42\nfoo()""")
         self.assertEqual(z, 42)
 
+    def test_parse_cache(self):
+        """parsed statements are cached and reused"""
+        self.interp.parse_cache.clear()
+        self.interp("y = 3*x + 1")
+        node = self.interp.parse_cache["y = 3*x + 1"]
+        self.interp("x = 2")
+        self.interp("y = 3*x + 1")
+        self.assertTrue(self.interp.parse_cache["y = 3*x + 1"] is node)
+        self.isvalue('y', 7)
+        self.interp.parse_cache_size = 2
+        for i in range(5):
+            self.interp(f"z = {i}")
+        self.assertEqual(len(self.interp.parse_cache), 2)
+        self.assertEqual(list(self.interp.parse_cache), ['z = 3', 'z = 4'])
+
+    def test_compiled_nodes(self):
+        """arithmetic and numpy calls compiled to closures"""
+        node = self.interp.parse("sqrt(x**2 + 3.0) - -x")
+        self.assertTrue(hasattr(node.body[0].value, 'larch_fast'))
+        node = self.interp.parse("a.b + 1")
+        self.assertFalse(hasattr(node.body[0].value, 'larch_fast'))
+        self.interp("x = linspace(0, 1, 11)")
+        self.isnear("sin(x)*2 + cos(x/2)", np.sin(np.linspace(0, 1, 11))*2 +
+                    np.cos(np.linspace(0, 1, 11)/2))
+        self.interp("def f(a, scale=1): return a*scale")
+        self.assertEqual(self.interp("f(2, scale=3) + 1"), 7)
+
+    def test_compiled_call_builtin_method(self):
+        """callables with no __module__ are called through on_call()"""
+        self.interp('s = "abc"')
+        self.interp('f = s.upper')
+        self.assertEqual(self.interp('f()'), 'ABC')
+        self.check_error(None)
+
+    def test_compiled_errors(self):
+        """errors in compiled nodes"""
+        self.interp("y = 1 + undefined_x")
+        self.check_error('NameError', 'undefined_x')
+        self.interp("y = 1/0")
+        self.check_error('ZeroDivisionError')
+        self.interp("y = sqrt(1, 2, 3, 4)")
+        self.check_error('TypeError', 'sqrt')
+
 
 if __name__ == '__main__':
     for suite in (TestEval,):
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+""" test loading core Larch modules when first used"""
+import pytest
+import numpy as np
+
+from larch import Interpreter, builtins
+from larch.symboltable import LazyModuleGroup
+from larch.utils import import_times
+
+def loaded(session):
+    return [mname for mname, isloaded in session.lazy_modules.items()
+            if isloaded]
+
+def test_startup():
+    session = Interpreter()
+    assert loaded(session) == []
+    assert isinstance(session.symtable._xafs, LazyModuleGroup)
+    assert '_xafs' in session.symtable._sys.core_groups
+    session.eval('x = sqrt(linspace(0, 4, 5))')
+    assert loaded(session) == []
+
+def test_load_on_name():
+    session = Interpreter()
+    session.eval('g = group(energy=linspace(8800, 9400, 601))')
+    session.eval('g.mu = 1 + arctan((g.energy-8980)/2)/pi')
+    session.eval('pre_edge(g)')
+    assert abs(session.symtable.g.e0 - 8980) < 1.0
+    # modules are loaded in search order, until the name is found
+    assert loaded(session) == ['larch.io', 'larch.xray', 'larch.xrf',
+                               'larch.xafs']
+    assert session.symtable.get_group('_xafs').__doc__ is not None
+
+def test_load_on_group():
+    session = Interpreter()
+    assert session.eval('_xray.atomic_mass("Fe")') == pytest.approx(55.845)
+    assert loaded(session) == ['larch.xray']
+    session.eval('out = d_from_q(1.0)')
+    assert session.symtable.out == pytest.approx(2*np.pi)
+
+def test_undefined_name():
+    session = Interpreter()
+    session.eval('y = not_a_name')
+    assert len(session.error) > 0
+    assert isinstance(session.error[0].exc(), NameError)
+    assert all(session.lazy_modules.values())
+
+def test_same_as_eager(monkeypatch):
+    lazy = Interpreter()
+    while lazy.load_module():
+        pass
+    monkeypatch.setattr(builtins, 'use_lazy_modules', False)
+    eager = Interpreter()
+    assert lazy.symtable._sys.core_groups == eager.symtable._sys.core_groups
+    for gname in eager.symtable._sys.core_groups:
+        lgroup = lazy.symtable.get_group(gname)
+        egroup = eager.symtable.get_group(gname)
+        assert sorted(dir(lgroup)) == sorted(dir(egroup))
+        assert lgroup.__doc__ == egroup.__doc__
+
+def test_import_times():
+    times = import_times('larch.utils.gformat')
+    names = [t[0] for t in times]
+    assert 'larch.utils.gformat' in names
+    assert all(total >= selftime for name, total, selftime in times)
+    with pytest.raises(ImportError):
+        import_times('larch.not_a_module')
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+""" test linear combination fitting"""
+import pytest
+import numpy as np
+import lmfit
+from scipy.optimize import lsq_linear
+
+from larch import Group
+from itertools import combinations
+
+from larch.math import lincombo_fit, lincombo_fitall, lincombo_fitmap, nnls_gram
+from larch.math.lincombo_fitting import lincombo_solve
+
+energy = np.linspace(7000, 7200, 401)
+
+def make_comps(ncomps=4):
+    comps = []
+    for i in range(ncomps):
+        cen, wid = 7100 + 3*i, 2 + i
+        norm = (0.5*(1 + np.tanh((energy-cen)/wid)) +
+                0.2*np.exp(-(energy-cen-5)**2/20))
+        comps.append(Group(energy=energy, norm=norm, filename=f'comp{i}'))
+    return comps
+
+def make_data(comps, weights, noise=0.003, seed=1):
+    rng = np.random.default_rng(seed)
+    norm = sum(w*c.norm for w, c in zip(weights, comps))
+    return Group(energy=energy, norm=norm + rng.normal(0, noise, len(energy)),
+                 filename='data')
+
+def lmfit_result(group, comps, sum_to_one=True):
+    "reference result from lmfit, with the last weight constrained"
+    ycomps = np.array([c.norm for c in comps]).T
+    params = lmfit.Parameters()
+    for i in range(len(comps)):
+        params.add(f'c{i}', value=1.0/len(comps))
+    if sum_to_one:
+        params[f'c{len(comps)-1}'].expr = '1 - ' + '-'.join(
+            [f'c{i}' for i in range(len(comps)-1)])
+    def resid(pars):
+        wts = np.array([pars[f'c{i}'].value for i in range(len(comps))])
+        return ycomps @ wts - group.norm
+    return lmfit.minimize(resid, params)
+
+@pytest.mark.parametrize('sum_to_one', [True, False])
+def test_unbounded_matches_lmfit(sum_to_one):
+    comps = make_comps()
+    dat = make_data(comps, [0.2, 0.3, 0.4, 0.1])
+    out = lincombo_fit(dat, comps, minvals=[-np.inf]*4, maxvals=[np.inf]*4,
+                       sum_to_one=sum_to_one)
+    ref = lmfit_result(dat, comps, sum_to_one=sum_to_one)
+    assert out.result.nvarys == ref.nvarys
+    assert out.chisqr == pytest.approx(ref.chisqr, rel=1.e-6)
+    assert out.redchi == pytest.approx(ref.redchi, rel=1.e-6)
+    assert out.result.aic == pytest.approx(ref.aic, rel=1.e-6)
+    for i in range(4):
+        par, rpar = out.result.params[f'c{i}'], ref.params[f'c{i}']
+        assert par.value == pytest.approx(rpar.value, abs=1.e-6)
+        assert par.stderr == pytest.approx(rpar.stderr, rel=1.e-3)
+    if sum_to_one:
+        assert out.result.params['total'].value == pytest.approx(1.0)
+
+def test_bounded_sum_to_one():
+    comps = make_comps()
+    dat = make_data(comps, [1.3, -0.2, 0.0, -0.1])
+    out = lincombo_fit(dat, comps, minvals=[0]*4, maxvals=[1]*4)
+    wts = np.array([out.result.params[f'c{i}'].value for i in range(4)])
+    assert wts.sum() == pytest.approx(1.0)
+    assert np.all(wts >= 0) and np.all(wts <= 1)
+    assert wts[0] == pytest.approx(1.0)
+
+    # no better solution with weights in bounds that sum to 1
+    ycomps = np.array([c.norm for c in comps]).T
+    rng = np.random.default_rng(2)
+    for trial in range(200):
+        other = rng.dirichlet(np.ones(4))
+        chisqr = ((ycomps @ other - dat.norm)**2).sum()
+        assert chisqr >= out.chisqr
+
+def test_bounded_matches_bvls():
+    comps = make_comps()
+    dat = make_data(comps, [1.3, -0.2, 0.0, -0.1])
+    ycomps = np.array([c.norm for c in comps]).T
+    out = lincombo_fit(dat, comps, minvals=[0]*4, maxvals=[2]*4,
+                       sum_to_one=False)
+    ref = lsq_linear(ycomps, dat.norm, bounds=(0, 2), method='bvls')
+    wts = np.array([out.result.params[f'c{i}'].value for i in range(4)])
+    assert np.allclose(wts, ref.x, atol=1.e-8)
+    assert out.chisqr == pytest.approx((ref.fun**2).sum())
+    # weights at bounds have no uncertainty
+    assert out.result.params['c1'].stderr == 0
+    assert out.result.params['c0'].stderr > 0
+
+def test_solve_covar():
+    comps = make_comps(3)
+    ycomps = np.array([c.norm for c in comps]).T
+    ydat = ycomps @ np.array([0.5, 0.3, 0.2])
+    wts, covar = lincombo_solve(ycomps, ydat, sum_to_one=True)
+    assert np.allclose(wts, [0.5, 0.3, 0.2])
+    # weights sum to 1, so the sum has no variance
+    assert covar.sum() == pytest.approx(0, abs=1.e-8*np.abs(covar).max())
+
+def test_solve_bounded_random():
+    from scipy.optimize import minimize
+    rng = np.random.default_rng(3)
+    for trial in range(100):
+        ycomps = rng.normal(size=(40, 5))
+        ydat = ycomps @ rng.normal(0.2, 0.5, 5) + rng.normal(0, 0.1, 40)
+        lower, upper = -0.2*rng.random(5), 0.5 + rng.random(5)
+        wts, covar = lincombo_solve(ycomps, ydat, minvals=lower,
+                                    maxvals=upper, sum_to_one=True)
+        assert wts.sum() == pytest.approx(1.0)
+        assert np.all(wts >= lower) and np.all(wts <= upper)
+        # weights at bounds have no covariance, the sum has no variance
+        atbound = np.isclose(wts, lower) | np.isclose(wts, upper)
+        assert np.all(covar[atbound] == 0)
+        assert covar.sum() == pytest.approx(0, abs=1.e-8*np.abs(covar).max())
+
+        ref = minimize(lambda w: ((ycomps @ w - ydat)**2).sum(),
+                       np.ones(5)/5, method='SLSQP',
+                       bounds=list(zip(lower, upper)),
+                       constraints={'type': 'eq', 'fun': lambda w: w.sum() - 1})
+        chisqr = ((ycomps @ wts - ydat)**2).sum()
+        assert chisqr <= ref.fun*(1 + 1.e-6)
+
+def test_vary_e0():
+    comps = make_comps(2)
+    dat = make_data(comps, [0.6, 0.4])
+    out = lincombo_fit(dat, comps, vary_e0=True)
+    assert out.result.method == 'leastsq'
+    assert out.result.params['c0'].value == pytest.approx(0.6, abs=0.05)
+
+def fitall_reference(dat, comps, minvals, maxvals, max_output=16,
+                     vary_e0=False):
+    "fit every combination with lincombo_fit(), as lincombo_fitall() did"
+    out, kept = [], []
+    for nx in range(2, len(comps)+1):
+        for icomps in combinations(range(len(comps)), nx):
+            ret = lincombo_fit(dat, [comps[i] for i in icomps],
+                               weights=[1.0/nx]*nx,
+                               minvals=[minvals[i] for i in icomps],
+                               maxvals=[maxvals[i] for i in icomps],
+                               vary_e0=vary_e0)
+            sig = sorted(k for k, w in ret.weights.items() if w > 0.0005)
+            if sig not in kept:
+                kept.append(sig)
+                out.append(ret)
+    return sorted(out, key=lambda x: x.redchi)[:max_output]
+
+@pytest.mark.parametrize('nworkers', [1, 2])
+def test_fitall(nworkers):
+    comps = make_comps(6)
+    dat = make_data(comps, [0.5, 0, 0.3, 0, 0.2, 0])
+    out = lincombo_fitall(dat, comps, minvals=[0]*6, maxvals=[1]*6,
+                          max_output=8, nworkers=nworkers, chunksize=7)
+    ref = fitall_reference(dat, comps, [0]*6, [1]*6, max_output=8)
+    assert len(out) == len(ref) == 8
+    for fit, rfit in zip(out, ref):
+        assert fit.redchi == pytest.approx(rfit.redchi, rel=1.e-8)
+        assert fit.weights.keys() == rfit.weights.keys()
+        for label, wt in fit.weights.items():
+            assert wt == pytest.approx(rfit.weights[label], abs=1.e-6)
+    assert [f.redchi for f in out] == sorted(f.redchi for f in out)
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_fitall_dominant(seed):
+    "combinations whose bounded solution is a single component are kept"
+    comps = make_comps(5)
+    dat = make_data(comps, [1, 0, 0, 0, 0], seed=seed)
+    out = lincombo_fitall(dat, comps, minvals=[0]*5, maxvals=[1]*5,
+                          max_output=8)
+    ref = fitall_reference(dat, comps, [0]*5, [1]*5, max_output=8)
+    assert len(out) == len(ref) > 2
+    for fit, rfit in zip(out, ref):
+        assert fit.redchi == pytest.approx(rfit.redchi, rel=1.e-8)
+        assert fit.weights.keys() == rfit.weights.keys()
+        for label, wt in fit.weights.items():
+            assert wt == pytest.approx(rfit.weights[label], abs=1.e-6)
+
+def test_fitall_outside_bounds():
+    "all combinations are fit with bounds if none are within bounds"
+    comps = make_comps(3)
+    dat = make_data(comps, [1.3, -0.2, -0.1])
+    out = lincombo_fitall(dat, comps, minvals=[0]*3, maxvals=[1]*3)
+    assert len(out) > 0
+    for fit in out:
+        assert sum(fit.weights.values()) == pytest.approx(1.0)
+        assert min(fit.weights.values()) >= 0
+
+@pytest.mark.parametrize('minval, vary_e0', [(0.1, False), (-0.2, False),
+                                             (0, True)])
+def test_fitall_exhaustive(minval, vary_e0):
+    "combinations outside bounds are fit with bounds unless lower bounds are 0"
+    comps = make_comps(5)
+    dat = make_data(comps, [0.5, 0, 0.3, 0, 0.2])
+    minvals, maxvals = [minval]*5, [1]*5
+    out = lincombo_fitall(dat, comps, minvals=minvals, maxvals=maxvals,
+                          max_output=8, vary_e0=vary_e0, nworkers=2)
+    ref = fitall_reference(dat, comps, minvals, maxvals, max_output=8,
+                           vary_e0=vary_e0)
+    assert len(out) == len(ref)
+    for fit, rfit in zip(out, ref):
+        assert fit.weights.keys() == rfit.weights.keys()
+        assert fit.redchi == pytest.approx(rfit.redchi, rel=1.e-6)
+
+def test_fitall_vary_e0():
+    comps = make_comps(3)
+    dat = make_data(comps, [0.6, 0.4, 0.0])
+    out = lincombo_fitall(dat, comps, vary_e0=True, nworkers=2)
+    assert out[0].result.params['e0_shift'].vary
+    assert [f.redchi for f in out] == sorted(f.redchi for f in out)
+
+def make_stack(comps, shape=(6, 50), seed=3):
+    rng = np.random.default_rng(seed)
+    ycomps = np.array([c.norm for c in comps]).T
+    wts = rng.dirichlet(np.ones(len(comps))*0.5, size=shape)
+    # some spectra far from any solution within bounds
+    wts[:1] = rng.normal(0.25, 0.4, size=wts[:1].shape)
+    return wts @ ycomps.T + rng.normal(0, 0.01, shape + (len(energy),))
+
+@pytest.mark.parametrize('kws', [dict(), dict(sum_to_one=False),
+                                 dict(minvals=[0]*4),
+                                 dict(minvals=[0]*4, maxvals=[0.6]*4),
+                                 dict(minvals=[0, None, 0, 0])])
+def test_fitmap(kws):
+    comps = make_comps()
+    spectra = make_stack(comps)
+    out = lincombo_fitmap(spectra, energy, comps, chunk_bytes=2**16,
+                          nworkers=2, xmin=7050, **kws)
+    assert out.chisqr.shape == out.rfactor.shape == spectra.shape[:2]
+    for iy, ix in ((0, 0), (0, 17), (3, 31), (5, 49)):
+        dat = Group(energy=energy, norm=spectra[iy, ix], filename='data')
+        ref = lincombo_fit(dat, comps, xmin=7050, **kws)
+        assert out.chisqr[iy, ix] == pytest.approx(ref.chisqr, rel=1.e-8)
+        assert out.rfactor[iy, ix] == pytest.approx(ref.rfactor, rel=1.e-8)
+        for label, wt in ref.weights.items():
+            assert out.weights[label][iy, ix] == pytest.approx(wt, abs=1.e-8)
+
+def test_array_bounds():
+    comps = make_comps()
+    spectra = make_stack(comps, shape=(2, 10))
+    out = lincombo_fitmap(spectra, energy, comps, minvals=np.zeros(4),
+                          maxvals=np.ones(4))
+    ref = lincombo_fitmap(spectra, energy, comps, minvals=[0]*4,
+                          maxvals=[1]*4)
+    assert np.allclose(out.chisqr, ref.chisqr)
+
+    dat = Group(energy=energy, norm=spectra[1, 3], filename='data')
+    out = lincombo_fitall(dat, comps, minvals=np.zeros(4), maxvals=np.ones(4))
+    ref = lincombo_fitall(dat, comps, minvals=[0]*4, maxvals=[1]*4)
+    assert [f.redchi for f in out] == [f.redchi for f in ref]
+
+def test_nnls_gram_total():
+    comps = make_comps(8)
+    spectra = make_stack(comps, shape=(8, 50)).reshape(400, -1).T
+    ycomps = np.array([c.norm for c in comps]).T
+    wts, converged = nnls_gram(ycomps.T @ ycomps, ycomps.T @ spectra,
+                               total=1.0)
+    assert converged.all()
+    assert np.allclose(wts.sum(axis=0), 1.0)
+    assert wts.min() >= 0
+    for i in range(0, 400, 23):
+        ref = lincombo_solve(ycomps, spectra[:, i], minvals=[0]*8)[0]
+        assert np.allclose(wts[:, i], ref, atol=1.e-7)
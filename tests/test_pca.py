@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+""" test principal component analysis"""
+import pytest
+import numpy as np
+
+from larch import Group
+from larch.math import (pca_train, pca_fit, pca_fitmap, save_pca_model,
+                        read_pca_model)
+from larch.math.pca import pca_statistics
+
+def make_comps(energy, ncomps=4):
+    return np.array([0.5*(1 + np.tanh((energy-7100-3*i)/(2+i))) +
+                     0.2*np.exp(-(energy-7105-3*i)**2/20)
+                     for i in range(ncomps)]).T
+
+@pytest.mark.parametrize('rescale', [True, False])
+def test_pca_fitmap(rescale):
+    rng = np.random.default_rng(1)
+    energy = np.linspace(7000, 7200, 401)
+    ycomps = make_comps(energy)
+    train = [Group(energy=energy, filename=f'std{i}',
+                   norm=ycomps @ rng.dirichlet(np.ones(4)) +
+                   rng.normal(0, 0.002, len(energy)))
+             for i in range(10)]
+    model = pca_train(train, xmin=7050, xmax=7180)
+
+    # spectra on a different energy grid, with varying scale
+    xmap = np.linspace(7001, 7199, 300)
+    wts = rng.dirichlet(np.ones(4), size=(5, 8))
+    spectra = ((wts @ make_comps(xmap).T) * rng.uniform(0.8, 1.2, (5, 8, 1))
+               + rng.normal(0, 0.003, (5, 8, len(xmap))))
+    out = pca_fitmap(spectra, xmap, model, ncomps=4, rescale=rescale,
+                     chunk_bytes=2**14, nworkers=2)
+    assert out.weights.shape == (5, 8, 4)
+    assert out.chi_square.shape == out.data_scale.shape == (5, 8)
+    for iy, ix in ((0, 0), (2, 5), (4, 7)):
+        dat = Group(energy=xmap, norm=spectra[iy, ix])
+        pca_fit(dat, model, ncomps=4, rescale=rescale)
+        res = dat.pca_result
+        assert out.data_scale[iy, ix] == pytest.approx(res.data_scale, rel=1.e-6)
+        assert out.chi_square[iy, ix] == pytest.approx(res.chi_square, rel=1.e-6)
+        assert np.allclose(out.weights[iy, ix], res.weights, atol=1.e-6)
+
+def make_training(nspectra=40, seed=2):
+    rng = np.random.default_rng(seed)
+    energy = np.linspace(7000, 7200, 401)
+    spectra = (rng.dirichlet(np.ones(4), size=nspectra) @ make_comps(energy).T
+               + rng.normal(0, 0.003, (nspectra, len(energy))))
+    groups = [Group(energy=energy, norm=spec, filename=f'spec{i}')
+              for i, spec in enumerate(spectra)]
+    return energy, spectra, groups
+
+def same_components(comps1, comps2, tol):
+    "components agree, except for sign"
+    return all(min(abs(c1-c2).max(), abs(c1+c2).max()) < tol
+               for c1, c2 in zip(comps1, comps2))
+
+@pytest.mark.parametrize('method', ['svd', 'randomized', 'streaming'])
+def test_pca_train_methods(method):
+    energy, spectra, groups = make_training()
+    ref = pca_train(groups, xmin=7050, xmax=7180, method='eigh')
+    if method == 'streaming':
+        model = pca_train(spectra, energy=energy, xmin=7050, xmax=7180,
+                          method=method, chunksize=7)
+        assert model.ydat is None
+    else:
+        model = pca_train(groups, xmin=7050, xmax=7180, method=method)
+    nsig = 3 if method == 'randomized' else len(ref.eigenvalues)
+    assert np.allclose(model.eigenvalues[:nsig], ref.eigenvalues[:nsig],
+                       rtol=1.e-8, atol=1.e-10)
+    assert np.allclose(model.variances[:nsig], ref.variances[:nsig],
+                       rtol=1.e-8, atol=1.e-10)
+    assert np.allclose(model.ind[:nsig], ref.ind[:nsig], rtol=1.e-8)
+    assert np.allclose(model.mean, ref.mean)
+    assert same_components(model.components[:nsig], ref.components[:nsig],
+                           1.e-6)
+    assert model.nsig == ref.nsig
+
+    dat = Group(energy=energy, norm=spectra[3])
+    pca_fit(dat, ref, ncomps=3, rescale=False)
+    chi_square = dat.pca_result.chi_square
+    pca_fit(dat, model, ncomps=3, rescale=False)
+    assert dat.pca_result.chi_square == pytest.approx(chi_square)
+
+def test_pca_statistics():
+    energy, spectra, groups = make_training(nspectra=400)
+    model = pca_train(groups, xmin=7050, xmax=7180)
+    ind, f1r = pca_statistics(model)
+
+    # direct calculation
+    p, n = model.ydat.shape
+    eigv = model.eigenvalues
+    for r in (0, 1, 5, n-2):
+        nr = n - r - 1
+        assert ind[r] == pytest.approx(np.sqrt(eigv[r:].sum()/(p*nr))/nr**2)
+        f1sum = sum(eigv[i]/((p+1-i)*(n+1-i)) for i in range(r, n))
+        assert f1r[r] == pytest.approx(eigv[r]/(max(1, (p+1-r)*(n-r+1))*f1sum))
+
+def test_save_pca_model(tmp_path):
+    energy, spectra, groups = make_training()
+    model = pca_train(groups, xmin=7050, xmax=7180)
+    fname = str(tmp_path / 'model.pca')
+    save_pca_model(model, fname)
+    saved = read_pca_model(fname)
+    assert np.allclose(saved.components, model.components)
+    assert saved.nsig == model.nsig
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+""" Tests of saving and restoring Larch sessions and group lists """
+import mmap
+import numpy as np
+from numpy.testing import assert_allclose
+from pathlib import Path
+import pytest
+
+from larch import Interpreter, Group
+from larch.xafs import feffpath
+from larch.io.save_restore import (save_session, read_session, load_session,
+                                   save_groups, read_groups, LazyGroup,
+                                   is_larch_session_file, is_binary_larch_file)
+
+FEFFDAT = Path(__file__).parent.parent / 'examples' / 'feffit' / 'feff0001.dat'
+
+def make_session():
+    session = Interpreter()
+    symtab = session.symtable
+    symtab.dat1 = Group(energy=np.linspace(8000, 9000, 501),
+                        mu=np.random.normal(size=501).astype(np.float32),
+                        counts=np.arange(12, dtype=np.uint16).reshape(3, 4),
+                        chi=np.exp(1j*np.linspace(0, 2, 11)),
+                        label='dat1', opts={'x': 1, 'names': ['a', 'b']},
+                        sub=Group(x=np.linspace(0, 1, 5), name='sub'))
+    symtab.path1 = feffpath(str(FEFFDAT), s02='0.9', e0=1.0)
+    symtab.x = np.array(['a', 'bc', 'def'])
+    symtab.y = 2.5
+    return session
+
+def check_symbols(symbols, symtab, binary=True):
+    dat, ref = symbols['dat1'], symtab.dat1
+    for attr in ('energy', 'mu', 'counts', 'chi'):
+        assert getattr(dat, attr).dtype == getattr(ref, attr).dtype
+        assert getattr(dat, attr).shape == getattr(ref, attr).shape
+        assert_allclose(getattr(dat, attr), getattr(ref, attr))
+    assert dat.label == 'dat1'
+    assert dat.opts == ref.opts
+    assert_allclose(dat.sub.x, ref.sub.x)
+    if binary:  # string arrays are only supported in binary files
+        assert list(symbols['x']) == list(symtab.x)
+    assert symbols['y'] == 2.5
+    path = symbols['path1']
+    assert path.s02 == '0.9'
+    assert_allclose(path._feffdat.mag_feff, symtab.path1._feffdat.mag_feff)
+
+@pytest.mark.parametrize('binary,compress', [(False, False), (True, False),
+                                             (True, True)])
+def test_session_roundtrip(tmp_path, binary, compress):
+    session = make_session()
+    fname = str(tmp_path / 'test.larix')
+    save_session(fname, binary=binary, compress=compress, _larch=session)
+    assert is_larch_session_file(fname)
+    assert is_binary_larch_file(fname) == binary
+
+    saved = read_session(fname)
+    assert saved.config['Larix Version'] == ('2.0' if binary else '1.0')
+    check_symbols(saved.symbols, session.symtable, binary=binary)
+
+    # arrays read from binary files must be writable
+    saved.symbols['dat1'].energy[0] = 0.0
+
+    newsession = Interpreter()
+    load_session(fname, _larch=newsession)
+    symbols = {name: getattr(newsession.symtable, name, None)
+               for name in ('dat1', 'path1', 'x', 'y')}
+    check_symbols(symbols, session.symtable, binary=binary)
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_groups_roundtrip(tmp_path, binary):
+    fname = str(tmp_path / 'groups.dat')
+    grp = Group(x=np.linspace(0, 1, 101), y=np.arange(5), name='g')
+    save_groups(fname, ['#test 1.0', grp, {'a': np.ones(3)}], binary=binary)
+    assert is_binary_larch_file(fname) == binary
+    out = read_groups(fname)
+    assert out[0] == '#test 1.0'
+    assert_allclose(out[1].x, grp.x)
+    assert out[1].y.dtype == grp.y.dtype
+    assert_allclose(out[2]['a'], np.ones(3))
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_session_lazy(tmp_path, binary):
+    session = make_session()
+    fname = str(tmp_path / 'test.larix')
+    save_session(fname, binary=binary, _larch=session)
+
+    saved = read_session(fname, lazy=True)
+    dat = saved.symbols['dat1']
+    assert isinstance(dat, LazyGroup)
+    assert dat.label == 'dat1'
+    assert type(dat) is Group
+    check_symbols(saved.symbols, session.symtable, binary=binary)
+    if binary:
+        # arrays are copy-on-write views of the memory-mapped file
+        base = dat.energy
+        while isinstance(base, np.ndarray):
+            base = base.base
+        assert isinstance(getattr(base, 'obj', base), mmap.mmap)
+        dat.energy[0] = -1.0
+
+        # saving over a memory-mapped file leaves mapped arrays intact
+        save_session(fname, binary=binary, _larch=session)
+        assert dat.energy[0] == -1.0
+        assert_allclose(dat.energy[1:], session.symtable.dat1.energy[1:])
+        assert read_session(fname).symbols['dat1'].energy[0] == 8000.0
+
+    newsession = Interpreter()
+    load_session(fname, lazy=True, _larch=newsession)
+    symbols = {name: getattr(newsession.symtable, name, None)
+               for name in ('dat1', 'path1', 'x', 'y')}
+    check_symbols(symbols, session.symtable, binary=binary)
+
+def test_default_version(tmp_path):
+    "version 1.0 files, readable by earlier versions, are written by default"
+    fname = str(tmp_path / 'test.larix')
+    save_session(fname, _larch=make_session())
+    assert not is_binary_larch_file(fname)
+    assert read_session(fname).config['Larix Version'] == '1.0'
+    fname = str(tmp_path / 'groups.dat')
+    save_groups(fname, [Group(x=np.arange(3))])
+    assert not is_binary_larch_file(fname)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+""" test structure factors calculated for CIF structures"""
+from pathlib import Path
+import pytest
+import numpy as np
+
+from larch.xrd import CifStructure, generate_hkl, d_from_hkl
+from larch.xrd.amcsd import (HKL_CACHE, TAU, f0, f1_chantler, f2_chantler,
+                             E_from_lambda, unpack_hkl_degen)
+from larch.xrd.amcsd_utils import CifParser, SpacegroupAnalyzer
+
+pytestmark = pytest.mark.skipif(CifParser is None, reason='needs pymatgen')
+
+base_dir = Path(__file__).parent.parent.resolve()
+ciffiles = ['struct2xas/ZnO_mp-2133.cif', 'struct2xas/ZnO_mp-997630.cif']
+
+def read_structure(fname, ams_id=None):
+    cif = CifStructure(ams_id=ams_id)
+    cif.pmg_cstruct = CifParser(base_dir / 'examples' / 'structuredata' / fname
+                                ).get_structures()[0]
+    cif.pmg_pstruct = SpacegroupAnalyzer(cif.pmg_cstruct
+                                         ).get_conventional_standard_structure()
+    return cif
+
+def f2_reference(cif, hkls, energy=None):
+    "F*F' summed one HKL and one site at a time"
+    sites = cif.get_sites()
+    sq = 1/(2*d_from_hkl(hkls, **cif.get_unitcell()))
+    f2 = np.zeros(len(hkls))
+    for i, hkl in enumerate(hkls):
+        fsum = 0.
+        for elem in sites:
+            fval = f0(elem, sq[i])[0]
+            if energy is not None:
+                fval += f1_chantler(elem, energy) - 1j*f2_chantler(elem, energy)
+            for occu, fcoord in sites[elem]:
+                fsum += fval*occu*np.exp(1j*TAU*(np.array(fcoord)*hkl).sum())
+        f2[i] = (fsum*fsum.conjugate()).real
+    return f2
+
+@pytest.mark.parametrize('fname', ciffiles)
+@pytest.mark.parametrize('wavelength', [None, 0.75])
+def test_calculate_f2(fname, wavelength):
+    cif = read_structure(fname)
+    hkls = generate_hkl(hmax=4, kmax=4, lmax=4, positive_only=False)
+    energy = None if wavelength is None else E_from_lambda(wavelength, E_units='eV')
+    ref = f2_reference(cif, hkls, energy=energy)
+    out = cif.calculate_f2(hkls, wavelength=wavelength)
+    assert np.allclose(out, ref, rtol=1.e-10, atol=1.e-10*ref.max())
+
+def test_calculate_f2_blocks(monkeypatch):
+    cif = read_structure(ciffiles[1])
+    hkls = generate_hkl(hmax=6, kmax=6, lmax=6, positive_only=False)
+    ref = cif.calculate_f2(hkls)
+    monkeypatch.setattr('larch.xrd.amcsd.F2_BLOCKSIZE', 100)
+    assert np.allclose(cif.calculate_f2(hkls), ref, rtol=1.e-12)
+
+def test_find_hkls():
+    from pymatgen.core import Lattice, Structure
+    cif = CifStructure()
+    cif.pmg_cstruct = cif.pmg_pstruct = Structure.from_spacegroup(
+        'Fm-3m', Lattice.cubic(5.64), ['Na', 'Cl'], [[0, 0, 0], [0.5, 0.5, 0.5]])
+    hkls, degen = cif.find_hkls(nmax=32)
+    assert len(hkls) == len(degen) <= 32
+    # all even or all odd, with degeneracies of the cubic point group
+    assert all(len(set(hkl % 2)) == 1 for hkl in hkls)
+    expected = {(1, 1, 1): 8, (2, 0, 0): 6, (2, 2, 0): 12, (3, 1, 1): 24,
+                (2, 2, 2): 8, (4, 0, 0): 6}
+    for hkl, ndegen in zip(hkls, degen):
+        hkl = tuple(sorted(hkl, reverse=True))
+        if hkl in expected:
+            assert ndegen == expected[hkl]
+    assert (2, 0, 0) in [tuple(sorted(hkl, reverse=True)) for hkl in hkls]
+
+    sfact = cif.get_structure_factors(wavelength=0.75)
+    assert np.all(np.diff(sfact.q) >= 0)
+    assert np.allclose(sfact.f2hkl, cif.calculate_f2(sfact.hkl, wavelength=0.75))
+
+def test_hkl_cache():
+    HKL_CACHE.clear()
+    cif = read_structure(ciffiles[1], ams_id=-1)
+    hkls, degen = cif.find_hkls()
+    assert (-1, 64, 10, 0.75) in HKL_CACHE
+    other = CifStructure(ams_id=-1)
+    chkls, cdegen = other.find_hkls()
+    assert np.all(chkls == hkls) and np.all(cdegen == degen)
+    phkls, pdegen = unpack_hkl_degen(other.hkls)
+    assert np.all(phkls == hkls) and np.all(pdegen == degen)
+    HKL_CACHE.clear()
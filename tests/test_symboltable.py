@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+""" Tests of symbol lookup in the Larch SymbolTable """
+import numpy as np
+import pytest
+
+from larch import Interpreter, Group
+from larch.symboltable import SymbolTable
+
+@pytest.fixture(params=[True, False])
+def session(request, monkeypatch):
+    monkeypatch.setattr(SymbolTable, 'use_lookup_cache', request.param)
+    return Interpreter()
+
+def test_lookup_shadowing(session):
+    symtab = session.symtable
+    assert symtab.get_symbol('sin') is np.sin
+    session.eval('sin = 3')
+    assert symtab.get_symbol('sin') == 3
+    session.eval('del sin')
+    assert symtab.get_symbol('sin') is np.sin
+    # direct setattr of a new member on a search group
+    symtab._main.sin = 4
+    assert session.eval('sin + 1') == 5
+    delattr(symtab._main, 'sin')
+    assert symtab.get_symbol('sin') is np.sin
+
+def test_lookup_searchgroups(session):
+    symtab = session.symtable
+    session.eval('g = group(a=1, b=2)')
+    session.eval('_math.a = 5')
+    assert session.eval('a') == 5
+    sgroups = symtab._sys.searchGroups[:]
+    symtab._sys.searchGroups = ['g'] + sgroups
+    assert session.eval('a') == 1
+    symtab._sys.searchGroups = sgroups
+    assert session.eval('a') == 5
+    # search groups gaining and losing members
+    symtab._sys.searchGroups = sgroups + ['g']
+    with pytest.raises(NameError):
+        symtab.get_symbol('c')
+    session.eval('g.c = 7')
+    assert session.eval('c') == 7
+    session.eval('del g.c')
+    with pytest.raises(NameError):
+        symtab.get_symbol('c')
+
+def test_lookup_dotted(session):
+    symtab = session.symtable
+    assert symtab.get_symbol('_xafs.autobk') is symtab._xafs.autobk
+    session.eval('_xafs.autobk = 3')
+    assert session.eval('_xafs.autobk') == 3
+    session.eval('def f(x):\n    return x + y\n#end def')
+    session.eval('y = 2')
+    assert session.eval('f(1)') == 3
+    session.eval('y = 4')
+    assert session.eval('f(1)') == 5
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+""" test LarchServer, with threads, sessions and binary array transfer"""
+import time
+from threading import Thread
+from xmlrpc.client import ServerProxy, Fault
+
+import pytest
+import numpy as np
+
+from larch.xmlrpc_server import LarchServer, get_array, get_next_port
+
+@pytest.fixture(scope='module')
+def server():
+    port = get_next_port(port=4966+int(1000*np.random.random()))
+    server = LarchServer(port=port, nthreads=4)
+    thread = Thread(target=server.run, daemon=True)
+    thread.start()
+    yield server
+    ServerProxy(f'http://localhost:{port}').shutdown()
+    thread.join(5)
+    server.server_close()
+
+def test_exec(server):
+    client = ServerProxy(f'http://localhost:{server.port}')
+    client.larch('x = arange(10)')
+    client.larch('x.sum()')
+    assert client.get_messages().strip() == '45'
+    assert client.get_rawdata('int(x.sum())') == 45
+
+def test_get_array(server):
+    client = ServerProxy(f'http://localhost:{server.port}')
+    client.larch('m = (arange(2048*100, dtype=float)**1.5).reshape(2048, 100)')
+    out = get_array('m', port=server.port)
+    assert out.shape == (2048, 100)
+    assert out.dtype == np.float64
+    assert out[-1, -1] == pytest.approx((2048*100-1)**1.5)
+    assert out.flags.writeable
+
+    out = get_array('m[::2, 10].astype("int16")', port=server.port)
+    assert out.shape == (1024,)
+    assert out.dtype == np.int16
+    out = get_array('array(["a", "bcd"])', port=server.port)
+    assert list(out) == ['a', 'bcd']
+
+    with pytest.raises(ValueError):
+        get_array('undefined_array', port=server.port)
+    with pytest.raises(ValueError):
+        get_array('group(a=1)', port=server.port)
+
+def test_sessions(server):
+    main = ServerProxy(f'http://localhost:{server.port}')
+    name = main.new_session()
+    assert name in main.list_sessions()
+    session = ServerProxy(f'http://localhost:{server.port}/session/{name}')
+    main.larch('a = 1')
+    session.larch('a = 2')
+    assert main.get_rawdata('a') == 1
+    assert session.get_rawdata('a') == 2
+    assert get_array('a*ones(3)', port=server.port, session=name)[0] == 2
+
+    main.close_session(name)
+    with pytest.raises(Fault):
+        session.get_rawdata('a')
+
+def test_concurrent(server):
+    """a slow request in one session does not block another session"""
+    main = ServerProxy(f'http://localhost:{server.port}')
+    name = main.new_session()
+    session = ServerProxy(f'http://localhost:{server.port}/session/{name}')
+    slow = Thread(target=session.larch, args=('sleep(1.5)',))
+    slow.start()
+    time.sleep(0.2)
+    t0 = time.time()
+    assert main.get_rawdata('1+2') == 3
+    assert time.time() - t0 < 1.0
+    slow.join()
+    main.close_session(name)
+
+def test_stats(server):
+    client = ServerProxy(f'http://localhost:{server.port}')
+    for i in range(5):
+        client.get_rawdata('1')
+    stats = client.get_stats()
+    assert stats['nthreads'] == 4
+    methods = stats['methods']
+    assert methods['get_rawdata']['count'] >= 5
+    assert 'get_array' in methods
+    for stat in methods.values():
+        assert stat['min'] <= stat['median'] <= stat['max']
+        assert stat['min'] <= stat['mean'] <= stat['max']
+
+    stats = client.get_stats(True)
+    assert client.get_stats()['methods'].keys() == {'get_stats'}
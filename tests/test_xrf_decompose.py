@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+""" Tests of batched NNLS and XRFFitResult.decompose_map() """
+import numpy as np
+from numpy.linalg import lstsq
+from scipy.optimize import nnls
+
+from larch.math import nnls_batch
+from larch.xrf.xrf_model import XRFFitResult
+
+def make_map(ny=12, nx=9, nchan=512, ncomps=5, seed=3):
+    rng = np.random.default_rng(seed)
+    chan = np.arange(nchan)
+    xfer = np.array([np.exp(-(chan-c)**2/(2*15.0**2))
+                     for c in np.linspace(100, 400, ncomps)]).T
+    weights = 50*rng.random((ny, nx, ncomps))*(rng.random((ny, nx, ncomps)) > 0.3)
+    xmap = rng.poisson(weights @ xfer.T).astype('float32') - 1.0
+    win = np.zeros(nchan)
+    win[50:450] = 1
+    result = XRFFitResult(transfer_matrix=xfer, fit_window=win, count_time=1.0,
+                          eigenvalues={'c%d' % i: 1.0 for i in range(ncomps)})
+    return result, xmap
+
+def test_nnls_batch():
+    rng = np.random.default_rng(1)
+    amat = np.abs(rng.normal(size=(100, 8)))
+    bmat = amat @ rng.normal(size=(8, 200)) + rng.normal(size=(100, 200))
+    out = nnls_batch(amat, bmat)
+    for i in range(bmat.shape[1]):
+        assert np.allclose(out[:, i], nnls(amat, bmat[:, i])[0], atol=1.e-10)
+
+def test_decompose_map():
+    result, xmap = make_map()
+    xfer, win = result.transfer_matrix, result.fit_window
+    ny, nx, nchan = xmap.shape
+    for method, solve in (('lstsq', lstsq), ('nnls', nnls)):
+        maps1 = result.decompose_map(xmap, method=method, nworkers=1)
+        maps2 = result.decompose_map(xmap, method=method, nworkers=2,
+                                     chunk_bytes=nx*nchan*8)
+        for iy, ix in ((0, 0), (5, 3), (ny-1, nx-1)):
+            expect = solve(xfer, win*xmap[iy, ix])[0]
+            for i, name in enumerate(result.eigenvalues):
+                assert np.allclose(maps1[name][iy, ix], expect[i], rtol=1.e-4, atol=1.e-3)
+        for name in maps1:
+            assert np.allclose(maps1[name], maps2[name])
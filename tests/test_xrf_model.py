@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+""" Tests of XRF_Model spectrum calculation """
+from pathlib import Path
+import numpy as np
+
+from larch.io import GSEMCA_File
+from larch.math import interp
+from larch.xrf import xrf_model
+
+base_dir = Path(__file__).parent.parent.resolve()
+mca_file = base_dir / 'examples' / 'xrf' / 'srm1832.mca'
+
+def make_model():
+    model = xrf_model(xray_energy=16.0, count_time=1, energy_min=2.0, energy_max=15.5)
+    model.set_detector(thickness=0.4, material='Si', cal_offset=-0.0107,
+                       cal_slope=0.014655, noise=0.06)
+    model.add_scatter_peak(name='elastic', center=16.0, amplitude=1e5,
+                           step=0.01, tail=0.1, sigmax=1.0)
+    for elem in ('Ca', 'Ti', 'Mn', 'Fe', 'Zn'):
+        model.add_element(elem)
+    model.add_escape(scale=0.2)
+    model.add_pileup(scale=0.1)
+    return model
+
+def test_calc_spectrum_cache():
+    energy = GSEMCA_File(str(mca_file)).energy
+    model = make_model()
+    total1 = model.calc_spectrum(energy)
+    nprofiles = len(model._profile_cache)
+
+    # changing amplitudes reuses the cached profiles
+    model.params['amp_fe'].value *= 2.0
+    total2 = model.calc_spectrum(energy)
+    assert len(model._profile_cache) == nprofiles
+    assert not np.allclose(total1, total2)
+
+    # a new peak shape or energy calibration gives the same spectrum
+    # as a model with no cached profiles
+    for name, scale in (('peak_tail', 1.5), ('det_noise', 0.9)):
+        model.params[name].value *= scale
+        fresh = make_model()
+        for par in model.params.values():
+            fresh.params[par.name].value = par.value
+        assert np.allclose(model.calc_spectrum(energy),
+                           fresh.calc_spectrum(energy), rtol=1.e-12)
+    energy = energy * 1.001
+    assert np.allclose(model.calc_spectrum(energy),
+                       fresh.calc_spectrum(energy), rtol=1.e-12)
+
+def test_cache_detector_energy():
+    energy = GSEMCA_File(str(mca_file)).energy
+    model = make_model()
+    model.calc_spectrum(energy)
+
+    # a new detector material gives the same spectrum as a new model
+    model.set_detector(thickness=0.4, material='Ge', cal_offset=-0.0107,
+                       cal_slope=0.014655, noise=0.06)
+    fresh = make_model()
+    fresh.set_detector(thickness=0.4, material='Ge', cal_offset=-0.0107,
+                       cal_slope=0.014655, noise=0.06)
+    assert np.allclose(model.calc_spectrum(energy),
+                       fresh.calc_spectrum(energy), rtol=1.e-12)
+
+    # elements added again at a new incident energy
+    model.xray_energy = fresh.xray_energy = 14.0
+    model.elements, fresh.elements = [], []
+    for elem in ('Ca', 'Ti', 'Mn', 'Fe', 'Zn'):
+        model.add_element(elem)
+        fresh.add_element(elem)
+    fresh._profile_cache.clear()
+    assert np.allclose(model.calc_spectrum(energy),
+                       fresh.calc_spectrum(energy), rtol=1.e-12)
+
+def test_pileup_escape():
+    energy = GSEMCA_File(str(mca_file)).energy
+    model = make_model()
+    model.calc_spectrum(energy)
+    comp = model.comps['Fe']
+    npts = len(comp)
+    assert np.allclose(model.calc_pileup(comp),
+                       np.convolve(comp, comp, 'full')[:npts],
+                       rtol=1.e-8, atol=1.e-10*comp.max()**2)
+    expect = model.escape_amp * interp(energy-model.escape_energy, comp, energy)
+    assert np.allclose(model.calc_escape(energy, comp), expect)
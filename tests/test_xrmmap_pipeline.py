@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+""" Tests of pipelined row processing for GSEXRM_MapFile """
+import time
+import multiprocessing as mp
+import pytest
+
+from larch.xrmmap import xrm_mapfile
+from larch.xrmmap.xrm_mapfile import GSEXRM_MapFile
+
+class FakeMapRow:
+    "stands in for GSEXRM_MapRow, finishing later rows first"
+    def __init__(self, irow, nrows):
+        time.sleep(0.002*(nrows-irow))
+        self.irow = irow
+        self.read_ok = True
+
+@pytest.mark.skipif(mp.get_start_method() != 'fork',
+                    reason='needs fork to pass patched row reader to workers')
+def test_process_pipelined(monkeypatch):
+    nrows = 20
+    monkeypatch.setattr(xrm_mapfile, 'GSEXRM_MapRow', FakeMapRow)
+    mapfile = object.__new__(GSEXRM_MapFile)
+    mapfile._rowdata_args = lambda irow, offset=None: ((irow, nrows), {})
+    stored = []
+    def store_row(irow, row, flush=False, complete=False, **kws):
+        stored.append((irow, row.irow, complete))
+    mapfile.store_row = store_row
+
+    mapfile.process_pipelined(3, nrows, nworkers=3, max_pending=4)
+    assert stored == [(i, i, i == nrows-1) for i in range(3, nrows)]
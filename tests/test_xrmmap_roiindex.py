@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+""" Tests of the ROI cumulative-sum index for GSEXRM_MapFile """
+import numpy as np
+import h5py
+
+from larch.xrmmap.xrm_mapfile import (GSEXRM_MapFile, ROI_INDEX,
+                                      DEFAULT_ROOTNAME, create_xrmmap)
+
+def make_mapfile(fname, nrow=5, npts=12, nchan=64):
+    "minimal map file with one MCA detector and the summed MCA"
+    rng = np.random.default_rng(7)
+    h5root = h5py.File(fname, 'w')
+    xrmmap = h5root.create_group('xrmmap')
+    for det, dtype, attrs in (('mca1', np.uint32, {'type': 'mca detector'}),
+                              ('mcasum', np.float64, {'type': 'virtual mca',
+                                                      'desc': 'sum of detectors'})):
+        grp = xrmmap.create_group(det)
+        grp.attrs.update(attrs)
+        counts = rng.poisson(20, size=(nrow, npts, nchan)).astype(dtype)
+        grp.create_dataset('counts', data=counts, maxshape=(None, npts, nchan))
+    mapfile = object.__new__(GSEXRM_MapFile)
+    mapfile.h5root = h5root
+    mapfile.xrmmap = xrmmap
+    mapfile.filename = fname
+    mapfile.version = '2.0.0'
+    mapfile.has_xrf = True
+    mapfile.write_access = True
+    mapfile.check_hostid = lambda: True
+    mapfile.compress_args = {'compression': 'gzip'}
+    return mapfile
+
+def test_roi_index(tmp_path):
+    mapfile = make_mapfile(str(tmp_path / 'map.h5'))
+    for det in ('mca1', 'mcasum'):
+        assert not mapfile.has_roi_index(det)
+        counts = mapfile.xrmmap[det]['counts'][()]
+        expect = counts[:, :, 10:30].sum(axis=2)
+        assert np.allclose(mapfile.get_roi_counts(det, slice(10, 30)), expect)
+
+    mapfile.build_roi_index()
+    for det in ('mca1', 'mcasum'):
+        assert mapfile.has_roi_index(det)
+        counts = mapfile.xrmmap[det]['counts'][()]
+        for emin, emax in ((0, 5), (10, 30), (40, 64), (7, 8)):
+            out = mapfile.get_roi_counts(det, slice(emin, emax))
+            assert np.allclose(out, counts[:, :, emin:emax].sum(axis=2))
+        out = mapfile.get_roi_counts(det, slice(3, 9), rows=slice(1, 3))
+        assert np.allclose(out, counts[1:3, :, 3:9].sum(axis=2))
+    mapfile.h5root.close()
+
+def test_roi_index_append(tmp_path):
+    mapfile = make_mapfile(str(tmp_path / 'map.h5'))
+    mapfile.build_roi_index(det='mca1')
+    grp = mapfile.xrmmap['mca1']
+    nrow, npts, nchan = grp['counts'].shape
+    grp['counts'].resize((nrow+1, npts, nchan))
+    grp[ROI_INDEX].resize((nrow+1, npts, nchan))
+    newrow = np.arange(npts*nchan, dtype=np.uint32).reshape(npts, nchan)
+    grp['counts'][nrow] = newrow
+    mapfile.set_roi_index_row(grp, nrow, newrow)
+    out = mapfile.get_roi_counts('mca1', slice(20, 50))
+    assert np.allclose(out, grp['counts'][:, :, 20:50].sum(axis=2))
+    mapfile.h5root.close()
+
+class FakeRow:
+    "stands in for GSEXRM_MapRow, as read by read_rowdata()"
+    def __init__(self, irow, nmca=2, npts=12, nchan=64):
+        rng = np.random.default_rng(irow)
+        self.npts = npts
+        self.yvalue = 0.01*irow
+        self.xrffile = 'xrf.%03d' % (irow+1)
+        self.counts = rng.poisson(20, size=(nmca, npts, nchan)).astype(np.uint32)
+        self.dtfactor = 1.0 + 0.1*rng.random((nmca, npts))
+        self.total = (self.counts*self.dtfactor[:, :, np.newaxis]).sum(axis=0)
+        self.total_dtfactor = self.dtfactor.mean(axis=0)
+        self.realtime = self.livetime = np.ones((nmca, npts))
+        self.inpcounts = self.outcounts = self.counts.sum(axis=2)
+        self.scaler_names, self.scaler_addrs = ['I0'], ['scaler1']
+        self.sisdata = rng.random((npts, 1))
+        self.posvals = [np.linspace(0, 1, npts), np.ones(npts)*self.yvalue,
+                        np.ones(npts), np.ones(npts)]
+        self.xrd2d = self.xrdq = None
+        self.read_ok = True
+
+def test_process_roi_index(tmp_path):
+    "a new map processed with roi_index=True has the index from the first row"
+    nrows, nmca = 4, 2
+    fname = str(tmp_path / 'map.h5')
+    h5root = h5py.File(fname, 'w')
+    create_xrmmap(h5root)
+    mapfile = object.__new__(GSEXRM_MapFile)
+    mapfile.h5root = h5root
+    mapfile.xrmmap = xrmmap = h5root[DEFAULT_ROOTNAME]
+    conf = xrmmap['config']
+    conf['mca_calib'].create_dataset('offset', data=np.zeros(nmca))
+    conf['mca_calib'].create_dataset('slope', data=0.1*np.ones(nmca))
+    conf['rois'].create_dataset('name', data=[b'Fe Ka'])
+    conf['rois'].create_dataset('address', data=[b'xrf_det:mca%i.R0'])
+    conf['rois'].create_dataset('limits', data=np.array([[[10, 30]]*nmca]))
+
+    mapfile.filename = fname
+    mapfile.folder = mapfile.status = None
+    mapfile.version = xrmmap.attrs['Version']
+    mapfile.has_xrf, mapfile.has_xrd1d, mapfile.has_xrd2d = True, False, False
+    mapfile.write_access = True
+    mapfile.compress_args = {'compression': 'gzip'}
+    mapfile.notes = {}
+    mapfile.npts = mapfile.chunksize = mapfile.roi_slices = None
+    mapfile.pos_desc, mapfile.pos_addr = ['x', 'y'], ['x', 'y']
+    mapfile.all_mcas, mapfile.nmca = True, nmca
+    mapfile.azwdgs = 0
+    mapfile.rowdata = [None]*nrows
+    mapfile.last_row = -1
+    mapfile._pixeltime = 1.0
+    mapfile.check_hostid = lambda: True
+    mapfile.read_rowdata = lambda irow, offset=None: FakeRow(irow, nmca=nmca)
+
+    mapfile.process(force=True, roi_index=True)
+    assert mapfile.last_row == nrows-1
+    for det in ('mca1', 'mca2', 'mcasum'):
+        assert mapfile.has_roi_index(det)
+        counts = mapfile.xrmmap[det]['counts'][()]
+        assert counts.shape[0] == nrows
+        for emin, emax in ((0, 5), (10, 30), (40, 64)):
+            out = mapfile.get_roi_counts(det, slice(emin, emax))
+            assert np.allclose(out, counts[:, :, emin:emax].sum(axis=2))
+    h5root.close()
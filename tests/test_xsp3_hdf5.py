@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+""" test reading Xspress3 HDF5 files in blocks of pixels"""
+import pytest
+import numpy as np
+import h5py
+
+from larch.io import read_xsp3_hdf5, iter_xsp3_hdf5
+from larch.io.xsp3_hdf5 import get_counts_carefully
+
+def make_xsp3_file(fname, npix=500, ndpix=500, ndet=4, nchan=128):
+    rng = np.random.default_rng(0)
+    counts = rng.poisson(20, size=(ndpix, ndet, nchan)).astype('u4')
+    with h5py.File(fname, 'w') as h5file:
+        h5file.create_dataset('entry/instrument/detector/data', data=counts,
+                              chunks=(1, ndet, nchan))
+        for i in range(ndet):
+            prefix = 'entry/instrument/NDAttributes/CHAN%i' % (i+1)
+            h5file[prefix + 'SCA0'] = rng.integers(50000, 80000, npix).astype('f8')
+            h5file[prefix + 'SCA1'] = rng.integers(0, 2000, npix).astype('f8')
+            h5file[prefix + 'SCA3'] = rng.integers(0, 5000, npix).astype('f8')
+    return counts
+
+@pytest.mark.parametrize('ndpix', [500, 499])
+def test_iter_xsp3(tmp_path, ndpix):
+    fname = str(tmp_path / 'xsp3.h5')
+    counts = make_xsp3_file(fname, ndpix=ndpix)
+    out = read_xsp3_hdf5(fname)
+    assert out.counts.shape == (500, 4, 128)
+    assert out.counts.dtype == np.uint32
+    assert np.array_equal(out.counts[:ndpix], counts)
+    assert np.all(out.dtfactor >= 1)
+
+    first = 0
+    for block in iter_xsp3_hdf5(fname, chunksize=120):
+        assert block.firstPixel == first
+        pixels = slice(first, first+block.numPixels)
+        first += block.numPixels
+        assert block.counts.dtype == np.uint32
+        assert np.array_equal(block.counts, out.counts[pixels])
+        assert np.array_equal(block.outputCounts, out.outputCounts[pixels])
+        valid = block.outputCounts > 0
+        assert np.allclose(block.dtfactor[valid],
+                           block.inputCounts[valid]/block.outputCounts[valid])
+        assert block.dtfactor.shape == (block.numPixels, 4)
+    assert first == 500
+
+class BadData:
+    "detector data where some pixels cannot be read"
+    def __init__(self, data, bad):
+        self.data, self.bad = data, bad
+        self.shape, self.dtype = data.shape, data.dtype
+        self.reads = []
+
+    def __getitem__(self, index):
+        self.reads.append(index)
+        pixels = np.arange(len(self.data))[index]
+        if np.any(np.isin(pixels, self.bad)):
+            raise OSError("Can't read data (inflate() failed)")
+        return self.data[index]
+
+@pytest.mark.parametrize('bad', [[37], [37, 38], [0], [99], [49, 50]])
+def test_bad_points(bad):
+    data = np.random.default_rng(1).integers(0, 1000, size=(100, 3, 2))
+    whole = get_counts_carefully(BadData(data, bad))
+    for ibad in bad:
+        assert not np.array_equal(whole[ibad], data[ibad])
+    good = np.setdiff1d(np.arange(100), bad)
+    assert np.array_equal(whole[good], data[good])
+
+    chunked = BadData(data, bad)
+    blocks = [get_counts_carefully(chunked, start, start+25)
+              for start in range(0, 100, 25)]
+    assert np.array_equal(np.concatenate(blocks), whole)
+    # only blocks with bad points are read a pixel at a time
+    assert all(25*(min(bad)//25) <= i <= 25*(max(bad)//25 + 1)
+               for i in chunked.reads if isinstance(i, (int, np.integer)))